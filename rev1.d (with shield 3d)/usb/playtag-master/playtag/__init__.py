@@ -1 +1,2 @@
-
+from .lib import startup
+startup.configure()
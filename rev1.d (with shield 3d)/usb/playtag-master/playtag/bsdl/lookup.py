@@ -7,6 +7,7 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 
 import os
+import itertools
 
 root = os.path.dirname(__file__)
 
@@ -67,18 +68,53 @@ class PartInfo(object):
     '''
     partfile = os.path.join(root, 'data', 'partindex.txt')
     mfgfile = os.path.join(root, 'data', 'manufacturers.txt')
-    partcache = {}
+    partcache = {}      # idcode: (order added, part) for parts with no x bits
+    maskcache = {}      # mask: {idcode & mask: (order added, part)} for the rest
+    foundcache = {}     # idcode: part (or None), for idcodes already looked up
     mfgcache = {}
+    cachesloaded = False
+    partorder = itertools.count()
 
     _possible_ir = None
 
     @classmethod
-    def addparts(cls, partlist, int=int, expand_x=expand_x):
+    def addparts(cls, partlist, int=int):
+        ''' Parts with x's in their idcodes are kept by the mask
+            of their fixed bits, rather than expanded.  A lookup
+            finds the part added last, as if each had been.
+        '''
+        if not cls.cachesloaded:
+            cls.loadcaches()
         partcache = cls.partcache
+        maskcache = cls.maskcache
+        partorder = cls.partorder
+        cls.foundcache.clear()
 
         for part in partlist:
-            for idcode in expand_x(part.idcode):
-                partcache[int(idcode, 2)] = part
+            idcode = part.idcode
+            value = int(idcode.replace('x', '0'), 2)
+            entry = next(partorder), part
+            if 'x' not in idcode:
+                partcache[value] = entry
+            else:
+                mask = int(idcode.replace('0', '1').replace('x', '0'), 2)
+                maskcache.setdefault(mask, {})[value] = entry
+
+    @classmethod
+    def findpart(cls, idcode):
+        ''' Return the part for an idcode, or None.
+        '''
+        try:
+            return cls.foundcache[idcode]
+        except KeyError:
+            pass
+        found = cls.partcache.get(idcode)
+        for mask, entries in cls.maskcache.iteritems():
+            entry = entries.get(idcode & mask)
+            if entry is not None and (found is None or entry > found):
+                found = entry
+        found = cls.foundcache[idcode] = found and found[1]
+        return found
 
     @classmethod
     def addmfgs(cls, mfginfo, int=int):
@@ -92,12 +128,24 @@ class PartInfo(object):
         cls.addparts(PartParameters(*x) for x in readfile(cls.partfile))
         cls.addmfgs(readfile(cls.mfgfile))
 
+    @classmethod
+    def loadcaches(cls):
+        ''' The part and manufacturer files are not read until
+            the first part is looked up (or added, so that
+            added parts take precedence over the files).
+        '''
+        if not cls.cachesloaded:
+            PartInfo.cachesloaded = True
+            cls.initcaches()
+
     def __init__(self, index, unknown=PartParameters()):
+        if not self.cachesloaded:
+            self.loadcaches()
         try:
             index = int(index, 2)
         except TypeError:
             pass
-        parameters = self.partcache.get(index, unknown)
+        parameters = self.findpart(index) or unknown
         self.idcode = index
         self.parameters = parameters
         self.name = parameters.name
@@ -129,8 +177,6 @@ class PartInfo(object):
         return '%s %s (ir_capture = %s, idcode=%s)' % (self.manufacturer,
                     self.name, repr(self.ir_capture), repr(idcode))
 
-PartInfo.initcaches()
-
 if __name__ == '__main__':
     import sys
     for item in sys.argv[1:]:
@@ -6,13 +6,16 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 import sys
 from itertools import izip
+from binascii import hexlify, unhexlify
 from ctypes import c_ubyte, c_char, c_uint32, c_int, c_ulonglong, POINTER, c_char_p, CDLL, byref, cast, Structure
+from ctypes import memmove, string_at, addressof
 import atexit
 
-from ...iotemplate.stringconvert import TemplateStrings
+from ...iotemplate.stringconvert import TemplateStrings, TdoChunks
+from ...iotemplate.intconvert import TemplateInts
+from ...iotemplate.binconvert import BinTemplate
 
 test = __name__ == '__main__'
-profile = False
 
 HIF = DWORD = c_uint32
 BOOL = c_int
@@ -27,12 +30,33 @@ class DVC(Structure):
         ('dtp', DTP),
     ]
 
+class Unloaded(object):
+    ''' Stand-in for a library that could not be loaded.  Lets
+        the module (and its template conversion code) be imported
+        without the Digilent Adept runtime; the error is raised
+        when a library function is actually called.
+    '''
+    def __init__(self, libfile):
+        self.libfile = libfile
+    def __getattr__(self, name):
+        libfile = self.libfile
+        class Unloaded(object):
+            def __init__(*whatever):
+                raise OSError("%s called, but library %s could not be loaded" % (name, libfile))
+        return Unloaded
+
+def loadlib(libfile):
+    try:
+        return CDLL(libfile)
+    except OSError:
+        return Unloaded(libfile)
+
 if 'win' in sys.platform:
-    Dmgr = CDLL('dmgr.dll')
-    Djtg = CDLL('djtg.dll')
+    Dmgr = loadlib('dmgr.dll')
+    Djtg = loadlib('djtg.dll')
 else:
-    Djtg = CDLL('/usr/local/lib64/digilent/adept/libdjtg.so')
-    Dmgr = CDLL('/usr/local/lib64/digilent/adept/libdmgr.so')
+    Djtg = loadlib('/usr/local/lib64/digilent/adept/libdjtg.so')
+    Dmgr = loadlib('/usr/local/lib64/digilent/adept/libdmgr.so')
 
 DmgrEnumDevices = Dmgr.DmgrEnumDevices
 DmgrEnumDevices.restype = BOOL
@@ -88,10 +112,49 @@ def showdevs():
         print '    ', DevName(index)
     print
 
-class Jtagger(HIF, TemplateStrings.mix_me_in()):
+def spreader():
+    ''' Return a function that spreads the bits of an integer
+        apart, e.g. 0b1011 becomes 0b01000101.  This is used to
+        interleave TMS and TDI bits for DjtgPutTmsTdiBits.
+
+        The masks for each power-of-2 size are computed once.
+    '''
+    cache = {}
+    def getmasks(numbits):
+        size = 1
+        while size < numbits:
+            size *= 2
+        masks = cache.get(size)
+        if masks is None:
+            masks = []
+            shift = size / 2
+            while shift:
+                mask = (1 << shift) - 1
+                width = 2 * shift
+                while width < 2 * size:
+                    mask |= mask << width
+                    width *= 2
+                masks.append((shift, mask))
+                shift /= 2
+            cache[size] = masks
+        return masks
+
+    def spread(value, numbits):
+        for shift, mask in getmasks(numbits):
+            value = (value | (value << shift)) & mask
+        return value
+    return spread
+spread = spreader()
+
+class Jtagger(HIF, TemplateInts.mix_me_in()):
     isopen = False
     isenabled = False
+    converters = dict(strings=TemplateStrings, ints=TemplateInts, bin=BinTemplate)
+    tdo_chunk_bits = 65536   # Size of each TDO string handed to the string converter
+    tdo_chunks = None
+
     def __init__(self, UserConfig, maxbits=2**22):
+        self.template_config(UserConfig)
         devname = UserConfig.CABLE_NAME = UserConfig.CABLE_NAME or 'DCabUsb'
         try:
             devname + ''
@@ -103,7 +166,7 @@ class Jtagger(HIF, TemplateStrings.mix_me_in()):
         count = DWORD()
         overlap = BOOL()
         overlap.value = False
-        self.maxbits = maxbits
+        self.maxbits = self.max_tcks = maxbits
         self.rparams = cast(source, POINTER(BYTE)), cast(dest, POINTER(BYTE)), count, overlap
         self.wparams = cast(source, POINTER(BYTE)), None, count, overlap
         self.source = source
@@ -113,6 +176,7 @@ class Jtagger(HIF, TemplateStrings.mix_me_in()):
         self.disabler = DjtgDisable
         check(DmgrOpen, byref(self), devname)
         self.isopen = True
+        self.cable_serial = 'digilent %s' % devname
         atexit.register(self.__del__)
         check(DjtgEnable, self)
         self.isenabled = True
@@ -135,14 +199,18 @@ class Jtagger(HIF, TemplateStrings.mix_me_in()):
         check(DjtgSetSpeed, self, newspeed, byref(myint))
         return myint.value
 
-    def __call__(self, tms, tdi, usetdo, formatter = '{0:064b}'.format, int=int, len=len):
-        '''  Passed tms, tdi.  Returns tdo.
+    def __call__(self, tms, tdi, usetdo, int=int, len=len, hexlify=hexlify,
+                       string_at=string_at, addressof=addressof):
+        '''  Passed tms, tdi.  Returns tdo as a TdoChunks iterator,
+             which converts it from the receive buffer as the
+             template asks for it.
              All these are strings of '0' and '1'.
              First bit sent is the last bit in the string...
         '''
         numbits = len(tms)
         if not numbits:
             return
+        self.finish_tdo()
         assert 0 < numbits == len(tdi) <= self.maxbits
         numints = (numbits + 63) / 64
         leftpad = numints * 64 - numbits
@@ -156,13 +224,57 @@ class Jtagger(HIF, TemplateStrings.mix_me_in()):
         self.source[:len(allbits)] = allbits
         self.count.value = numbits
         if usetdo:
-            if not profile or numbits < 1000:
-                check(DjtgPutTmsTdiBits, self, *self.rparams)
-            allbits = [formatter(x) for x in reversed(self.dest[:numints])]
-            allbits[0] = allbits[0][leftpad:]
-            return allbits
+            check(DjtgPutTmsTdiBits, self, *self.rparams)
+            dest = addressof(self.dest)
+            def readchunk(start, numbits):
+                data = string_at(dest + start / 8, (numbits + 7) / 8)
+                return '{0:0{1}b}'.format(int(hexlify(data[::-1]), 16), 8 * len(data))[-numbits:]
+            if numbits <= self.tdo_chunk_bits:
+                return [readchunk(0, numbits)]
+            self.tdo_chunks = tdo = TdoChunks(readchunk, numbits, self.tdo_chunk_bits)
+            return tdo
         else:
-            if not profile or numbits < 1000:
-                check(DjtgPutTmsTdiBits, self, *self.wparams)
+            check(DjtgPutTmsTdiBits, self, *self.wparams)
+
+    def finish_tdo(self):
+        ''' Convert any TDO from the last string transfer that the
+            application has not asked for yet, before the receive
+            buffer is reused.
+        '''
+        tdo = self.tdo_chunks
+        if tdo is not None:
+            self.tdo_chunks = None
+            tdo.finish()
+
+    def xfer_ints(self, tms, tdi, numbits, usetdo, spread=spread, unhexlify=unhexlify,
+                        memmove=memmove, string_at=string_at):
+        '''  Passed tms, tdi as integers (bit 0 is sent first).
+             Returns tdo as a little-endian byte string (bit 0
+             of byte 0 was received first).
+        '''
+        if not numbits:
+            return
+        self.finish_tdo()
+        assert 0 < numbits <= self.maxbits
+        numbytes = (numbits + 3) / 4
+        allbits = spread(tdi, numbits) | (spread(tms, numbits) << 1)
+        memmove(self.source, unhexlify('%0*x' % (2 * numbytes, allbits))[::-1], numbytes)
+        self.count.value = numbits
+        if usetdo:
+            check(DjtgPutTmsTdiBits, self, *self.rparams)
+            return string_at(self.dest, (numbits + 7) / 8)
+        else:
+            check(DjtgPutTmsTdiBits, self, *self.wparams)
+
+    def xfer_bin(self, tms, tdi, numbits, usetdo, int=int, hexlify=hexlify,
+                        string_at=string_at, addressof=addressof):
+        '''  Passed tms as an integer and tdi as a ctypes structure.
+             The cable wants TMS and TDI interleaved, so this
+             just turns the structure into an integer for xfer_ints.
+        '''
+        if not numbits:
+            return
+        tdi = int(hexlify(string_at(addressof(tdi), (numbits + 7) / 8)[::-1]), 16)
+        return self.xfer_ints(tms, tdi, numbits, usetdo)
 
 __all__ = 'Jtagger showdevs DevName NumDevices'.split()
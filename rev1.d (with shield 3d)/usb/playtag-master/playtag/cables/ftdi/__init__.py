@@ -1,10 +1,11 @@
-from d2xx import info
+from d2xx import sysinfo
 try:
     from d2xx_data import Jtagger
 except ValueError:
     pass
 
 def showdevs():
+    info = sysinfo()
     print
     print "\n%d devices found:\n" % len(info)
     print str(info)
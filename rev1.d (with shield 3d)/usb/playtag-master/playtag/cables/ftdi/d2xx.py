@@ -60,7 +60,16 @@ class SysInfo(list):
             raise SystemExit(message)
         return devnum[0]
 
-info = SysInfo()
+info = None
+
+def sysinfo():
+    ''' Return the list of devices, which is read from
+        the driver the first time it is needed.
+    '''
+    global info
+    if info is None:
+        info = SysInfo()
+    return info
 
 class FtdiDefaults(object):
     FTDI_USB_IN_SIZE = 65535
@@ -82,7 +91,7 @@ class FtdiDevice(FT):
     def __init__(self, UserConfig):
         UserConfig.add_defaults(FtdiDefaults)
         self.debug = UserConfig.FTDI_DEBUG and open(UserConfig.FTDI_DEBUG, 'wb')
-        index = self.index = info.find(UserConfig.CABLE_NAME)
+        index = self.index = sysinfo().find(UserConfig.CABLE_NAME)
         self.Open(index, self.byref(self))
         self.init_buffers(UserConfig.FTDI_USB_IN_SIZE, UserConfig.FTDI_USB_OUT_SIZE)
         self.isopen = True
@@ -140,7 +149,7 @@ class FtdiDevice(FT):
         return x[0] | (x[1] << 8)
 
     def setspeed(self, speed=6e6, adaptive=False, loopback=False):
-        hispeed = bool(info[self.index].Flags & 2)
+        hispeed = bool(sysinfo()[self.index].Flags & 2)
         adaptive = adaptive and Commands.enable_adaptive_clocking or Commands.disable_adaptive_clocking
         loopback = loopback and Commands.loopback_en or Commands.loopback_dis
         if hispeed:
@@ -206,6 +215,7 @@ class FtdiDevice(FT):
                 self.Close()
 
 if __name__ == '__main__':
+    info = sysinfo()
     print str(info)
     if info:
         x = FtdiDevice(-1)
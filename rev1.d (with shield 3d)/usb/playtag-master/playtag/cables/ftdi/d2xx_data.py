@@ -1,7 +1,10 @@
 import itertools
-from ctypes import c_ulonglong, byref
-from .d2xx import FtdiDevice
-from .mpsse_template import MpsseTemplate
+from binascii import hexlify, unhexlify
+from ctypes import c_ulonglong, byref, memmove, string_at, cast, POINTER
+from .d2xx import FtdiDevice, sysinfo
+from .mpsse_template import MpsseTemplate, MpsseInts, MpsseBin
+from ...iotemplate.stringconvert import TdoChunks
+from ...lib.tracer import tracer
 
 def debug_dump(f, title, data, numbytes):
     print >> f, title,
@@ -9,27 +12,40 @@ def debug_dump(f, title, data, numbytes):
         print >> f, '%02x' % ((data[i/8] >> ((i % 8) * 8)) & 0xFF),
     print >> f
 
-class Jtagger(MpsseTemplate.mix_me_in()):
+class Jtagger(MpsseInts.mix_me_in()):
+    converters = dict(strings=MpsseTemplate, ints=MpsseInts, bin=MpsseBin)
+    tdo_chunk_bytes = 8192   # Size of each read for the string converter
+    tdo_chunks = None
 
-    def __init__(self, devname, maxbits=2**22):
-        driver = FtdiDevice(devname)
+    def __init__(self, UserConfig, maxbits=2**22):
+        self.template_config(UserConfig)
+        driver = FtdiDevice(UserConfig)
         driver.setspeed(15e6)
+        serial = sysinfo()[driver.index].SerialNumber
+        if serial:
+            self.cable_serial = 'ftdi %s' % serial
         size = (maxbits + 63) / 64
+        self.max_tcks = maxbits / 16    # MPSSE commands take up to 3 bytes per TCK
         source = (size * 2 * c_ulonglong)()  # Both TMS and TDI go here
         dest = (size * c_ulonglong)()
         count = driver.DWORD()
-        self.wparams = driver.Write, len(source) * 64, source, byref(source), count, byref(count), driver.debug
-        self.rparams = driver.Read, len(dest) * 64, dest, byref(dest)
+        write, read = driver.Write, driver.Read
+        if tracer.enabled:
+            write = tracer.traced(write, 'Write', 'usb', (None, 'bytes'))
+            read = tracer.traced(read, 'Read', 'usb', (None, 'bytes'))
+        self.wparams = write, len(source) * 64, source, byref(source), count, byref(count), driver.debug
+        self.rparams = read, len(dest) * 64, dest, byref(dest)
 
-    def __call__(self, sendstr, numbits, rcvlen, formatter = '{0:064b}'.format,
-                          int=int, len=len, join=''.join, tee=itertools.tee,
+    def __call__(self, sendstr, numbits, rcvlen, int=int, len=len, join=''.join, tee=itertools.tee,
                           chain=itertools.chain, izip=itertools.izip, xrange=xrange):
-        '''  Passed tms/tdi info.  Returns tdo.
+        '''  Passed tms/tdi info.  Returns tdo as a TdoChunks
+             iterator, which reads it as the template asks for it.
              All these are strings of '0' and '1'.
              First bit sent is the last bit in the string...
         '''
         if not numbits:
             return
+        self.finish_tdo()
         sendstr = join(sendstr)
         assert len(sendstr) == numbits
         write, sourcelen, source, sourceref, count, countref, debug = self.wparams
@@ -45,16 +61,84 @@ class Jtagger(MpsseTemplate.mix_me_in()):
         assert count.value == numbytes
         if not rcvlen:
             return
-        numbits = rcvlen
+        assert not rcvlen & 7
+        read, destlen, dest, destref = self.rparams
+        assert rcvlen <= destlen, (rcvlen, destlen)
+
+        def readchunk(start, numbytes):
+            read(destref, numbytes, countref)
+            if debug:
+                debug_dump(debug, 'rcv', dest, numbytes)
+            assert count.value == numbytes
+            return '{0:0{1}b}'.format(int(hexlify(string_at(dest, numbytes)[::-1]), 16), 8 * numbytes)
+        numbytes = rcvlen / 8
+        if numbytes <= self.tdo_chunk_bytes:
+            return [readchunk(0, numbytes)]
+        self.tdo_chunks = tdo = TdoChunks(readchunk, numbytes, self.tdo_chunk_bytes)
+        return tdo
+
+    def finish_tdo(self):
+        ''' Read any TDO from the last string transfer
+            that the application has not asked for yet.
+        '''
+        tdo = self.tdo_chunks
+        if tdo is not None:
+            self.tdo_chunks = None
+            tdo.finish()
+
+    def xfer_ints(self, tdi, numbits, rcvlen, unhexlify=unhexlify,
+                          memmove=memmove, string_at=string_at):
+        '''  Passed the MPSSE command stream as an integer (bit 0
+             is sent first).  Returns tdo as a little-endian byte
+             string (bit 0 of byte 0 was received first).
+        '''
+        if not numbits:
+            return
+        self.finish_tdo()
+        write, sourcelen, source, sourceref, count, countref, debug = self.wparams
         assert not numbits & 7
+        assert numbits <= sourcelen, (numbits, sourcelen)
+        numbytes = numbits / 8
+        memmove(source, unhexlify('%0*x' % (2 * numbytes, tdi))[::-1], numbytes)
+        if debug:
+            debug_dump(debug, 'xmt', source, numbytes)
+        write(sourceref, numbytes, countref)
+        assert count.value == numbytes
+        if not rcvlen:
+            return
+        assert not rcvlen & 7
         read, destlen, dest, destref = self.rparams
-        assert numbits <= destlen, (numbits, destlen)
-        numbytes = (numbits + 7) / 8
-        numints = (numbytes + 7) / 8
+        assert rcvlen <= destlen, (rcvlen, destlen)
+        numbytes = rcvlen / 8
+        read(destref, numbytes, countref)
+        if debug:
+            debug_dump(debug, 'rcv', dest, numbytes)
+        assert count.value == numbytes
+        return string_at(dest, numbytes)
+
+    def xfer_bin(self, tdi, numbits, rcvlen, byref=byref, string_at=string_at):
+        '''  Passed the MPSSE command stream as a ctypes structure,
+             which is written directly to the device.  Returns tdo
+             as a little-endian byte string.
+        '''
+        if not numbits:
+            return
+        self.finish_tdo()
+        write, sourcelen, source, sourceref, count, countref, debug = self.wparams
+        assert not numbits & 7
+        numbytes = numbits / 8
+        if debug:
+            debug_dump(debug, 'xmt', cast(byref(tdi), POINTER(c_ulonglong)), numbytes)
+        write(byref(tdi), numbytes, countref)
+        assert count.value == numbytes
+        if not rcvlen:
+            return
+        assert not rcvlen & 7
+        read, destlen, dest, destref = self.rparams
+        assert rcvlen <= destlen, (rcvlen, destlen)
+        numbytes = rcvlen / 8
         read(destref, numbytes, countref)
         if debug:
             debug_dump(debug, 'rcv', dest, numbytes)
         assert count.value == numbytes
-        allbits = [formatter(x) for x in reversed(dest[:numints])]
-        allbits[0] = allbits[0][numints * 64 - numbits:]
-        return allbits
+        return string_at(dest, numbytes)
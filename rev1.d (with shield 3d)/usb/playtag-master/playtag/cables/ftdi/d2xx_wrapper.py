@@ -15,18 +15,12 @@ else:
     if not os.path.exists(libfile):
         libfile = os.path.join(os.path.dirname(__file__), 'libftd2xx.so')
 
-loaded = True
-try:
-    FtdiLibrary = loader(libfile)
-except OSError:
-    loaded = False
-    class FtdiLibrary(object):
-        def __getattr__(self, name):
-            class Unloaded(object):
-                def __init__(*whatever):
-                    raise OSError("%s called, but library %s could not be loaded" % (name, libfile))
-            return Unloaded
-    FtdiLibrary = FtdiLibrary()
+class UnloadedLibrary(object):
+    def __getattr__(self, name):
+        class Unloaded(object):
+            def __init__(*whatever):
+                raise OSError("%s called, but library %s could not be loaded" % (name, libfile))
+        return Unloaded
 
 StatusTypes = '''
     FT_OK,
@@ -84,7 +78,6 @@ class FT(BASE_HANDLE):
 
     StatusTypes = StatusTypes
     DeviceTypes = DeviceTypes
-    loaded = loaded
 
     OPEN_BY_SERIAL_NUMBER    = 1
     OPEN_BY_DESCRIPTION      = 2
@@ -211,21 +204,48 @@ class FT(BASE_HANDLE):
     SetResetPipeRetryCount = func(HANDLE, DWORD)
     ResetPort = func(HANDLE)
 
-def FixClass(FT, isinstance=isinstance, list=list, getattr=getattr, setattr=setattr, HANDLE=HANDLE, BASE_HANDLE=BASE_HANDLE):
+class Unbound(object):
+    ''' Stands in for each library function (and the loaded
+        flag) in the class until the first of them is used.
+    '''
+    def __init__(self, FT, name, funcs):
+        self.FT = FT
+        self.name = name
+        self.funcs = funcs
+
+    def __get__(self, obj, cls):
+        bindlibrary(self.FT, self.funcs)
+        return getattr(cls if obj is None else obj, self.name)
+
+def FixClass(FT, isinstance=isinstance, setattr=setattr):
     ''' Could use a metaclass, but this is almost too simple, and only
-        one class needs the treatment.
+        one class needs the treatment.  The library is not loaded
+        until a function is used (see bindlibrary).
     '''
     funcs = [x for x in vars(FT).iteritems() if isinstance(x[1], func)]
     for mydict in (StatusTypes, DeviceTypes):
         for value, name in mydict.iteritems():
             setattr(FT, name[3:], value)
+    for attrname in ['loaded'] + [x[0] for x in funcs]:
+        setattr(FT, attrname, Unbound(FT, attrname, funcs))
+
+def bindlibrary(FT, funcs, list=list, getattr=getattr, setattr=setattr, HANDLE=HANDLE, BASE_HANDLE=BASE_HANDLE):
+    ''' Load the library, and replace the Unbound stand-ins
+        with its functions.
+    '''
+    try:
+        library = loader(libfile)
+        FT.loaded = True
+    except OSError:
+        library = UnloadedLibrary()
+        FT.loaded = False
     STATUS = FT.ULONG
     for attrname, value in funcs:
         value = list(value)
         ismethod = value[0] is HANDLE
         if ismethod:
             value[0] = BASE_HANDLE
-        libfunc = getattr(FtdiLibrary, 'FT_' + attrname)
+        libfunc = getattr(library, 'FT_' + attrname)
         libfunc.argtypes = value
         libfunc.restype = STATUS
         libfunc.errcheck = errcheck
@@ -2,13 +2,36 @@
 This module contains code to map JTAG TMS/TDI/TDO template strings into
 FTDI MPSSE commands.
 
+The three template strings are first combined into a single string of
+codes, with one hex digit per clock, in time order:
+
+    8 * TMS + 4 * (TDO is 'x') + (0, 1, 2, 3 for TDI of 0, 1, '*', 'x')
+
+Translating the codes gives the kind of each clock, and the clocks are
+grouped by finding runs of a single kind, so the Python-level work
+depends on the number of fields in the template rather than the number
+of clocks.  The commands for each group are added to a bytearray, with
+the variable ('x') and don't care ('*') TDI bits left as zero, and the
+positions of those bits are kept in a list of runs.  The bits that come
+back are described by a similar list of runs (the read layout), which
+says where the TDO bits are, and the rest are padding.  The result is
+then turned back into the xstrings that the template converters use.
+
+Long templates are mostly the same few scans over and over (one for each
+word of a burst, for example), so a template is split into frames at
+places where the commands for the rest of the template only depend on
+the (TMS, TDI) state of the cable.  Each different frame is compiled
+once, and runs of identical frames are found with string compares and
+replicated.
+
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 import re
-import itertools
+import string
+from binascii import hexlify, unhexlify
 
-from .mpsse_commands import Commands, hexconv
+from .mpsse_commands import Commands
 
 
 debug = True
@@ -28,186 +51,344 @@ if debug:
                 column = 0
         print
 
-def group_strings(tms, tdi, tdo, slice=slice, len=len):
-    ''' NOTE: Strings are reversed -- s[0] is later in time than s[30]
+hexdigits = '0123456789abcdef'
+
+tms_codes = string.maketrans('01', '08')
+tdi_codes = string.maketrans('01*x', '0123')
+tdo_codes = string.maketrans('*x', '04')
+
+code_tms = string.maketrans(hexdigits, 8 * '0' + 8 * '1')
+code_tdi = string.maketrans(hexdigits, 4 * '01*x')
+code_tdo = string.maketrans(hexdigits, 2 * (4 * '*' + 4 * 'x'))
+
+# The kind of each clock.  'A' to 'D' are clocks with TMS high (or
+# with nothing to send or receive), for TDI of 0, 1, '*' and 'x'.
+# 'd' clocks have data to send or receive, and 'n' (null) clocks
+# have constant TDI and nothing to receive.
+code_kinds = string.maketrans(hexdigits, 'nnCdddddABCDABCD')
+group_finder = re.compile('A+|B+|C+|D+|d+|n+').finditer
+
+# A frame starts with at least 16 data clocks right after a TMS clock.
+# The data is shifted with a byte or bit command of its own, and the
+# TMS commands before it can never run into it.
+frame_finder = re.compile('[A-D]d{16}').search
+frame_start = 16 * 'd'
+
+const_bits = string.maketrans('x*', '00')
+var_finder = re.compile(r'x+|\*+').finditer
+
+# (byte command, bit command) pairs
+tdi_wr = Commands.tdi_wr, Commands.tdi_wr_bits
+tdo_rd = Commands.tdo_rd, Commands.tdo_rd_bits
+tdi_tdo = Commands.tdi_tdo, Commands.tdi_tdo_bits
+
+def overlay(bits, runs):
+    ''' Put the runs of 'x' and '*' into a string of bits.
+        The string has the earliest bit last, as with the
+        template strings, but the runs are earliest first.
     '''
-    def key(stuff):
-        tms, tdi, tdo = stuff
-        if tms != '0' or tdi == tdo == '*':
-            return 'tms' + tdi
-        elif tdi == 'x' or tdo == 'x':
-            return 'data'
-        else:
-            return 'null'
+    total = len(bits)
+    strings = []
+    prev = 0
+    for offset, numbits, char in reversed(runs):
+        stop = total - offset
+        strings.append(bits[prev:stop - numbits])
+        strings.append(numbits * char)
+        prev = stop
+    strings.append(bits[prev:])
+    return ''.join(strings)
+
+class MpsseFrame(object):
+    ''' The MPSSE commands for a piece of a template, given its
+        codes (as described above) and the (TMS, TDI) state of
+        the cable before it.
+
+        write is a bytearray of the commands and data to send, and
+        tdi_runs is a list of (bit offset, numbits, char) for its
+        'x' and '*' bits.  readbits is the number of bits that come
+        back, and tdo_runs gives the offsets of the TDO bits in
+        them in the same way.  context is the state afterwards.
+    '''
+    def __init__(self, codes, context):
+        self.tms = codes.translate(code_tms)
+        self.tdi = codes.translate(code_tdi)
+        self.tdo = codes.translate(code_tdo)
+        self.write = bytearray()
+        self.tdi_runs = []
+        self.readbits = 0
+        self.tdo_runs = []
+        self.old_tms, self.old_tdi = context
+        self.compile(self.get_groups(codes.translate(code_kinds)))
+        self.context = self.old_tms, self.old_tdi
 
-    def null2data(data):
-        ''' Convert big blocks of null into null followed by data.
-            (strings are reversed, so emit data first.)
+    def get_groups(self, kinds):
+        ''' Return a list of [kind, start, stop] groups of clocks,
+            with the null clocks next to the data clocks moved
+            into the data where that helps.
         '''
-        for item in data:
-            if item[0] == 'null' and len(item[1]) >= 17:
-                yield ['data', item[1][:-8]]
-                item[1] = item[1][-8:]
-            yield item
-
-    def mergenull(data):
-        ''' Coalesce data/null together
+        groups = []
+        for match in group_finder(kinds):
+            start, stop = match.span()
+            kind = kinds[start]
+            if kind == 'n':
+                # Send big blocks of null as data, apart from the first
+                # byte, and send null right after data with the data.
+                if stop - start >= 17:
+                    groups.append(['n', start, start + 8])
+                    groups.append(['d', start + 8, stop])
+                    if len(groups) > 2 and groups[-3][0] == 'd':
+                        groups[-3][2] = start + 8
+                        del groups[-2]
+                    continue
+                if groups and groups[-1][0] == 'd':
+                    groups[-1][2] = stop
+                    continue
+            groups.append([kind, start, stop])
+
+        # Coalesce data together, and move bits from the null before
+        # it into the data to align it to byte boundaries if possible.
+        result = []
+        for group in groups:
+            if group[0] == 'd' and result and result[-1][0] == 'd':
+                result[-1][2] = group[2]
+            else:
+                result.append(group)
+        for prev, group in zip(result, result[1:]):
+            if group[0] == 'd' and prev[0] == 'n':
+                nulls = prev[2] - prev[1]
+                even = -(group[2] - group[1]) % 8 + ((nulls - 1) // 8 * 8)
+                if even < nulls:
+                    prev[2] -= even
+                    group[1] -= even
+        return result
+
+    def compile(self, groups):
+        tms, tdi = self.tms, self.tdi
+        index = 0
+        while index < len(groups):
+            kind, start, stop = groups[index]
+            if tms[start] == self.old_tms == '0' and (stop - start >= 7 or
+                        len(set(tdi[start:stop].replace('*', ''))) > 1 or
+                        tdi.count('x', start, stop) > 1):
+                self.do_tdi_tdo(start, stop)
+                index += 1
+            else:
+                index = self.do_tms(groups, index)
+
+    def addtdi(self, bits):
+        ''' Add TDI bits (earliest first) to the data to send,
+            starting at the LSB of a new byte.
         '''
-        later = data.next()
-        for item in data:
-            if item[0] == 'data' and later[0] == 'null':
-                later[1] += item[1]
-                later[0] = 'data'
-                continue
-            yield later
-            later = item
-        yield later
+        write = self.write
+        offset = len(write) << 3
+        value = int(bits.translate(const_bits)[::-1], 2)
+        if len(bits) <= 8:
+            write.append(value)
+        else:
+            write += unhexlify('%0*x' % ((len(bits) + 7) >> 3 << 1, value))[::-1]
+        if bits.strip('01'):
+            for match in var_finder(bits):
+                start, stop = match.span()
+                self.tdi_runs.append((offset + start, stop - start, bits[start]))
 
-    def optimizedata(data):
-        ''' Coalesce data/data together, and move data from
-            preceding null to align to byte boundaries if possible
+    def addtdo(self, bits):
+        ''' Add TDO bits (earliest first) to the read layout.
         '''
-        later = data.next()
-        for item in data:
-            if later[0] == 'data':
-                if item[0] == 'data':
-                    later[1] += item[1]
-                    continue
-                if item[0] == 'null':
-                    even = -len(later[1]) % 8 + ((len(item[1]) - 1) // 8 * 8)
-                    if even < len(item[1]):
-                        later[1] += item[1][:even]
-                        item[1] = item[1][even:]
-            yield later
-            later = item
-        yield later
-
-    def get_transitions(data):
-        start = 0
-        for item in data:
-            yield start
-            start += len(item[1])
-        yield start
-
-    join = ''.join
-    data = ([x,join(z[1] for z in y)] for (x,y) in itertools.groupby(itertools.izip(tms, tdi, tdo), key))
-    data = null2data(data)
-    data = mergenull(data)
-    data = optimizedata(data)
-    startx, stopx = itertools.tee(get_transitions(data))
-    stopx.next()
-    slices = (slice(x, y) for (x, y) in itertools.izip(startx, stopx))
-    return [(tms[x], tdi[x], tdo[x]) for x in slices]
-
-def do_tdi_tdo(info, addwrite, addread, old_tdi):
-    tms, tdi, tdo = info.pop()
-    length = len(tdi)
-    assert tms.count('0') == length == len(tdo)
-    bytes, bits = divmod(length, 8)
-    leftovers = -bits % 8 * '0'
-    if 'x' not in tdo:
-        instructions = Commands.tdi_wr, Commands.tdi_wr_bits
-    else:
-        addread(tdo[bits:])
-        addread(leftovers)
-        addread(tdo[:bits])
-        if old_tdi == '0' and tdi.count('0') == len(tdi):
-            instructions = Commands.tdo_rd, Commands.tdo_rd_bits
-            tdi = leftovers = ''
+        offset = self.readbits
+        if '*' not in bits:
+            if bits:
+                self.tdo_runs.append((offset, len(bits), 'x'))
         else:
-            instructions = Commands.tdi_tdo, Commands.tdi_tdo_bits
-    if bytes:
-        if bytes == 1:
-            addwrite(hexconv(instructions[1]))
-            addwrite(hexconv(8-1))
+            for match in var_finder(bits):
+                start, stop = match.span()
+                self.tdo_runs.append((offset + start, stop - start, bits[start]))
+        self.readbits = offset + len(bits)
+
+    def do_tdi_tdo(self, start, stop):
+        tdi = self.tdi[start:stop]
+        tdo = self.tdo[start:stop]
+        length = stop - start
+        assert self.tms.count('0', start, stop) == length
+        numbytes, numbits = divmod(length, 8)
+        if 'x' not in tdo:
+            instructions = tdi_wr
         else:
-            addwrite(hexconv(instructions[0]))
-            addwrite(hexconv( (bytes-1) % 256))
-            addwrite(hexconv( (bytes-1) / 256))
-        addwrite(tdi[bits:])
-    if bits:
-        addwrite(hexconv(instructions[1]))
-        addwrite(hexconv(bits-1))
-        addwrite(tdi[:bits])
-        addwrite(leftovers)
-    return '0', tdi and tdi[0] or '0'   # TMS
-
-def do_tms(info, addwrite, addread, old_tdi):
-    maxbits = room = 7
-    tms, tdi, tdo = [], [], []
-    tdival = info[-1][1][-1]
-    while info and room:
-        new_tms, new_tdi, new_tdo = info[-1]
-        if new_tms == '1' and new_tdi == 'x':
-            if not tms:
-                info.pop()
-                tms.append(new_tms); tdi.append(new_tdi); tdo.append(new_tdo)
-            break
-        if (new_tms[-1] == '0' and (new_tdi[-1] != '*' or len(new_tdi) >= 16)) and tms:
-            break
-        mylen = min(room, len(new_tms))
-        bad_tdi = new_tdi[-mylen:].upper()  # Force mismatch on 'X'
-        if not tdi and bad_tdi.endswith('X'):
-            bad_tdi = bad_tdi[:-1]
-        while 1:
-            bad_tdi = bad_tdi.rstrip(tdival+'*')
-            if not bad_tdi or tdival != '*':
+            # Bit commands shift the TDO into the top of the byte
+            self.addtdo(tdo[:8 * numbytes])
+            self.readbits += -numbits % 8
+            self.addtdo(tdo[8 * numbytes:])
+            if self.old_tdi == '0' and tdi.count('0') == length:
+                instructions = tdo_rd
+                tdi = ''
+            else:
+                instructions = tdi_tdo
+        write = self.write
+        done = 0
+        while done < numbytes:
+            # A byte command can clock at most 65536 bytes
+            chunk = min(numbytes - done, 65536)
+            if chunk == 1:
+                write.extend((instructions[1], 8 - 1))
+            else:
+                write.extend((instructions[0], (chunk - 1) % 256, (chunk - 1) / 256))
+            if tdi:
+                self.addtdi(tdi[8 * done:8 * (done + chunk)])
+            done += chunk
+        if numbits:
+            write.extend((instructions[1], numbits - 1))
+            if tdi:
+                self.addtdi(tdi[8 * numbytes:])
+        self.old_tms, self.old_tdi = '0', tdi and tdi[-1] or '0'
+
+    def do_tms(self, groups, index):
+        ''' Clock up to 7 bits with a TMS command, where TDI
+            is the same for all of them.  Returns the index
+            of the group that the next command starts in.
+        '''
+        tms, tdi, tdo = self.tms, self.tdi, self.tdo
+        maxbits = room = 7
+        first = stop = groups[index][1]
+        tdival = tdi[first]
+        while index < len(groups) and room:
+            group = groups[index]
+            kind, start, end = group
+            if end - start == 1 and tms[start] == '1' and tdi[start] == 'x':
+                if stop == first:
+                    stop = end
+                    index += 1
+                break
+            if (tms[start] == '0' and (tdi[start] != '*' or end - start >= 16)) and stop != first:
+                break
+            mylen = min(room, end - start)
+            bad_tdi = tdi[start:start + mylen].upper()  # Force mismatch on 'X'
+            if stop == first and bad_tdi.startswith('X'):
+                bad_tdi = bad_tdi[1:]
+            while 1:
+                bad_tdi = bad_tdi.lstrip(tdival + '*')
+                if not bad_tdi or tdival != '*':
+                    break
+                tdival = bad_tdi[0]
+            mylen -= len(bad_tdi)
+            if not mylen:
                 break
-            tdival = bad_tdi[-1]
-        mylen -= len(bad_tdi)
-        if not mylen:
-            break
-        info.pop()
-        room -= mylen
-        if mylen < len(new_tdi):
-            room = 0
-            info.append((new_tms[:-mylen], new_tdi[:-mylen], new_tdo[:-mylen]))
-            new_tms, new_tdi, new_tdo = new_tms[-mylen:], new_tdi[-mylen:], new_tdo[-mylen:]
-        tms.append(new_tms); tdi.append(new_tdi); tdo.append(new_tdo)
-
-    tdival = tdival.replace('*', '0')
-    tms.reverse()
-    tdi.reverse()
-    tdo.reverse()
-    tms = ''.join(tms)
-    tdi, = set(''.join(tdi).replace('*', tdival))  # Check it doesn't change
-    tdo = ''.join(tdo)
-    length = len(tms)
-    assert 1 <= length <= maxbits
-    assert length == 1 or tdi != 'x'
-    if 'x' not in tdo:
-        instruction = Commands.tms_wr_bits
-    else:
-        instruction = Commands.tms_rd_bits
-        addread((8-length) * '0')
-        addread(tdo)
-    addwrite(hexconv(instruction))
-    addwrite(hexconv(length-1))
-    addwrite(tms)
-    addwrite((7 - length) * '0')
-    addwrite(tdi)
-    return tms[0], tdi
-
-def mpsse_jtag_commands(tms, tdi, tdo, do_tms=do_tms, do_tdi_tdo=do_tdi_tdo):
-        def get_func():
-            new_tms, new_tdi, new_tdo = info[-1]
-            if new_tms[-1] == old_tms == '0':
-                if len(new_tms) >= 7:
-                    return do_tdi_tdo
-                if len(set(new_tdi.replace('*', ''))) > 1:
-                    return do_tdi_tdo
-                if new_tdi.count('x') > 1:
-                    return do_tdi_tdo
-            return do_tms
-
-        info = group_strings(tms, tdi, tdo)
+            room -= mylen
+            stop = start + mylen
+            if stop < end:
+                room = 0
+                group[1] = stop
+            else:
+                index += 1
+
+        tdival = tdival.replace('*', '0')
+        tdi, = set(tdi[first:stop].replace('*', tdival))  # Check it doesn't change
+        length = stop - first
+        assert 1 <= length <= maxbits
+        assert length == 1 or tdi != 'x'
+        tms = tms[first:stop]
+        tdo = tdo[first:stop]
+        if 'x' not in tdo:
+            instruction = Commands.tms_wr_bits
+        else:
+            instruction = Commands.tms_rd_bits
+            self.readbits += 8 - length
+            self.addtdo(tdo)
+        write = self.write
+        write.extend((instruction, length - 1, int(tms[::-1], 2) | (tdi == '1') << 7))
+        if tdi == 'x':
+            self.tdi_runs.append((len(write) * 8 - 1, 1, 'x'))
+        self.old_tms, self.old_tdi = tms[-1], tdi
+        return index
+
+    def xstrings(self):
+        ''' Return the write and read xstrings for the frame.
+        '''
+        write = self.write
+        bits = '{0:0{1}b}'.format(int(hexlify(write[::-1]) or '0', 16), 8 * len(write))
+        return overlay(bits, self.tdi_runs), overlay(self.readbits * '0', self.tdo_runs)
+
+def repeats(codes, frame, start):
+    ''' Return the number of copies of frame in a row
+        in codes, starting at start.
+    '''
+    count = 0
+    size = 1
+    while codes.startswith(size * frame, start):
+        count += size
+        start += size * len(frame)
+        size *= 2
+    while size > 1:
+        size /= 2
+        if codes.startswith(size * frame, start):
+            count += size
+            start += size * len(frame)
+    return count
+
+def compile_frame(compiled, frame, context):
+    ''' Return the write and read xstrings and the final
+        context for a frame, compiling it if it has not
+        been seen before in this context.
+    '''
+    info = compiled.get((frame, context))
+    if info is None:
+        commands = MpsseFrame(frame, context)
+        info = compiled[frame, context] = commands.xstrings() + (commands.context,)
+    return info
+
+def mpsse_jtag_commands(tms, tdi, tdo, context=None):
+        ''' Return the MPSSE write and read strings for the template
+            strings.  The context is the (TMS, TDI) state of the cable
+            before the first command, or None for the start of a
+            transaction.  The context after the last command is
+            also returned, so that a template can be converted a
+            piece at a time.
+        '''
+        def nextframe(start):
+            match = frame_finder(kinds, start)
+            return match.start() + 1 if match is not None else numbits
+
+        context = context or ('0', '*')
+        numbits = len(tms)
+        if not numbits:
+            return '', '', context
+        codes = int(tms.translate(tms_codes), 16) + int(tdi.translate(tdi_codes), 16)
+        codes = ('%0*x' % (numbits, codes + int(tdo.translate(tdo_codes), 16)))[::-1]
+        kinds = codes.translate(code_kinds)
+
         write_template, read_template = [], []
-        addwrite, addread = write_template.append, read_template.append
-        old_tms = '0'
-        old_tdi = '*'
-        while info:
-            old_tms, old_tdi = get_func()(info, addwrite, addread, old_tdi)
+        compiled = {}
+        done = 0
+        start = nextframe(0)
+        while start < numbits:
+            stop = nextframe(start)
+            frame = codes[start:stop]
+            if stop == numbits or not codes.startswith(frame, stop):
+                start = stop
+                continue
+
+            # The frame is repeated.  Compile everything before it,
+            # then compile it once and replicate it, as long as the
+            # last copy is followed by another frame.
+            if done < start:
+                write, read, context = compile_frame(compiled, codes[done:start], context)
+                write_template.append(write)
+                read_template.append(read)
+            write, read, newcontext = compile_frame(compiled, frame, context)
+            count = 1
+            if newcontext == context:
+                count += repeats(codes, frame, stop)
+                if start + count * len(frame) < numbits and not kinds.startswith(
+                                    frame_start, start + count * len(frame)):
+                    count -= 1
+            write_template.append(count * write)
+            read_template.append(count * read)
+            context = newcontext
+            done = start = start + count * len(frame)
+
+        if done < numbits:
+            write, read, context = compile_frame(compiled, codes[done:], context)
+            write_template.append(write)
+            read_template.append(read)
 
         write_template.reverse()
         read_template.reverse()
-        return ''.join(write_template), ''.join(read_template)
+        return ''.join(write_template), ''.join(read_template), context
@@ -2,17 +2,32 @@
 This module contains a mixin object to map JTAG strings into
 FTDI MPSSE commands.
 
+MpsseCommands inserts the MPSSE commands into the template strings.
+MpsseTemplate uses the string conversion code, MpsseInts uses
+the integer shift/mask conversion code, and MpsseBin uses the
+ctypes structure conversion code.
+
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 from .mpsse_jtag_commands import mpsse_jtag_commands
 from ...iotemplate.stringconvert import TemplateStrings
+from ...iotemplate.intconvert import TemplateInts
+from ...iotemplate.binconvert import BinTemplate
+
+class MpsseCommands(object):
+    compiler_deps = (mpsse_jtag_commands.__module__,)
+
+    def customize_template(self):
+        info = mpsse_jtag_commands(self.tms_string, self.tdi_xstring, self.tdo_xstring, self.context)
+        self.tdi_xstring, self.tdo_xstring, self.context = info
+
+    def transfer_sizes(self):
+        return len(self.tdi_xstring) // 8, len(self.tdo_xstring) // 8
 
-class MpsseTemplate(TemplateStrings):
+class MpsseTemplate(MpsseCommands, TemplateStrings):
 
     def get_xfer_func(self):
-        info = mpsse_jtag_commands(self.tms_string, self.tdi_xstring, self.tdo_xstring)
-        self.tdi_xstring, self.tdo_xstring = info
         tditostr = self.get_tdi_combiner()
         tdo_length = len(self.tdo_xstring)
         tdi_length = len(self.tdi_xstring)
@@ -27,3 +42,37 @@ class MpsseTemplate(TemplateStrings):
                 driver(tditostr(tdi_array), tdi_length, tdo_length)
         vars(self).clear()
         return func
+
+class MpsseInts(MpsseCommands, TemplateInts):
+
+    def get_xfer_func(self):
+        tdi_combiner = self.get_tdi_combiner()
+        tdo_length = len(self.tdo_xstring)
+        tdi_length = len(self.tdi_xstring)
+
+        if self.tdo_bits:
+            tdo_extractor = self.get_tdo_extractor()
+            def func(driver, tdi_array):
+                return tdo_extractor(driver.xfer_ints(tdi_combiner(tdi_array), tdi_length, tdo_length))
+        else:
+            def func(driver, tdi_array):
+                driver.xfer_ints(tdi_combiner(tdi_array), tdi_length, tdo_length)
+        vars(self).clear()
+        return func
+
+class MpsseBin(MpsseCommands, BinTemplate):
+
+    def get_xfer_func(self):
+        tdi_builder = self.get_tdi_builder()
+        tdo_length = len(self.tdo_xstring)
+        tdi_length = len(self.tdi_xstring)
+
+        if self.tdo_bits:
+            tdo_extractor = self.get_tdo_extractor()
+            def func(driver, tdi_array):
+                return tdo_extractor(driver.xfer_bin(tdi_builder(tdi_array), tdi_length, tdo_length))
+        else:
+            def func(driver, tdi_array):
+                driver.xfer_bin(tdi_builder(tdi_array), tdi_length, tdo_length)
+        vars(self).clear()
+        return func
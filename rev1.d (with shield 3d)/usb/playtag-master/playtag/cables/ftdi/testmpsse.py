@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+'''
+Testcases for the MPSSE command compiler.  The commands for random
+templates, LEON3 AHB bursts and random strings are checked against
+the compiler that it replaced, which built the commands as strings
+of '0' and '1', a group of bits at a time.  That compiler is kept
+here as the reference.  (The speed of the compiler is measured by the
+mpsse_commands_flat benchmark in tools/benchmarks/suite.py.)
+'''
+
+import os
+import re
+import sys
+import random
+import string
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+from playtag.cables.ftdi.mpsse_commands import Commands, hexconv
+from playtag.cables.ftdi.mpsse_template import MpsseInts
+from playtag.cables.ftdi.mpsse_jtag_commands import mpsse_jtag_commands, MpsseFrame
+from playtag.iotemplate.testconvert import EchoDriver, randtemplate, randloops
+from playtag.leon3.jtag_ahb import BusDriver
+
+numtemplates = 300
+numstrings = 3000
+
+#
+# The reference compiler
+#
+
+run_finder = re.compile(r'0+|1+|x+|\*+').finditer
+tdi_classes = string.maketrans('1', '0')
+
+def run_starts(s, start=0, stop=None):
+    ''' Return the start of each run of identical
+        characters in s[start:stop].
+    '''
+    if stop is None:
+        stop = len(s)
+    return [x.start() for x in run_finder(s, start, stop)]
+
+def group_strings(tms, tdi, tdo, slice=slice, len=len):
+    ''' NOTE: Strings are reversed -- s[0] is later in time than s[30]
+
+        The strings are split into groups by working on the runs
+        of identical characters in them rather than on each bit.
+        The group depends on whether TDI is constant, variable or
+        don't care, but only depends on the actual constant TDI
+        values when TMS is high, so the number of runs (and thus
+        the amount of work) depends on the number of fields in
+        the template, not on the number of bits.
+    '''
+    def key(tms, tdi, tdo):
+        if tms != '0' or tdi == tdo == '*':
+            return 'tms' + tdi
+        elif tdi == 'x' or tdo == 'x':
+            return 'data'
+        else:
+            return 'null'
+
+    def get_groups():
+        ''' Yield [key, length] for each group of
+            bits that have the same key.
+        '''
+        starts = set(run_starts(tdi.translate(tdi_classes)))
+        starts.update(run_starts(tdo))
+        tms_starts = run_starts(tms)
+        starts.update(tms_starts)
+        for start, stop in itertools.izip(tms_starts, tms_starts[1:] + [len(tms)]):
+            if tms[start] != '0':
+                starts.update(run_starts(tdi, start, stop))
+        starts = sorted(starts)
+        starts.append(len(tms))
+        later = None
+        for start, stop in itertools.izip(starts, starts[1:]):
+            item = [key(tms[start], tdi[start], tdo[start]), stop - start]
+            if later is not None:
+                if later[0] == item[0]:
+                    later[1] += item[1]
+                    continue
+                yield later
+            later = item
+        if later is not None:
+            yield later
+
+    def null2data(data):
+        ''' Convert big blocks of null into null followed by data.
+            (strings are reversed, so emit data first.)
+        '''
+        for item in data:
+            if item[0] == 'null' and item[1] >= 17:
+                yield ['data', item[1] - 8]
+                item[1] = 8
+            yield item
+
+    def mergenull(data):
+        ''' Coalesce data/null together
+        '''
+        later = data.next()
+        for item in data:
+            if item[0] == 'data' and later[0] == 'null':
+                later[1] += item[1]
+                later[0] = 'data'
+                continue
+            yield later
+            later = item
+        yield later
+
+    def optimizedata(data):
+        ''' Coalesce data/data together, and move data from
+            preceding null to align to byte boundaries if possible
+        '''
+        later = data.next()
+        for item in data:
+            if later[0] == 'data':
+                if item[0] == 'data':
+                    later[1] += item[1]
+                    continue
+                if item[0] == 'null':
+                    even = -later[1] % 8 + ((item[1] - 1) // 8 * 8)
+                    if even < item[1]:
+                        later[1] += even
+                        item[1] -= even
+            yield later
+            later = item
+        yield later
+
+    def get_transitions(data):
+        start = 0
+        for item in data:
+            yield start
+            start += item[1]
+        yield start
+
+    data = get_groups()
+    data = null2data(data)
+    data = mergenull(data)
+    data = optimizedata(data)
+    startx, stopx = itertools.tee(get_transitions(data))
+    stopx.next()
+    slices = (slice(x, y) for (x, y) in itertools.izip(startx, stopx))
+    return [(tms[x], tdi[x], tdo[x]) for x in slices]
+
+def do_tdi_tdo(info, addwrite, addread, old_tdi):
+    tms, tdi, tdo = info.pop()
+    length = len(tdi)
+    assert tms.count('0') == length == len(tdo)
+    bytes, bits = divmod(length, 8)
+    leftovers = -bits % 8 * '0'
+    if 'x' not in tdo:
+        instructions = Commands.tdi_wr, Commands.tdi_wr_bits
+    else:
+        addread(tdo[bits:])
+        addread(leftovers)
+        addread(tdo[:bits])
+        if old_tdi == '0' and tdi.count('0') == len(tdi):
+            instructions = Commands.tdo_rd, Commands.tdo_rd_bits
+            tdi = leftovers = ''
+        else:
+            instructions = Commands.tdi_tdo, Commands.tdi_tdo_bits
+    while bytes:
+        # A byte command can clock at most 65536 bytes
+        chunk = min(bytes, 65536)
+        if chunk == 1:
+            addwrite(hexconv(instructions[1]))
+            addwrite(hexconv(8-1))
+        else:
+            addwrite(hexconv(instructions[0]))
+            addwrite(hexconv( (chunk-1) % 256))
+            addwrite(hexconv( (chunk-1) / 256))
+        bytes -= chunk
+        addwrite(tdi[bits + 8 * bytes:bits + 8 * (bytes + chunk)])
+    if bits:
+        addwrite(hexconv(instructions[1]))
+        addwrite(hexconv(bits-1))
+        addwrite(tdi[:bits])
+        addwrite(leftovers)
+    return '0', tdi and tdi[0] or '0'   # TMS
+
+def do_tms(info, addwrite, addread, old_tdi):
+    maxbits = room = 7
+    tms, tdi, tdo = [], [], []
+    tdival = info[-1][1][-1]
+    while info and room:
+        new_tms, new_tdi, new_tdo = info[-1]
+        if new_tms == '1' and new_tdi == 'x':
+            if not tms:
+                info.pop()
+                tms.append(new_tms); tdi.append(new_tdi); tdo.append(new_tdo)
+            break
+        if (new_tms[-1] == '0' and (new_tdi[-1] != '*' or len(new_tdi) >= 16)) and tms:
+            break
+        mylen = min(room, len(new_tms))
+        bad_tdi = new_tdi[-mylen:].upper()  # Force mismatch on 'X'
+        if not tdi and bad_tdi.endswith('X'):
+            bad_tdi = bad_tdi[:-1]
+        while 1:
+            bad_tdi = bad_tdi.rstrip(tdival+'*')
+            if not bad_tdi or tdival != '*':
+                break
+            tdival = bad_tdi[-1]
+        mylen -= len(bad_tdi)
+        if not mylen:
+            break
+        info.pop()
+        room -= mylen
+        if mylen < len(new_tdi):
+            room = 0
+            info.append((new_tms[:-mylen], new_tdi[:-mylen], new_tdo[:-mylen]))
+            new_tms, new_tdi, new_tdo = new_tms[-mylen:], new_tdi[-mylen:], new_tdo[-mylen:]
+        tms.append(new_tms); tdi.append(new_tdi); tdo.append(new_tdo)
+
+    tdival = tdival.replace('*', '0')
+    tms.reverse()
+    tdi.reverse()
+    tdo.reverse()
+    tms = ''.join(tms)
+    tdi, = set(''.join(tdi).replace('*', tdival))  # Check it doesn't change
+    tdo = ''.join(tdo)
+    length = len(tms)
+    assert 1 <= length <= maxbits
+    assert length == 1 or tdi != 'x'
+    if 'x' not in tdo:
+        instruction = Commands.tms_wr_bits
+    else:
+        instruction = Commands.tms_rd_bits
+        addread((8-length) * '0')
+        addread(tdo)
+    addwrite(hexconv(instruction))
+    addwrite(hexconv(length-1))
+    addwrite(tms)
+    addwrite((7 - length) * '0')
+    addwrite(tdi)
+    return tms[0], tdi
+
+def reference_commands(tms, tdi, tdo, context=None, do_tms=do_tms, do_tdi_tdo=do_tdi_tdo):
+        ''' Return the MPSSE write and read strings for the template
+            strings.  The context is the (TMS, TDI) state of the cable
+            before the first command, or None for the start of a
+            transaction.  The context after the last command is
+            also returned, so that a template can be converted a
+            piece at a time.
+        '''
+        def get_func():
+            new_tms, new_tdi, new_tdo = info[-1]
+            if new_tms[-1] == old_tms == '0':
+                if len(new_tms) >= 7:
+                    return do_tdi_tdo
+                if len(set(new_tdi.replace('*', ''))) > 1:
+                    return do_tdi_tdo
+                if new_tdi.count('x') > 1:
+                    return do_tdi_tdo
+            return do_tms
+
+        info = group_strings(tms, tdi, tdo)
+        write_template, read_template = [], []
+        addwrite, addread = write_template.append, read_template.append
+        old_tms, old_tdi = context or ('0', '*')
+        while info:
+            old_tms, old_tdi = get_func()(info, addwrite, addread, old_tdi)
+
+        write_template.reverse()
+        read_template.reverse()
+        return ''.join(write_template), ''.join(read_template), (old_tms, old_tdi)
+
+#
+# The tests
+#
+
+class Capture(MpsseInts):
+    ''' Keeps the arguments for each call to the compiler.
+    '''
+    calls = []
+    def customize_template(self):
+        self.calls.append((self.tms_string, self.tdi_xstring, self.tdo_xstring, self.context))
+        MpsseInts.customize_template(self)
+
+def compiler_args(template, expand=False):
+    ''' Return the arguments the compiler is called
+        with to compile a template.
+    '''
+    if expand:
+        template.loops = []
+    Capture.calls = []
+    Capture.compile(template)
+    return Capture.calls
+
+def busdriver():
+    ''' Make a LEON3 AHB bus driver for a single-device
+        chain without doing chain discovery.
+    '''
+    driver = BusDriver.__new__(BusDriver)
+    driver.ilength, driver.cmdi, driver.datai = 6, 2, 3
+    driver.bypass_info = None
+    driver.jtagrw = EchoDriver()
+    return driver
+
+burst = BusDriver.max_bytes / 4     # Words in a 16 KB burst
+
+def bursts():
+    ''' Yield 16 KB read and write templates, with the
+        loops expanded, and some shorter ones.
+    '''
+    for key in ((False, burst, 4), (True, burst, 4), (False, 17, 4), (True, 3, 4), (False, 1, 2)):
+        template = busdriver()[key].protocol_optimize()
+        for args in compiler_args(template):
+            yield args
+        for args in compiler_args(template, True):
+            yield args
+
+def randstrings(rand):
+    ''' Return random TMS, TDI and TDO strings, mostly made
+        of runs of the same character.
+    '''
+    tms, tdi, tdo = [], [], []
+    for i in range(rand.randint(1, 40)):
+        numbits = rand.choice((1, 1, 2, 3, 5, 7, 8, 9, 15, 16, 17, 24, 31, 33, 70))
+        value = rand.choice('01')
+        tms.append(numbits * value)
+        if value == '1' or numbits < 16:
+            tdi.append(numbits * rand.choice('01**') if numbits > 1 else rand.choice('01*x'))
+        else:
+            tdi.append(''.join(rand.choice('01*x') for j in range(numbits)))
+        if rand.random() < 0.7:
+            tdo.append(numbits * rand.choice('*x'))
+        else:
+            tdo.append(''.join(rand.choice('*x') for j in range(numbits)))
+    return ''.join(tms), ''.join(tdi), ''.join(tdo)
+
+def check(args, info):
+    ''' Compile with both compilers.  Strings that the reference
+        compiler can't handle must fail with the new one, too.
+    '''
+    try:
+        expected = reference_commands(*args)
+    except (AssertionError, ValueError):
+        expected = None
+    try:
+        actual = mpsse_jtag_commands(*args)
+    except (AssertionError, ValueError):
+        actual = None
+    assert actual == expected, info
+    return expected is not None
+
+def run():
+    for index in range(numtemplates):
+        for build in (randtemplate, randloops):
+            for expand in (False, True):
+                template = build(EchoDriver(), random.Random(index))[0]
+                for args in compiler_args(template, expand):
+                    assert check(args, (index, build.__name__, expand))
+    for args in bursts():
+        assert check(args, len(args[0]))
+
+def run_strings():
+    ''' Random strings, both by themselves and repeated
+        many times after some other strings.
+    '''
+    rand = random.Random(42)
+    contexts = None, ('0', '*'), ('1', '0'), ('0', '1'), ('1', 'x'), ('0', '0')
+    valid = 0
+    for index in range(numstrings):
+        strings = randstrings(rand)
+        valid += check(strings + (rand.choice(contexts),), index)
+        if not index % 10:
+            count = rand.randint(2, 50)
+            strings = [x + count * y for x, y in zip(randstrings(rand), strings)]
+            valid += check(tuple(strings) + (None,), (index, count))
+    assert valid > numstrings / 5, valid
+
+def run_layout():
+    ''' The bytes and the read layout for a single scan.
+    '''
+    # TMS 1, 0, 0 to get to Shift-DR, then 9 bits of data, and a
+    # last bit with TMS high.  A single byte is sent with a bit
+    # command, and the bits read with bit commands are at the top
+    # of their bytes.
+    frame = MpsseFrame('822' + 9 * '7' + 'f', ('0', '*'))
+    assert frame.write == bytearray([Commands.tms_wr_bits, 2, 0x01,
+                                     Commands.tdi_tdo_bits, 7, 0,
+                                     Commands.tdi_tdo_bits, 0, 0,
+                                     Commands.tms_rd_bits, 0, 0x01])
+    assert frame.tdi_runs == [(40, 8, 'x'), (64, 1, 'x'), (95, 1, 'x')]
+    assert frame.readbits == 24
+    assert frame.tdo_runs == [(0, 8, 'x'), (15, 1, 'x'), (23, 1, 'x')]
+    assert frame.context == ('1', 'x')
+    write, read = frame.xstrings()
+    assert read == 'x' + 7 * '0' + 'x' + 7 * '0' + 8 * 'x'
+    assert write[:8] == 'x0000001' and write[-24:] == '00000001' + '00000010' + hexconv(Commands.tms_wr_bits)
+
+if __name__ == '__main__':
+    run()
+    run_strings()
+    run_layout()
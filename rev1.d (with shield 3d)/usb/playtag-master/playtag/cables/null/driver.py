@@ -0,0 +1,64 @@
+'''
+This module provides a null cable driver, which accepts the
+transfers from compiled templates and does no I/O at all.  Every
+TDO bit reads as 0.  It is used to time the host side of
+template application, or of a tool that doesn't check TDO.
+
+The cable name picks the style of driver interface, which
+decides how the templates are compiled:
+
+    jtag   -- TMS and TDI for each clock, like the digilent cable
+    mpsse  -- MPSSE commands, like the ftdi cable
+
+The driver counts the transfers and the bits sent and received.
+
+To time a tool that checks TDO (e.g. an SVF file with TDO values),
+record a session on a real cable and use the replay cable.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+from ...iotemplate.stringconvert import TemplateStrings
+from ...iotemplate.intconvert import TemplateInts
+from ...iotemplate.binconvert import BinTemplate
+from ...iotemplate.recorder import BytesDriver
+from ..ftdi.mpsse_template import MpsseTemplate, MpsseInts, MpsseBin
+
+def showdevs():
+    print '''
+The null cable does no I/O.  Give the style of driver interface
+as the cable name:
+
+    null jtag       (TMS and TDI, like the digilent cable)
+    null mpsse      (MPSSE commands, like the ftdi cable)
+'''
+
+class NullTransfers(BytesDriver):
+    transfers = outbits = inbits = 0
+
+    def __init__(self, UserConfig):
+        self.template_config(UserConfig)
+
+    def transfer(self, style, numbits, inbits, tms, tdi):
+        self.transfers += 1
+        self.outbits += numbits
+        self.inbits += inbits
+        return '\0' * ((inbits + 7) / 8)
+
+class NullJtag(NullTransfers, TemplateInts.mix_me_in()):
+    converters = dict(strings=TemplateStrings, ints=TemplateInts, bin=BinTemplate)
+
+class NullMpsse(NullTransfers, MpsseInts.mix_me_in()):
+    converters = dict(strings=MpsseTemplate, ints=MpsseInts, bin=MpsseBin)
+
+styles = dict(jtag=NullJtag, mpsse=NullMpsse)
+
+def Jtagger(UserConfig):
+    name = UserConfig.CABLE_NAME = UserConfig.CABLE_NAME or 'jtag'
+    cls = styles.get(name.lower())
+    if cls is None:
+        UserConfig.error('Expected null cable name to be one of %s, not %s' %
+                            (sorted(styles), repr(name)))
+    return cls(UserConfig)
+
+__all__ = 'Jtagger showdevs'.split()
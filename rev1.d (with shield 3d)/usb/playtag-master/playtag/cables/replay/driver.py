@@ -0,0 +1,87 @@
+'''
+This module provides a cable driver that replays a session
+recorded with the RECORD_FILE option (see iotemplate/recorder.py)
+on any other cable.  The cable name is the name of the log file,
+e.g.:
+
+    loadsvf.py digilent 0 SVF=design.svf RECORD_FILE=design.log
+    loadsvf.py replay design.log SVF=design.svf
+
+Each transfer returns the TDO that was received for it when the
+session was recorded, without waiting, so a replayed run times
+just the host side of the session, and gives the same results
+every time.
+
+The session must make the same transfers again, so settings
+that change them (e.g. TRACK_TAP_STATE) must be the same, but
+the TEMPLATE_CONVERTER can differ.  With
+REPLAY_CHECK on, the data sent on each transfer is checked
+against the log.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+from ...iotemplate.stringconvert import TemplateStrings
+from ...iotemplate.intconvert import TemplateInts
+from ...iotemplate.binconvert import BinTemplate
+from ...iotemplate.recorder import BytesDriver, readlog, JTAG
+from ..ftdi.mpsse_template import MpsseTemplate, MpsseInts, MpsseBin
+
+class ReplayDefaults(object):
+    REPLAY_CHECK = True     # Check the data sent against the log
+
+class ReplayError(RuntimeError):
+    pass
+
+def showdevs():
+    print '''
+The replay cable replays a session that was recorded on another
+cable with the RECORD_FILE option.  Give the log file as the
+cable name, e.g.:
+
+    replay session.log
+'''
+
+class ReplayTransfers(BytesDriver):
+    transfers = 0
+
+    def __init__(self, UserConfig, records):
+        self.template_config(UserConfig)
+        UserConfig.add_defaults(ReplayDefaults)
+        self.check = UserConfig.REPLAY_CHECK
+        self.fname = UserConfig.CABLE_NAME
+        self.records = records
+
+    def transfer(self, style, numbits, inbits, tms, tdi):
+        index = self.transfers
+        if index >= len(self.records):
+            raise ReplayError('Transfer %d is past the end of %s' % (index, self.fname))
+        self.transfers = index + 1
+        record = self.records[index]
+        if self.check and (record[:3] != (style, numbits, inbits) or
+                           record[5:7] != (tms, tdi)):
+            raise ReplayError('Transfer %d does not match the one in %s' % (index, self.fname))
+        return record[7]
+
+class ReplayJtag(ReplayTransfers, TemplateInts.mix_me_in()):
+    converters = dict(strings=TemplateStrings, ints=TemplateInts, bin=BinTemplate)
+
+class ReplayMpsse(ReplayTransfers, MpsseInts.mix_me_in()):
+    converters = dict(strings=MpsseTemplate, ints=MpsseInts, bin=MpsseBin)
+
+def Jtagger(UserConfig):
+    ''' Read the log, and return a driver with the
+        style of interface it was recorded with.
+    '''
+    fname = UserConfig.CABLE_NAME
+    if not fname:
+        UserConfig.error('Expected the name of a transfer log as the replay cable name')
+    try:
+        records = readlog(fname)
+    except (IOError, ValueError), err:
+        UserConfig.error(err)
+    style = records[0][0] if records else JTAG
+    cls = ReplayJtag if style == JTAG else ReplayMpsse
+    return cls(UserConfig, records)
+
+__all__ = 'Jtagger showdevs ReplayError'.split()
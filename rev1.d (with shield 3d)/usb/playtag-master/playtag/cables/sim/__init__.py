@@ -0,0 +1 @@
+from driver import *
@@ -0,0 +1,208 @@
+'''
+This module simulates a chain of JTAG devices, so that the code
+that uses a cable can be run (and timed) without any hardware.
+
+The chain is described by a list of parts, in order from TDI to
+TDO (the same order that jtag/discover.py reports them in).  Each
+part is either a name or an IDCODE from bsdl/data/partindex.txt,
+which gives its IDCODE and its IR length and capture value, or
+"noid:<irlength>" for a part without an IDCODE register, or
+"leon3" for a simulated LEON3 system (see leon3.py).  An IR
+length can also be given for an IDCODE that is not in the index,
+e.g. "0x1234567f:6".
+
+Each simulated device has BYPASS (all ones), IDCODE (idcode_ir),
+and a user data register of user_bits bits for every other
+instruction, which holds the last value written to it.  A reset
+loads the IDCODE instruction, or BYPASS for a part without an
+IDCODE.
+
+The whole chain is simulated as a single shift register, and a
+run of clocks in a shift state is done with one integer shift,
+so long scans (e.g. SVF bitstreams) are fast.  Only the clocks
+that move the TAP through other states are simulated one at a
+time.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+
+from ...jtag.states import states as jtagstates
+from ...bsdl.lookup import PartInfo, readfile
+
+class SimDevice(object):
+    ''' One device on the simulated chain.
+    '''
+    idcode_ir = 1       # Instruction that selects the IDCODE register
+    user_bits = 32      # Length of the user data registers
+
+    def __init__(self, name, idcode, ir_capture):
+        self.name = name
+        self.idcode = idcode
+        self.irlen = len(ir_capture)
+        self.ir_capture = int(ir_capture, 2)
+        self.bypass_ir = (1 << self.irlen) - 1
+        self.regs = {}
+        self.reset()
+
+    def reset(self):
+        self.ir = self.idcode_ir if self.idcode else self.bypass_ir
+
+    def dr_length(self):
+        ir = self.ir
+        if ir == self.bypass_ir:
+            return 1
+        if ir == self.idcode_ir and self.idcode:
+            return 32
+        return self.user_bits
+
+    def capture_dr(self):
+        ir = self.ir
+        if ir == self.bypass_ir:
+            return 0
+        if ir == self.idcode_ir and self.idcode:
+            return self.idcode
+        return self.regs.get(ir, 0)
+
+    def update_dr(self, value):
+        ir = self.ir
+        if ir != self.bypass_ir and not (ir == self.idcode_ir and self.idcode):
+            self.regs[ir] = value
+
+    def __repr__(self):
+        return 'SimDevice(%s, idcode=0x%08x, ir=%s)' % (self.name, self.idcode,
+                    '{0:0{1}b}'.format(self.ir, self.irlen))
+
+def partnames(cache={}):
+    ''' Return a dictionary of the parts in the index by name.
+        An entry with several names separated by '/' is listed
+        under each of them.
+    '''
+    if not cache:
+        for idcode, ir_capture, names in readfile(PartInfo.partfile):
+            for name in names.lower().split('/'):
+                cache.setdefault(name, (idcode, ir_capture))
+    return cache
+
+def makedevice(spec):
+    ''' Return a SimDevice for one part of a chain description.
+        Don't-care bits in the index entry are simulated as 0.
+    '''
+    if not isinstance(spec, str):
+        spec = '0x%x' % spec
+    name, irlen = (spec.split(':', 1) + [None])[:2]
+    if name.lower() == 'leon3' and irlen is None:
+        from .leon3 import SimLeon3
+        return SimLeon3()
+    if name.lower() == 'noid':
+        idcode, ir_capture = '0', ''
+    else:
+        info = partnames().get(name.lower())
+        if info is not None:
+            idcode, ir_capture = info
+        else:
+            try:
+                value = int(name, 0)
+            except ValueError:
+                raise ValueError('Unknown part %s' % repr(name))
+            if not value & 1:
+                raise ValueError('Invalid IDCODE %s (bit 0 must be set)' % repr(name))
+            idcode, ir_capture = '{0:b}'.format(value), PartInfo(value).ir_capture
+            name = PartInfo(value).name
+    if irlen is not None:
+        try:
+            ir_capture = '{0:0{1}b}'.format(1, int(irlen))
+        except ValueError:
+            raise ValueError('Invalid IR length in %s' % repr(spec))
+    if len(ir_capture) < 2:
+        raise ValueError('No IR length for part %s' % repr(spec))
+    return SimDevice(name, int(idcode.replace('x', '0'), 2), ir_capture.replace('x', '0'))
+
+class SimChain(object):
+    ''' A chain of simulated devices that share TMS and TCK.
+        run() is passed TMS and TDI strings of '0' and '1' in
+        clock order (the first clock is the first character),
+        and returns TDO the same way.  TDO reads as 1 when
+        the TAP is not in a shift state.
+    '''
+    tcks = 0
+
+    def __init__(self, parts):
+        if isinstance(parts, str):
+            parts = parts.replace(',', ' ').split()
+        elif not isinstance(parts, (list, tuple)):
+            parts = [parts]
+        if not parts:
+            raise ValueError('Empty chain description')
+        self.devices = [makedevice(x) for x in parts]
+        self.value = self.length = 0
+        self.state = jtagstates.reset
+        self.enter(self.state)
+
+    def enter(self, state, states=jtagstates):
+        ''' Do what happens when the TAP enters a new state.
+        '''
+        devices = self.devices
+        if state == states.capture_dr:
+            value = length = 0
+            for device in devices:
+                size = device.dr_length()
+                value = (value << size) | device.capture_dr()
+                length += size
+            self.value, self.length = value, length
+        elif state == states.capture_ir:
+            value = 0
+            for device in devices:
+                value = (value << device.irlen) | device.ir_capture
+            self.value, self.length = value, sum(x.irlen for x in devices)
+        elif state == states.update_dr:
+            value = self.value
+            for device in reversed(devices):
+                size = device.dr_length()
+                device.update_dr(value & ((1 << size) - 1))
+                value >>= size
+        elif state == states.update_ir:
+            value = self.value
+            for device in reversed(devices):
+                device.ir = value & device.bypass_ir
+                value >>= device.irlen
+        elif state == states.reset:
+            for device in devices:
+                device.reset()
+
+    def run(self, tms, tdi, reset=jtagstates.reset, stable='idle pause_dr pause_ir'.split()):
+        ''' Clock the chain.  Runs of clocks that stay in the same
+            state are done all at once.
+        '''
+        numbits = len(tms)
+        assert numbits == len(tdi), (numbits, len(tdi))
+        self.tcks += numbits
+        tdo = []
+        state = self.state
+        index = 0
+        while index < numbits:
+            bit = tms[index]
+            if state.shifting:
+                stop = tms.find('1', index) + 1 or numbits
+                count = stop - index
+                value = self.value | (int(tdi[index:stop][::-1], 2) << self.length)
+                tdo.append('{0:0{1}b}'.format(value & ((1 << count) - 1), count)[::-1])
+                self.value = value >> count
+                index = stop
+                if tms[stop - 1] == '0':
+                    continue
+                bit = '1'
+            else:
+                if state == reset and bit == '1' or state in stable and bit == '0':
+                    stop = tms.find('10'[int(bit)], index)
+                    if stop < 0:
+                        stop = numbits
+                    tdo.append((stop - index) * '1')
+                    index = stop
+                    continue
+                tdo.append('1')
+                index += 1
+            state = state[int(bit)]
+            self.enter(state)
+        self.state = state
+        return ''.join(tdo)
@@ -0,0 +1,88 @@
+'''
+This module provides a cable driver for a simulated JTAG chain
+(see chain.py), for testing and benchmarking without hardware.
+
+The cable name is the description of the chain, e.g.:
+
+    discover.py sim xc3s500e xcf04s
+
+The driver counts the TCKs and the transfers, so the cost of
+a series of operations on a real cable can be estimated.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+from binascii import hexlify, unhexlify
+from ctypes import string_at, addressof
+
+from ...iotemplate.stringconvert import TemplateStrings
+from ...iotemplate.intconvert import TemplateInts
+from ...iotemplate.binconvert import BinTemplate
+from .chain import SimChain
+
+default_chain = 'xc3s500e xcf04s'
+
+def showdevs():
+    print '''
+The sim cable simulates a JTAG chain.  Give the parts on the chain,
+in order from TDI to TDO, as the cable name.  Each part is a name
+from playtag/bsdl/data/partindex.txt, an IDCODE, or noid:<irlength>
+for a part without an IDCODE, e.g.:
+
+    sim %s
+    sim 0x1234567f:6 noid:4
+''' % default_chain
+
+class Jtagger(TemplateInts.mix_me_in()):
+    converters = dict(strings=TemplateStrings, ints=TemplateInts, bin=BinTemplate)
+    transfers = 0
+
+    def __init__(self, UserConfig):
+        self.template_config(UserConfig)
+        parts = UserConfig.CABLE_NAME = UserConfig.CABLE_NAME or default_chain
+        try:
+            self.chain = SimChain(parts)
+        except ValueError, err:
+            UserConfig.error(err)
+        self.cable_serial = 'sim %s' % parts
+
+    @property
+    def tcks(self):
+        return self.chain.tcks
+
+    def __call__(self, tms, tdi, usetdo):
+        '''  Passed tms, tdi as strings of '0' and '1'.
+             First bit sent is the last bit in the string.
+             Returns tdo as a list of one string.
+        '''
+        if not tms:
+            return
+        self.transfers += 1
+        tdo = self.chain.run(tms[::-1], tdi[::-1])
+        if usetdo:
+            return [tdo[::-1]]
+
+    def xfer_ints(self, tms, tdi, numbits, usetdo, unhexlify=unhexlify):
+        '''  Passed tms, tdi as integers (bit 0 is sent first).
+             Returns tdo as a little-endian byte string (bit 0
+             of byte 0 was received first).
+        '''
+        if not numbits:
+            return
+        self.transfers += 1
+        tobits = '{0:0{1}b}'.format
+        tdo = self.chain.run(tobits(tms, numbits)[::-1], tobits(tdi, numbits)[::-1])
+        if usetdo:
+            numbytes = (numbits + 7) / 8
+            return unhexlify('%0*x' % (2 * numbytes, int(tdo[::-1], 2)))[::-1]
+
+    def xfer_bin(self, tms, tdi, numbits, usetdo, int=int, hexlify=hexlify,
+                        string_at=string_at, addressof=addressof):
+        '''  Passed tms as an integer and tdi as a ctypes structure.
+        '''
+        if not numbits:
+            return
+        tdi = int(hexlify(string_at(addressof(tdi), (numbits + 7) / 8)[::-1]), 16)
+        return self.xfer_ints(tms, tdi, numbits, usetdo)
+
+__all__ = 'Jtagger showdevs'.split()
@@ -0,0 +1,216 @@
+'''
+This module simulates a LEON3 system for the sim cable:  the AHB
+JTAG debug link (the cmdi/datai protocol that leon3/jtag_ahb.py
+uses), a DSU with the registers from leon3/dsuregs.py, and RAM.
+
+Put "leon3" in the sim cable's chain description to get one.  The
+device has the IDCODE and instructions of the first entry in
+tools/leon3/example_id.txt, so that file can be used as the LEON
+JTAG ID file.
+
+The processor does not execute anything.  Once it is told to run
+(by clearing the break bit in the DSU break register), it reports
+a "ta 1" software trap after run_polls reads of the DSU control
+register, which is enough to time the GDB continue/stop loop.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+
+from .chain import SimDevice
+from ...leon3.dsuregs import DSU
+
+class Ram(object):
+    ''' Sparse 32 bit wide RAM, kept in 1 KB pages.  Bytes and
+        halfwords are in the word lanes (big-endian), as on the AHB.
+    '''
+    def __init__(self):
+        self.pages = {}
+
+    def read(self, addr):
+        page = self.pages.get(addr >> 10)
+        return page[(addr >> 2) & 255] if page is not None else 0
+
+    def write(self, addr, value, mask=0xFFFFFFFF):
+        page = self.pages.get(addr >> 10)
+        if page is None:
+            page = self.pages[addr >> 10] = 256 * [0]
+        index = (addr >> 2) & 255
+        page[index] = (page[index] & ~mask) | (value & mask)
+
+class SimDsu(object):
+    ''' The parts of the DSU that do more than hold a value.
+        Everything else in the DSU address space is RAM.
+        Only whole words are written to the special registers.
+    '''
+    # Cache configuration (read through ASI 2):  one 4 KB way, 16 byte lines
+    cache_cfg = (2 << 20) | (2 << 16)
+    asr17 = 7 | (2 << 5)    # 8 register windows, 2 watchpoints
+    run_polls = 3
+    trap = 0x81
+
+    def __init__(self, baseaddr):
+        self.baseaddr = baseaddr
+        self.ram = Ram()
+        self.control = 0
+        self.debug = False      # In debug mode
+        self.halted = False
+        self.breaknow = False
+        self.polls = 0
+        self.polls_left = 0
+        offsets = dict((name, getattr(DSU, name).offset)
+                        for name in 'Control Break Trap ASR17 ASI'.split())
+        self.offsets = offsets
+        self.handlers = {
+            offsets['Control']: (self.read_control, self.write_control),
+            offsets['Break']: (self.read_break, self.write_break),
+            offsets['ASR17']: (lambda: self.asr17, None),
+        }
+        self.asi_area = DSU.ASIRAM.offset, DSU.ASIRAM.offset + DSU.ASIRAM.size
+        self.asi_cfg = dict((DSU.ASI2.offset + getattr(DSU.ASI2, x).offset, self.cache_cfg)
+                        for x in ('ICFG', 'DCFG'))
+
+    def read_control(self):
+        ''' Reading the control register while the processor
+            is running lets it run a bit more.
+        '''
+        if not self.debug:
+            self.polls += 1
+            self.polls_left -= 1
+            if self.polls_left <= 0:
+                self.stop()
+        ctl = DSU.Control
+        return (self.control | (1 << ctl.EE) | (self.debug << ctl.DM) |
+                (self.halted << ctl.HL))
+
+    def write_control(self, value):
+        ctl = DSU.Control
+        self.control = value & 0x3F
+        if value & (1 << ctl.PE):
+            self.halted = False
+        if value & (1 << ctl.HL):
+            self.halted = self.debug = True
+
+    def read_break(self):
+        return self.ram.read(self.offsets['Break']) & ~1 | self.breaknow
+
+    def write_break(self, value):
+        self.ram.write(self.offsets['Break'], value)
+        self.breaknow = value & 1
+        if self.breaknow:
+            self.debug = True
+        elif not self.halted:
+            self.debug = False
+            self.polls_left = self.run_polls
+
+    def stop(self):
+        self.debug = True
+        self.ram.write(self.offsets['Trap'], self.trap << 4)
+
+    def offset(self, addr):
+        ''' Return the address in the RAM for a DSU address.
+            The diagnostic area is accessed with the ASI
+            from the ASI register.
+        '''
+        offset = addr - self.baseaddr
+        start, stop = self.asi_area
+        if start <= offset < stop:
+            asi = self.ram.read(self.offsets['ASI']) & 0xFF
+            offset = (asi << 24) | (offset - start) | (1 << 32)
+        return offset
+
+    def read(self, addr):
+        offset = self.offset(addr)
+        handler = self.handlers.get(offset)
+        if handler is not None:
+            return handler[0]()
+        if offset in self.asi_cfg:
+            return self.asi_cfg[offset]
+        return self.ram.read(offset)
+
+    def write(self, addr, value, mask):
+        offset = self.offset(addr)
+        handler = self.handlers.get(offset)
+        if handler is not None:
+            if handler[1] is not None:
+                handler[1](value)
+        elif offset not in self.asi_cfg:
+            self.ram.write(offset, value, mask)
+
+class SimAhb(object):
+    ''' The AHB bus:  a DSU, and RAM everywhere else.
+        Counts the reads and writes.
+    '''
+    def __init__(self, dsu_addr):
+        self.ram = Ram()
+        self.dsu = SimDsu(dsu_addr)
+        self.dsu_range = dsu_addr, dsu_addr + DSU.size
+        self.reads = self.writes = 0
+
+    def target(self, addr):
+        start, stop = self.dsu_range
+        return self.dsu if start <= addr < stop else self.ram
+
+    def read(self, addr):
+        self.reads += 1
+        return self.target(addr).read(addr & ~3)
+
+    def write(self, addr, value, size):
+        self.writes += 1
+        shift = 8 * (4 - size - (addr & 3))
+        mask = ((1 << (8 * size)) - 1) << shift
+        self.target(addr).write(addr & ~3, value, mask)
+
+class SimLeon3(SimDevice):
+    ''' The LEON3 AHB JTAG debug link.  The command register
+        holds a 32 bit address, a 2 bit size and a write bit.
+        The data register holds 32 bits of data and a sequential
+        bit.  Updating the command register starts a read (if it
+        is not a write).  Updating the data register does a write
+        (for a write command), and if the sequential bit is set,
+        moves to the next address and starts the next read.
+    '''
+    name = 'leon3'
+    idcode = 0x01040093
+    cmdi = 2
+    datai = 3
+
+    def __init__(self, dsu_addr=0x70000000):
+        SimDevice.__init__(self, self.name, self.idcode, '000001')
+        self.ahb = SimAhb(dsu_addr)
+        self.addr = self.size = self.write = self.data = 0
+
+    def dr_length(self):
+        ir = self.ir
+        if ir == self.cmdi:
+            return 35
+        if ir == self.datai:
+            return 33
+        return SimDevice.dr_length(self)
+
+    def capture_dr(self):
+        ir = self.ir
+        if ir == self.cmdi:
+            return self.addr | (self.size << 32) | (self.write << 34)
+        if ir == self.datai:
+            return self.data | (1 << 32)    # Always ready
+        return SimDevice.capture_dr(self)
+
+    def update_dr(self, value):
+        ir = self.ir
+        if ir == self.cmdi:
+            self.addr = value & 0xFFFFFFFF
+            self.size = (value >> 32) & 3
+            self.write = value >> 34
+            if not self.write:
+                self.data = self.ahb.read(self.addr)
+        elif ir == self.datai:
+            size = 1 << self.size
+            if self.write:
+                self.ahb.write(self.addr, value & 0xFFFFFFFF, size)
+            if value >> 32:
+                self.addr = (self.addr + size) & 0xFFFFFFFF
+                if not self.write:
+                    self.data = self.ahb.read(self.addr)
+        else:
+            SimDevice.update_dr(self, value)
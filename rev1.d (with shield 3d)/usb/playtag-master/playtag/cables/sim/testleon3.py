@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''
+Testcases for the simulated LEON3.  Random bus accesses are made
+through the real AHB JTAG driver on a chain with another device,
+and checked against a plain dictionary, and the GDB command
+processor is started and told to continue.
+'''
+
+import os
+import sys
+import random
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..')
+sys.path.insert(0, root)
+
+from playtag.lib.userconfig import UserConfig
+from playtag.leon3.jtag_ahb import LeonMem
+from playtag.leon3.gdbproc import CmdProcessor
+from playtag.cables.sim import Jtagger
+
+numtests = 200
+
+def makeconfig():
+    config = UserConfig()
+    config.CABLE_NAME = 'xcf04s leon3'
+    config.TEMPLATE_CACHE = None
+    config.SHOW_CHAIN = False
+    config.JTAGID_FILE = os.path.join(root, 'tools/leon3/example_id.txt')
+    config.DSU_ADDR = 0x70000000
+    config.DSU_ENABLE_ADDR = 0
+    config.AHB_RAM_ADDR = 0x40000000
+    config.AHB_RAM_SIZE = 0x10000
+    return config
+
+def run():
+    config = makeconfig()
+    cable = Jtagger(config)
+    bus = LeonMem(cable, config)
+    rand = random.Random(1)
+    expected = {}
+    base = config.AHB_RAM_ADDR
+    for i in range(numtests):
+        addr = base + rand.randrange(0, 4096)
+        count = rand.choice((1, 1, 3, 16, 300))
+        data = [rand.getrandbits(8) for x in range(count)]
+        bus.writebyte(addr, data)
+        for offset, value in enumerate(data):
+            expected[addr + offset] = value
+        addr = base + rand.randrange(0, 4096)
+        count = rand.choice((1, 2, 9, 40, 600))
+        data = [expected.get(addr + x, 0) for x in range(count)]
+        assert bus.readbyte(addr, count) == data, i
+        assert bus.readstring(addr, count) == ''.join('%02x' % x for x in data), i
+    leon = cable.chain.devices[1]
+    assert leon.ahb.writes and leon.ahb.reads
+
+def run_gdb():
+    config = makeconfig()
+    cable = Jtagger(config)
+    processor = CmdProcessor(LeonMem(cable, config), config)
+    dsu = cable.chain.devices[1].ahb.dsu
+    processor.write_console = lambda line: None
+    poll = processor('c')
+    polls = 1
+    while callable(poll):
+        poll = poll()
+        polls += 1
+    assert poll == 'S05' and polls == dsu.run_polls and dsu.debug, (poll, polls)
+    registers = processor('g')
+    assert len(registers) == 72 * 8 and registers[64*8:65*8] == '00000000'
+
+if __name__ == '__main__':
+    run()
+    run_gdb()
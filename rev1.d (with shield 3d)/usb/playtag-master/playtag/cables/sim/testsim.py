@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''
+Testcases for the simulated cable.  Random clocks are run through
+the chain simulator and checked against a simple model that
+simulates one clock at a time, and chain discovery and register
+access are checked through each template converter.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+from playtag.lib.userconfig import UserConfig
+from playtag.jtag.states import states as jtagstates
+from playtag.jtag.template import JtagTemplate, TDIVariable
+from playtag.jtag.discover import Chain
+from playtag.cables.sim.chain import SimChain
+from playtag.cables.sim import Jtagger
+
+numtests = 200
+parts = 'xc3s500e noid:5 0x1234567f:6 xcf04s'
+
+def reference(chain, tms, tdi):
+    ''' Clock the chain one bit at a time.
+    '''
+    devices = chain.devices
+    tdo = []
+    state = chain.state
+    for tmsbit, tdibit in zip(tms, tdi):
+        if state.shifting:
+            bits = chain.value | (int(tdibit) << chain.length)
+            tdo.append(str(bits & 1))
+            chain.value = bits >> 1
+        else:
+            tdo.append('1')
+        state = state[int(tmsbit)]
+        if state != chain.state or state == jtagstates.reset:
+            chain.enter(state)
+        chain.state = state
+    return ''.join(tdo)
+
+def randbits(rand, numbits):
+    ''' Random bits, in runs of random length.
+    '''
+    result = []
+    while len(result) < numbits:
+        result.extend(rand.choice('01') * rand.choice((1, 1, 2, 3, 8, 40)))
+    return ''.join(result[:numbits])
+
+def run():
+    for index in range(numtests):
+        rand = random.Random(index)
+        fast, slow = SimChain(parts), SimChain(parts)
+        for i in range(5):
+            numbits = rand.randint(1, 300)
+            tms = randbits(rand, numbits)
+            tdi = '{0:0{1}b}'.format(rand.getrandbits(numbits), numbits)
+            assert fast.run(tms, tdi) == reference(slow, tms, tdi), index
+            assert fast.state == slow.state, index
+            assert fast.value == slow.value, index
+            assert [vars(x) for x in fast.devices] == [vars(x) for x in slow.devices], index
+        assert fast.tcks > 0 and slow.tcks == 0
+
+def run_cable():
+    var = TDIVariable()
+    for converter in ('strings', 'ints', 'bin'):
+        config = UserConfig()
+        config.TEMPLATE_CACHE = None
+        config.TEMPLATE_CONVERTER = converter
+        config.CABLE_NAME = parts
+        cable = Jtagger(config)
+        chain = Chain(cable)
+        assert [x.idcode for x in chain] == [x.idcode for x in cable.chain.devices]
+        assert [len(x.ir_capture) for x in chain] == [6, 5, 6, 8]
+        tcks, transfers = cable.tcks, cable.transfers
+
+        # Write a user register on one device, and the IDCODE on another
+        write = JtagTemplate(cable, bypass_info=chain[2].bypass_info)
+        write.writei(6, 5).writed(32, var)
+        read = JtagTemplate(cable, bypass_info=chain[2].bypass_info)
+        read.writei(6, 5).readd(32)
+        idcode = JtagTemplate(cable, bypass_info=chain[3].bypass_info)
+        idcode.writei(8, 1).readd(32)
+        write([0x89abcdef])
+        assert [x.regs for x in cable.chain.devices] == [{}, {}, {5: 0x89abcdef}, {}]
+        assert list(read()) == [0x89abcdef]
+        assert list(idcode()) == [cable.chain.devices[3].idcode]
+        assert cable.transfers == transfers + 3
+        assert cable.tcks > tcks
+
+def run_long():
+    ''' A long scan through the user registers of two devices.
+    '''
+    chain = SimChain('xc3s500e xcf04s')
+    numbits = 1 << 20
+    data = '{0:0{1}b}'.format(random.Random(1).getrandbits(numbits), numbits)
+    # Reset, go to shift_ir, and load instruction 5 into both devices
+    tms = '11111' + '01100' + '0' * 13 + '1'
+    tdi = '0' * 10 + '10100000' + '101000'
+    assert chain.run(tms, tdi) and chain.state == jtagstates.exit1_ir
+    tdo = chain.run('1100' + '0' * (numbits - 1) + '11', '0000' + data + '0')
+    assert chain.state == jtagstates.update_dr
+    assert tdo[4:68] == 64 * '0' and tdo[68:-1] == data[:-64]
+    assert [x.regs for x in chain.devices] == [{5: int(data[-32:][::-1], 2)},
+                                               {5: int(data[-64:-32][::-1], 2)}]
+
+if __name__ == '__main__':
+    run()
+    run_cable()
+    run_long()
@@ -12,11 +12,14 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 
 import re
+import time
 import select
 import socket
 import SocketServer
 import collections
 
+from ..lib.tracer import tracer
+
 splitter = re.compile(r"(^[^$#\03+-]*[\03+-]|\$[^#]*#..|#..)").split
 calcsum = lambda x: sum((ord(x) for x in x), 0) % 256
 
@@ -45,6 +48,13 @@ def lowlevel(read, write, cmdprocess, poll_ms=20,
 
     cmdprocess.async_send = send
 
+    # When tracing, record a span for each packet and command
+    process = cmdprocess
+    trace = tracer.enabled
+    if trace:
+        process = tracer.traced_command(cmdprocess)
+    started = None
+
     line = ''
     maxread = cmdprocess.maxread
     pollfunc = None
@@ -96,8 +106,11 @@ def lowlevel(read, write, cmdprocess, poll_ms=20,
                 if not ok:
                     continue
                 # Stop polling (if we were) and process the packet
+                if trace:
+                    started = time.time()
+                    packetinfo = dict(cmd=data[:1], length=len(data))
                 pollfunc = pollfunc and pollfunc(2) and None
-                data = cmdprocess(data)
+                data = process(data)
 
         # Poll the command processor if necessary
         if polling is not None:
@@ -113,9 +126,12 @@ def lowlevel(read, write, cmdprocess, poll_ms=20,
 
         # Take returned data, and make it a poll func, or send it on
         if callable(data):
-            pollfunc = data
+            pollfunc = tracer.traced(data, 'poll', 'poll') if trace else data
         else:
             send(data)
+        if started is not None:
+            tracer.add('packet', 'packet', started, packetinfo)
+            started = None
 
 def logger(what):
     print what
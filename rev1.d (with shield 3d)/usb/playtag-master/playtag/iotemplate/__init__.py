@@ -18,13 +18,27 @@ templates, but there are no real rules on where that code goes -- if a cable
 is so weird that its functions won't be useful for any other cable, that code
 could go in the cable-specific directory.
 
-Currently, the file 'stringconvert.py' resides in this directory.  It can
-handle the current template conversion for digilent cables, and handles a
-lot of the template conversion for FTDI cables.
+Currently, the files 'stringconvert.py', 'intconvert.py' and 'binconvert.py'
+reside in this directory.  They handle the template conversion for digilent
+cables, and handle a lot of the template conversion for FTDI cables.
+'diskcache.py' keeps compiled templates around between runs,
+'bitruns.py' holds the run-length TMS representation used by IOTemplate,
+and 'transaction.py' combines several template calls into one transfer.
 
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
+import hashlib
+import collections
+import weakref
+import itertools
+from .bitruns import BitRuns
+from .counters import counters
+
+# Compiled device templates, keyed by (id(cable), fingerprint).
+# Structurally identical templates share a single device template.
+# The entries go away when no template is using them any more.
+interned = weakref.WeakValueDictionary()
 
 class TDIVariable(object):
     ''' TDIVariable is a place-holder for TDI bits that are supplied
@@ -40,6 +54,8 @@ class TDIVariable(object):
     '''
     def __init__(self, index=0):
         self.index = index
+    def __repr__(self):
+        return 'TDIVariable(%d)' % self.index
 
 class IOTemplate(object):
     ''' The default template uses JTAG-specific identifiers for internal
@@ -51,7 +67,8 @@ class IOTemplate(object):
 
         Variable attributes:
 
-            tms -- A list of integer 1 and 0 values, one per clock
+            tms -- A BitRuns instance holding integer 1 and 0 values,
+                   one per clock, stored as runs of identical values
             tdi -- A list of two different kinds of items:
                      - strings of ones and zeros
                           - output to the device rightmost character first
@@ -61,8 +78,17 @@ class IOTemplate(object):
                      - number of bits to retrieve
             prevread -- starting position of last tuple in tdo list
             devtemplate -- Device-specific template
+            devkey -- Structural fingerprint used to look up devtemplate
             loopstack -- used for building up a template by looping
                          back using loop() and endloop()
+            loops -- a list of (clock, tdi index, tdo index, body, count)
+                     tuples, one for each repeated section of the template.
+                     The body is a template (which can have its own loops)
+                     that starts at the given clock and tdi/tdo list
+                     indices, and is repeated count times.  This lets the
+                     cable compile the body once.
+            batches -- repeated versions of the template used by apply_many(),
+                       for the last max_batches batch sizes
 
         Note:  tdo entries are maintained with offsets from previous
                entries to make it easier to splice templates together.
@@ -70,8 +96,12 @@ class IOTemplate(object):
     prevread = 0          # Location of previous read
     devtemplate = None    # Translated device-specific template
                           # Clear this when modifying the object
+    devkey = None         # Fingerprint of template at translation time
+    batches = None        # Repeated templates for apply_many, by (devkey, count)
+    max_batches = 8       # Number of batch sizes to keep
 
     loopstack = None      # Nothing on the loop stack to start with
+    loops = ()            # No repeated sections
 
     def __init__(self, cable=None, cmdname='', **kwds):
         ''' Initialize all our data.  cmdname is just for debugging.
@@ -79,7 +109,7 @@ class IOTemplate(object):
         '''
         self.cable=cable
         self.cmdname = cmdname
-        self.tms = []
+        self.tms = BitRuns()
         self.tdi = []
         self.tdo = []
         self.protocol_init(kwds)
@@ -95,11 +125,12 @@ class IOTemplate(object):
         ''' Make a copy of the instance.
         '''
         new = type(self)(self.cable, self.cmdname)
-        new.tms = list(self.tms)
+        new.tms = self.tms.copy()
         new.tdi = list(self.tdi)
         new.tdo = list(self.tdo)
         new.prevread = self.prevread
         new.loopstack = self.loopstack
+        new.loops = list(self.loops)
         return self.protocol_copy(new)
     def protocol_copy(self, new):
         ''' To be overridden by protocol-specific subclass
@@ -149,14 +180,43 @@ class IOTemplate(object):
             tdi strings.  This is used by the loop/endloop
             construct.
         '''
+        if not other.tms:
+            return self.copy()
+        return self.concat(other).protocol_add(other)
+    def protocol_add(self, other):
+        ''' To be overridden by protocol-specific subclass
+        '''
+        return self
+
+    def join(self, other):
+        ''' Return a new object that runs this template and
+            then the other one.  Unlike addition, the other
+            template does not have to start where this one
+            ends, as long as it will work from there.  This
+            is used by cable transactions.
+        '''
+        return self.concat(other).protocol_join(other)
+    def protocol_join(self, other):
+        ''' To be overridden by protocol-specific subclass
+        '''
+        return self
+
+    def concat(self, other):
+        ''' Return a copy of this template with the tms, tdi
+            and tdo of the other one added, without any
+            protocol-specific checks or processing.
+        '''
         self = self.copy()
         tms, tdi, tdo = self.tms, self.tdi, self.tdo
         otms, otdi, otdo = other.tms, other.tdi, other.tdo
-        if not otms:
-            return self
         if tdi and otdi and isinstance(tdi[-1], str) and isinstance(otdi[0], str):
             tdi[-1] = otdi[0] + tdi[-1]
             otdi = otdi[1:]
+            self.loops = []     # The tdi indices no longer line up
+        elif other.loops:
+            tmslen, tdilen, tdolen = len(tms), len(tdi), len(tdo)
+            self.loops.extend((clock + tmslen, tdiindex + tdilen, tdoindex + tdolen, body, count)
+                    for (clock, tdiindex, tdoindex, body, count) in other.loops)
         tdi += otdi
         if otdo:
             otdo = list(otdo)
@@ -166,26 +226,72 @@ class IOTemplate(object):
             tdo += otdo
             self.prevread = len(tms) + other.prevread
         tms += otms
-        return self.protocol_add(other)
-    def protocol_add(self, other):
-        ''' To be overridden by protocol-specific subclass
-        '''
         return self
 
+    def tail(self, tdiindex):
+        ''' Return a new instance with the tdi records from
+            tdiindex on, and the tms and tdo that go with them.
+            No loop can start before the first tdi record that
+            is kept.  Protocol-specific information is not
+            copied.
+        '''
+        clock = sum(numbits for (numbits, value) in self.tdi[:tdiindex])
+        new = type(self)(self.cable, self.cmdname)
+        new.tms = self.tms.section(clock, len(self.tms))
+        new.tdi = self.tdi[tdiindex:]
+        tdo = new.tdo
+        tdoindex = 0
+        start = prevread = 0
+        for offset, numbits in self.tdo:
+            start += offset
+            if start < clock:
+                tdoindex += 1
+                continue
+            tdo.append((start - clock - prevread, numbits))
+            prevread = start - clock
+        new.prevread = prevread
+        new.loops = [(loopclock - clock, loopindex - tdiindex, looptdo - tdoindex, body, count)
+                        for (loopclock, loopindex, looptdo, body, count) in self.loops]
+        assert min([x[1] for x in new.loops] or [0]) >= 0, self.loops
+        return new
+
     def __mul__(self, multiplier):
         ''' Return a new instance that is the current instance
             multiplied by a constant.
 
             This is used by the loop/endloop construct.
         '''
+        result = self.repeat(multiplier)
+        if multiplier < 2:
+            return result
+        return result.protocol_mul(multiplier)
+    def protocol_mul(self, multiplier):
+        ''' To be overridden by protocol-specific subclass
+        '''
+        return self
+
+    # As with strings, addition is not commmutative, but multiplication is.
+    __rmul__ = __mul__
+
+    def repeat(self, multiplier):
+        ''' Return a new instance with the tms, tdi, and tdo
+            of the current instance repeated, without any
+            protocol-specific checks or processing.
+
+            The repeated section is recorded in the loops
+            list of the new instance.
+        '''
         assert multiplier >= 0 and int(multiplier) == multiplier, multiplier
         if multiplier == 0:
             return type(self)(self.cable)
-        self = self.copy()
-        tms, tdi, tdo = self.tms, self.tdi, self.tdo
+        body = self.copy()
         if multiplier == 1:
-            return self
+            return body
+        self = body.copy()
+        tms, tdi, tdo = self.tms, self.tdi, self.tdo
+        self.loops = [(0, 0, 0, body, multiplier)]
         if tdi and isinstance(tdi[-1], str) and isinstance(tdi[0], str):
+            self.loops = []     # The tdi indices will not line up
             tdilast = tdi.pop()
             if tdi:
                 tdi2 = list(tdi)
@@ -204,28 +310,138 @@ class IOTemplate(object):
             tdo += (multiplier-1) * tdo2
             self.prevread += (multiplier-1) * len(tms)
         tms *= multiplier
-        return self.protocol_mul(multiplier)
-    def protocol_mul(self, multiplier):
-        ''' To be overridden by protocol-specific subclass
-        '''
         return self
 
-    # As with strings, addition is not commmutative, but multiplication is.
-    __rmul__ = __mul__
+    def fingerprint(self, repr=repr):
+        ''' Return a string that uniquely identifies the structure
+            of the template (tms, tdi and tdo, and anything else
+            the protocol adds).  Two templates with the same
+            fingerprint compile to the same device template.
+        '''
+        digest = hashlib.sha1(repr(self.tms))
+        digest.update(repr(self.tdi))
+        digest.update(repr(self.tdo))
+        self.protocol_fingerprint(digest)
+        return digest.hexdigest()
+
+    def protocol_fingerprint(self, digest):
+        ''' To be overridden by protocol-specific subclass.
+            Adds anything else that protocol_optimize() depends
+            on to the fingerprint digest.
+        '''
+        pass
+
+    def intern(self, interned=interned):
+        ''' Return the device template for this template's
+            structure, making it with the cable if no other
+            template with the same structure is using one.
+            A shared device template is counted under this
+            template's cmdname.
+        '''
+        cable = self.cable
+        self.devkey = fingerprint = self.fingerprint()
+        key = id(cable), fingerprint
+        devtemplate = interned.get(key)
+        if devtemplate is None:
+            devtemplate = interned[key] = cable.make_template(self.protocol_optimize())
+        return counters.renamed(devtemplate, self.cmdname)
+
+    def protocol_optimize(self):
+        ''' To be overridden by protocol-specific subclass.
+            Returns the template to give to the cable -- either
+            this template or an equivalent one that is faster.
+        '''
+        return self
 
     def __call__(self, *tdi):
         ''' Calling the object will pass the template to the underlying
             cable driver object.  We ask the cable driver to make a
             cable-specific version of the template, which we then cache.
+            (Or, if another template with the same structure has already
+            been translated, we share its cable-specific template.)
             On subsequent calls we only have to apply the template.
 
             The function is passed a list of tdi elements to apply
             the template to, and if the template had any tdo elements
             in it, the function will return an iterable for the tdo
             data.
+
+            Inside a cable transaction, the call is added to the
+            transaction instead (see transaction.py).
+
+            A plain template can drive the TAP anywhere, so if the
+            cable is tracking its TAP, the state is forgotten.
+            (JtagTemplate records the state its calls leave.)
         '''
+        invalidate = getattr(self.cable, 'invalidate_tap', None)
+        if invalidate is not None:
+            invalidate()
+        return self.send(*tdi)
+
+    def send(self, *tdi):
+        ''' Pass the call to the cable, or add it to the
+            cable's transaction.  See __call__().
+        '''
+        session = getattr(self.cable, 'session', None)
+        if session is not None:
+            return session.add(self, tdi)
         devtemplate = self.devtemplate
         if devtemplate is None:
-            devtemplate = self.devtemplate = self.cable.make_template(self)
+            devtemplate = self.devtemplate = self.intern()
             self.apply_template = self.cable.apply_template
         return self.apply_template(devtemplate, tdi)
+
+    def apply_many(self, tdi_list, chain=itertools.chain, islice=itertools.islice):
+        ''' Apply the template once for each tuple of tdi streams
+            in tdi_list, in as few cable transfers as the cable's
+            max_tcks allows (a single one if it has no limit).
+            (Every tuple must have the same number of streams.)
+
+            This builds (and keeps, for the last max_batches sizes
+            used) a template that is the current template repeated
+            once per tuple in a transfer, and calls it with the tdi
+            streams concatenated.  If the template has tdo elements,
+            a generator is returned that yields one tdo iterable per
+            tuple in tdi_list.
+        '''
+        tdi_list = list(tdi_list)
+        count = len(tdi_list)
+        self.devkey = self.fingerprint()
+        size = count
+        max_tcks = getattr(self.cable, 'max_tcks', None)
+        if max_tcks is not None and len(self.tms) * count > max_tcks:
+            size = max_tcks // max(len(self.tms), 1)
+        size = max(size, 1)
+        tdo = [self.apply_batch(tdi_list[x:x + size]) for x in xrange(0, count, size)]
+        if not self.tdo:
+            return None
+        tdo = chain.from_iterable(x for x in tdo if x is not None)
+        numwords = len(self.tdo)
+        return (iter(list(islice(tdo, numwords))) for i in xrange(count))
+
+    def apply_batch(self, tdi_list, chain=itertools.chain):
+        ''' Apply the template once for each tuple of tdi streams
+            in tdi_list, in a single cable transfer.  Used by
+            apply_many().
+        '''
+        count = len(tdi_list)
+        batches = self.batches
+        if batches is None:
+            batches = self.batches = collections.OrderedDict()
+        key = self.devkey, count
+        batch = batches.pop(key, None)
+        if batch is None:
+            batch = self.repeat(count).protocol_batch(self, count)
+            if len(batches) >= self.max_batches:
+                batches.popitem(last=False)
+        batches[key] = batch
+        tdi = [list(chain.from_iterable(x)) for x in itertools.izip(*tdi_list)]
+        return batch(*tdi)
+
+    def protocol_batch(self, original, count):
+        ''' To be overridden by protocol-specific subclass.
+            Called on the result of original.repeat(count) to make
+            sure that it is legal to run the original template
+            back to back.
+        '''
+        return self
@@ -11,8 +11,42 @@ this task, but is not complete.
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
-import re
+import string
 from ..iotemplate import TDIVariable
+from .diskcache import TemplateCache
+from .profiler import profiler
+from .counters import counters
+from .transaction import Transaction
+from .recorder import RecordingDriver, RecorderDefaults
+from ..jtag.tapstate import TapState, TapStateDefaults
+from ..jtag.chaincache import ChainCache
+from ..lib.iothread import IOThread, IOThreadDefaults
+from ..lib.tracer import tracer
+from ..lib.userconfig import flag
+
+def bitplan(fields, runs):
+    ''' Given a list of (numbits, key) fields in the order
+        the application supplies them, and a list of
+        (offset, numbits) runs of variable bits in the
+        transaction (earliest first), yield a list of
+        (key, fieldshift, numbits, offset) pieces that
+        describe where each piece of each field goes.
+    '''
+    runs = iter(runs)
+    offset = length = 0
+    for numbits, key in fields:
+        shift = 0
+        while numbits:
+            if not length:
+                offset, length = runs.next()
+            take = min(numbits, length)
+            yield key, shift, take, offset
+            shift += take
+            offset += take
+            length -= take
+            numbits -= take
+    for offset, length in runs:
+        assert not length, (offset, length)
 
 class BaseXString(object):
     ''' This class contains code to help compile device-independent template
@@ -32,9 +66,54 @@ class BaseXString(object):
              functions to call to send/receive data from the driver.
           4) Finally, the template is applied (possibly multiple times) to
              send/receive data.
+
+        Stages 1 and 2 are run separately on each section of the template
+        between loops, and once on the body of each loop (unless the
+        customization context at the end of the body differs from the one
+        at the start).  The results are then concatenated and replicated.
     '''
 
-    x_splitter = re.compile('(x+)').split
+    def x_spans(self, xstring, x_only=string.maketrans('01', '**')):
+        ''' Return a list of (start, stop) indices of the runs of
+            'x' in an xstring.  This uses str.find rather than
+            looking at each character in Python (or a regular
+            expression), so the cost depends mostly on the number
+            of variable fields, not on the length of the string.
+        '''
+        find = xstring.translate(x_only).find
+        spans = []
+        start = find('x')
+        while start >= 0:
+            stop = find('*', start)
+            if stop < 0:
+                stop = len(xstring)
+            spans.append((start, stop))
+            start = find('x', stop)
+        return spans
+
+    def x_splitter(self, xstring):
+        ''' Split an xstring into a list of alternating constant
+            and variable ('x') strings.  The first and last strings
+            are constant (and possibly empty).
+        '''
+        strings = []
+        prev = 0
+        for start, stop in self.x_spans(xstring):
+            strings.append(xstring[prev:start])
+            strings.append(xstring[start:stop])
+            prev = stop
+        strings.append(xstring[prev:])
+        return strings
+
+    def x_runs(self, xstring):
+        ''' Return a list of (offset, numbits) runs of 'x' in an
+            xstring, with the offset counted from the rightmost
+            (earliest) character.
+        '''
+        total = len(xstring)
+        runs = [(total - stop, stop - start) for (start, stop) in self.x_spans(xstring)]
+        runs.reverse()
+        return runs
 
     def set_tdi_xstring(self, tdi_template, isinstance=isinstance, str=str, len=len, TDIVariable=TDIVariable):
         ''' Create a string of '0', '1', and 'x' based on the
@@ -54,7 +133,7 @@ class BaseXString(object):
                 if value < 0:
                     assert value == -1, value
                     value = (1 << numbits) - 1
-                value = '{0:0{1}b}'.format(value, numbits)
+                value = '{0:0{1}b}'.format(value, numbits) if numbits else ''
             assert len(value) == numbits, (value, numbits)
             addstring(value)
         strings.reverse()
@@ -88,11 +167,128 @@ class BaseXString(object):
         self.tdo_xstring = ''.join(strings)
         assert len(self.tdo_xstring) == self.transaction_bit_length
 
-    def __init__(self, base_template, str=str):
-        self.tms_string = ''.join(str(x) for x in reversed(base_template.tms))
+    # Names of modules (other than the ones the class hierarchy is
+    # defined in) whose code affects the output of customize_template.
+    compiler_deps = ()
+
+    # Device-specific state passed from one piece of a template to
+    # the next by customize_template.  Must be hashable.
+    context = None
+
+    def customize_template(self):
+        ''' Stage 2 -- override this to modify the strings
+            for a particular device.  The strings might only be
+            a piece of the template; self.context is the state
+            of the device at the start of the piece, and should
+            be updated to the state at the end of the piece.
+        '''
+        pass
+
+    def transfer_sizes(self):
+        ''' Return the number of bytes sent to and received from
+            the cable each time the template is applied.  The
+            default assumes TMS and TDI are both sent for every
+            clock, as with the Digilent cable.
+        '''
+        numbits = self.transaction_bit_length
+        return (2 * numbits + 7) // 8, self.tdo_bits and (numbits + 7) // 8 or 0
+
+    @classmethod
+    def compile_piece(cls, tms, tdi, tdo, context):
+        ''' Run stages 1 and 2 on a section of a template that
+            has no loops in it.  Returns the strings and bit lists
+            for the section, and the context at the end of it.
+        '''
+        self = cls.__new__(cls)
+        with profiler.stage('strings'):
+            self.tms_string = tms.bitstring()
+            self.transaction_bit_length = len(tms)
+            self.set_tdi_xstring(tdi)
+            self.set_tdo_xstring(tdo)
+        self.context = context
+        with profiler.stage('customize'):
+            self.customize_template()
+        return ((self.tms_string, self.tdi_xstring, self.tdo_xstring,
+                 self.tdi_bits, self.tdo_bits), self.context)
+
+    @classmethod
+    def compile_pieces(cls, template, context, pieces):
+        ''' Compile the template in sections, appending the
+            results to pieces (in time order), and return the
+            final context.
+
+            The body of each loop in the template is only compiled
+            once for each context it is started in (usually once),
+            and the result is replicated.
+        '''
+        tms, tdi, tdo = template.tms, template.tdi, template.tdo
+        position = 0
+        readstarts = []
+        for offset, numbits in tdo:
+            position += offset
+            readstarts.append(position)
+
+        def add_flat(clock, tdiindex, tdoindex, stop, tdistop, tdostop, context):
+            if clock == stop and tdiindex == tdistop and tdoindex == tdostop:
+                return context
+            reads = [(y - x, z[1]) for (x, y, z) in
+                        zip([clock] + readstarts[tdoindex:tdostop],
+                            readstarts[tdoindex:tdostop], tdo[tdoindex:tdostop])]
+            piece, context = cls.compile_piece(tms.section(clock, stop),
+                                    tdi[tdiindex:tdistop], reads, context)
+            pieces.append(piece)
+            return context
+
+        clock = tdiindex = tdoindex = 0
+        for start, tdistart, tdostart, body, count in template.loops:
+            context = add_flat(clock, tdiindex, tdoindex, start, tdistart, tdostart, context)
+            compiled = {}
+            for i in xrange(count):
+                info = compiled.get(context)
+                if info is None:
+                    bodypieces = []
+                    nextcontext = cls.compile_pieces(body, context, bodypieces)
+                    info = compiled[context] = cls.join_pieces(bodypieces), nextcontext
+                piece, context = info
+                pieces.append(piece)
+            clock = start + count * len(body.tms)
+            tdiindex = tdistart + count * len(body.tdi)
+            tdoindex = tdostart + count * len(body.tdo)
+        return add_flat(clock, tdiindex, tdoindex, len(tms), len(tdi), len(tdo), context)
+
+    @staticmethod
+    def join_pieces(pieces, join=''.join):
+        ''' Combine a list of compiled pieces (in time order)
+            into a single piece.
+        '''
+        if len(pieces) == 1:
+            return pieces[0]
+        tms, tdi, tdo, tdi_bits, tdo_bits = zip(*reversed(pieces))
+        tdi_bits = [x for bits in reversed(tdi_bits) for x in bits]
+        tdo_bits = [x for bits in reversed(tdo_bits) for x in bits]
+        return join(tms), join(tdi), join(tdo), tdi_bits, tdo_bits
+
+    @classmethod
+    def compile(cls, base_template):
+        ''' Run stages 1 and 2.  The instance variables
+            are then all that is needed for get_xfer_func().
+        '''
+        pieces = []
+        cls.compile_pieces(base_template, cls.context, pieces)
+        self = cls.__new__(cls)
+        info = cls.join_pieces(pieces) if pieces else ('', '', '', [], [])
+        self.tms_string, self.tdi_xstring, self.tdo_xstring, self.tdi_bits, self.tdo_bits = info
         self.transaction_bit_length = len(self.tms_string)
-        self.set_tdi_xstring(base_template.tdi)
-        self.set_tdo_xstring(base_template.tdo)
+        return self
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Rebuild a compiled instance from a copy of
+            its instance variables (e.g. from a disk cache).
+        '''
+        self = cls.__new__(cls)
+        vars(self).update(state)
+        return self
 
     @classmethod
     def mix_me_in(cls):
@@ -102,8 +298,118 @@ class BaseXString(object):
                 to/from the underlying driver object.  It is used,
                 e.g. by the digilent driver.
             '''
+            template_converter = cls
+            template_cache = None
+            iothread = None
+            session = None
+            joined_templates = None
+            tapstate = None
+            recorder = None
+            chain_cache = None
+            cable_serial = None     # Identifies the cable to the chain cache
+            max_tcks = None         # Most TCKs apply_many() puts in one transfer
             def make_template(self, base_template):
-                return cls(base_template).get_xfer_func()
+                with profiler.compiling(base_template.cmdname):
+                    converter = self.template_converter
+                    cache = self.template_cache
+                    if cache is None:
+                        compiled = converter.compile(base_template)
+                    else:
+                        compiled = cache.compile(self, converter, base_template)
+                    hastdo = bool(compiled.tdo_bits)
+                    sizes = compiled.transfer_sizes()
+                    tcks = compiled.transaction_bit_length
+                    if profiler.enabled:
+                        profiler.instrument(compiled)
+                    with profiler.stage('get_xfer_func'):
+                        func = compiled.get_xfer_func()
+                func = counters.counted(func, base_template.cmdname, tcks, *sizes)
+                func.hastdo = hastdo
+                func.cmdname = base_template.cmdname
+                return func
+            def template_config(self, UserConfig):
+                ''' Let the user pick a different converter from
+                    the cable's 'converters' dictionary, using
+                    the TEMPLATE_CONVERTER configuration option,
+                    and open the template and chain caches, and
+                    start recording transfers if RECORD_FILE is set.
+                '''
+                name = UserConfig.TEMPLATE_CONVERTER
+                if name is not None:
+                    converter = self.converters.get(name)
+                    if converter is None:
+                        UserConfig.error("Expected TEMPLATE_CONVERTER to be one of %s, not %s" %
+                                            (sorted(self.converters), repr(name)))
+                    self.template_converter = converter
+                self.template_cache = TemplateCache.open(UserConfig)
+                self.chain_cache = ChainCache.open(UserConfig)
+                profiler.configure(UserConfig)
+                tracer.configure(UserConfig)
+                UserConfig.add_defaults(IOThreadDefaults)
+                self.async_mode(UserConfig.ASYNC_IO)
+                UserConfig.add_defaults(TapStateDefaults)
+                self.track_tap(UserConfig.TRACK_TAP_STATE)
+                UserConfig.add_defaults(RecorderDefaults)
+                if UserConfig.RECORD_FILE:
+                    self.recorder = RecordingDriver(self, UserConfig.RECORD_FILE)
+            def async_mode(self, enable=True):
+                ''' Turn asynchronous template execution on or off.
+                    Turning it off waits for any queued calls.
+                '''
+                enable = flag(enable, 'ASYNC_IO')
+                iothread = self.iothread
+                if enable and iothread is None:
+                    self.iothread = IOThread()
+                elif not enable and iothread is not None:
+                    self.iothread = None
+                    iothread.stop()
+            def flush(self):
+                ''' Commit the calls in any open transaction, and
+                    wait for any queued template calls to finish.
+                '''
+                if self.session is not None:
+                    self.session.commit()
+                if self.iothread is not None:
+                    try:
+                        self.iothread.flush()
+                    except:
+                        self.invalidate_tap()
+                        raise
+            def track_tap(self, enable=True):
+                ''' Turn tracking of the TAP state between
+                    template calls on or off.
+                '''
+                if not flag(enable, 'TRACK_TAP_STATE'):
+                    self.tapstate = None
+                elif self.tapstate is None:
+                    self.tapstate = TapState()
+            def invalidate_tap(self):
+                ''' Forget the TAP state, e.g. after a TRST.
+                '''
+                if self.tapstate is not None:
+                    self.tapstate.invalidate()
+            def transaction(self):
+                ''' Return a context manager that sends the template
+                    calls made inside it as a single transfer.
+                '''
+                session = self.session
+                if session is None:
+                    joined = self.joined_templates
+                    if joined is None:
+                        joined = self.joined_templates = {}
+                    session = Transaction(self, joined)
+                return session
             def apply_template(self, template, tdi_array):
-                return template(self, tdi_array)
+                hastdo = template.hastdo
+                if profiler.enabled:
+                    template = profiler.timed(template)
+                if tracer.enabled:
+                    template = tracer.traced_template(template)
+                driver = self.recorder
+                if driver is None:
+                    driver = self
+                iothread = self.iothread
+                if iothread is None:
+                    return template(driver, tdi_array)
+                return iothread.submit(template, driver, tdi_array, hastdo)
         return BaseXMixin
@@ -4,12 +4,29 @@ drivers which expect binary data.  This module is based on stringconvert,
 but is modified to use ctypes structures for the transfer, instead
 of converting to strings and back on every I/O transaction.
 
+When the template is compiled, a ctypes union is built that has one
+bitfield for each (piece of each) variable TDI field, at the bit offset
+where the driver expects it.  The constant TDI bits are stored in a
+default image.  To apply the template, a copy of the default image is
+made, and the variable TDI data is written straight into the structure
+by the bitfield setters.  The driver can then hand the structure
+directly to the hardware.
+
+ctypes bitfields cannot straddle the underlying integer, so the union
+has two overlapping structures:  fields that start in the lower half of
+a 64 bit word go in structure 'a', and fields that start in the upper half
+go in structure 'b', which is offset by 32 bits.  Either way, a field
+can be up to 33 bits long without having to be split.
+
+TDO data is returned from the driver as a byte string, and is extracted
+the same way as for intconvert.
+
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
-from itertools import islice, izip
-import itertools
-from .stringconvert import TemplateStrings
+import ctypes
+from binascii import unhexlify
+from .intconvert import TemplateInts, bitplan
 
 
 def initial_default(AllFields, default):
@@ -24,25 +41,28 @@ def initial_default(AllFields, default):
 
 def makeunion(fieldinfo, default):
     ''' Create a union given a list of two lists of fields,
-        and a default value.
+        and a default value (a byte string).
     '''
-    bytetype = ctypes.c_uint8 * len(default)
     class FieldA(ctypes.Structure):
         _fields_ = fieldinfo[0]
     class FieldB(ctypes.Structure):
         _pack_ = 1
         _fields_ = fieldinfo[1]
+    size = max(ctypes.sizeof(FieldA), ctypes.sizeof(FieldB), len(default))
+    size += -size % 8
+    bytetype = ctypes.c_uint8 * size
     class AllFields(ctypes.Union):
         _anonymous_ = 'ab'
         _fields_ = [('a', FieldA),
                     ('b', FieldB),
                     ('bytes', bytetype),
                     ]
-    get_default = initial_default(AllFields, bytetype(*default))
-    del fieldinfo, default, bytetype, FieldA, FieldB
+    default += (size - len(default)) * '\0'
+    get_default = initial_default(AllFields, default)
+    del default
     return AllFields, get_default
 
-class BinTemplate(BaseXString):
+class BinTemplate(TemplateInts):
     ''' This class contains code to help compile device-independent template
         information into device-specific data.  This progresses in stages:
           1) First, long strings are generated for tms, tdi, and tdo.
@@ -52,12 +72,12 @@ class BinTemplate(BaseXString):
                - The only valid characters in the tdi string are '0', '1', '*', and 'x'
                - The only valid characters in the tdo string are '*' and 'x'.
              This first step is done by the BaseXString class functions.
-          2) Then, a device-specific customize_template method is called.  This
-             class expects that TMS will be consumed and the TDI and TDO strings
-             will be modified to insert commands and spacers for extra expected data.
+          2) Then, a device-specific customization may modify the tdi and
+             tdo strings (e.g. to insert commands for the FTDI MPSSE).
           3) Then the strings are examined to create ctypes class templates.
           4) Finally, the template is applied (possibly multiple times) to
-             send/receive data.
+             send/receive data.  The driver is passed the ctypes structure
+             and returns a byte string.
     '''
 
     inttype = ctypes.c_uint64
@@ -65,39 +85,30 @@ class BinTemplate(BaseXString):
     intbits = 64
     resolution = intbits / 2
 
-    def hw_fields(self, len=len):
+    def hw_fields(self):
         ''' Generate tuples of offset/length pairs based on
             cable driver dependent information from the TDI
-            string.
+            string, earliest bit first.
         '''
-        total_offset = 0
-        total_bitlen = 0
-        lengths = [len(x) for x in self.x_splitter(self.tdi_xstring)]
-        lengths.reverse()
-        for offset, bitlen in (izip(islice(lengths, 0, None, 2),
-                               izip(islice(lengths, 1, None, 2)):
-            total_offset += offset
-            yield total_offset, bitlen
-            total_offset += bitlen
-            total_bitlen += bitlen
-        assert total_offset + len(strings[0]) == len(self.tdi_xstring)
-        self.hw_bitlen = total_bitlen
-
+        runs = self.x_runs(self.tdi_xstring)
+        self.hw_bitlen = sum(x[1] for x in runs)
+        return runs
 
     def sw_fields(self, len=len):
-        ''' Generate tuples of (numbits, index, subindex) based on
+        ''' Generate tuples of (numbits, (index, subindex)) based on
             expected TDI values from higher layer when the template
             is applied.
         '''
         counts = []
+        total_bits = 0
         for numbits, index in self.tdi_bits:
             missing = index + 1 - len(counts)
             if missing:
                 counts.extend(missing * [0])
-            yield numbits, index, counts[index]
+            yield numbits, (index, counts[index])
             counts[index] += 1
             total_bits += numbits
-        self.sw_bitlen = total_bitlen
+        self.sw_bitlen = total_bits
         self.tdi_counts = counts
 
     def combine_fields(self):
@@ -115,43 +126,40 @@ class BinTemplate(BaseXString):
         '''
         intbits = self.intbits
         resolution = self.resolution
-        sw_fields = list(self.sw_fields)
-        sw_field_index = 0
-        sw_bits = 0
         hw_field_index = 0
-        for hw_offset, hw_bits in self.hw_fields:
-            while hw_bits:
-                if not sw_bits:
-                    sw_bits, sw_index, sw_subindex = sw_fields[sw_field_index]
-                    sw_field_index += 1
-                    sw_shift = 0
-                take = min(hw_bits, sw_bits, intbits - hw_offset % resolution)
+        pieces = list(bitplan(list(self.sw_fields()), self.hw_fields()))
+        assert self.hw_bitlen == self.sw_bitlen, (self.hw_bitlen, self.sw_bitlen)
+        for (sw_index, sw_subindex), sw_shift, numbits, hw_offset in pieces:
+            while numbits:
+                take = min(numbits, intbits - hw_offset % resolution)
                 hw_field_name = 'field%04d' % hw_field_index
                 hw_field_index += 1
                 yield hw_field_name, hw_offset, take, sw_index, sw_subindex, sw_shift
                 hw_offset += take
-                hw_bits -= take
-                sw_bits -= take
+                numbits -= take
                 sw_shift += take
-        assert sw_field_index == len(sw_fields)
-        assert self.hw_bitlen == self.sw_bitlen
 
     def structfields(self, fieldlists, index):
         ''' Normalize one of our fieldlists
             into a format that ctypes expects for _fields_.
+            Structure 'b' starts with a 32 bit spacer.
         '''
         inttype = self.inttype
         intbits = self.intbits
-        if index:
-            yield ('offset', halfinttype, self.resolution)
         offset = 0
+        if index:
+            yield ('offset', self.halfinttype)
+            offset = self.resolution
         dummycount = 0
+        base = offset
         for fieldname, fieldoffset, fieldbits in fieldlists[index]:
             delta = fieldoffset - offset
-            firstdummy = min(delta, -offset % intbits)
-            for dummybits in (firstdummy, delta - firstdummy):
-                if dummybits:
-                    yield 'dummy%d' % dummycount, inttype, dummybits
+            while delta:
+                dummybits = min(delta, intbits - (offset - base) % intbits)
+                yield 'dummy%d' % dummycount, inttype, dummybits
+                dummycount += 1
+                offset += dummybits
+                delta -= dummybits
             yield fieldname, inttype, fieldbits
             offset = fieldoffset + fieldbits
 
@@ -170,19 +178,17 @@ class BinTemplate(BaseXString):
         for (hw_field_name, hw_offset, numbits,
                 sw_index, sw_subindex, sw_shift) in self.combine_fields():
             convert.append((hw_field_name, sw_index, sw_subindex, sw_shift))
-            fieldsel = hw_offset & resolution
-            fieldinfo[bool(fieldsel)].append((hw_field_name, hw_offset - fieldsel, numbits))
+            fieldinfo[bool(hw_offset & resolution)].append((hw_field_name, hw_offset, numbits))
         fieldinfo = [list(self.structfields(fieldinfo, x)) for x in range(len(fieldinfo))]
-        default = self.tdi_xstring.replace('x', '0')
-        assert not len(default) % 8
-        default = [int(default[x:x+8] for x in range(len(default)-8, -1, -8)]
-        AllFields, get_default = makeunion(fieldinfo, default)
+        default = self.tdi_xstring.replace('x', '0').replace('*', '0')
+        numbytes = (len(default) + 7) / 8
+        default = numbytes and unhexlify('%0*x' % (2 * numbytes, int(default, 2)))[::-1]
+        AllFields, get_default = makeunion(fieldinfo, default or '')
 
         convert = [(getattr(AllFields, hw_field_name).__set__, sw_index, sw_subindex, sw_shift)
                        for (hw_field_name, sw_index, sw_subindex, sw_shift) in convert]
         return get_default, convert
 
-
     def get_tdi_builder(self, len=len, sum=sum):
         ''' Create a closure function that will use
             the information from setupfields() to
@@ -191,12 +197,28 @@ class BinTemplate(BaseXString):
         '''
         get_default, convert = self.setupfields()
         counts = self.tdi_counts
-        def tdi_combiner(tdi):
+        def tdi_builder(tdi, int=int):
             lengths = [len(x) for x in tdi]
             if lengths != counts and (counts or sum(lengths)):
                 raise ValueError("Expected %s TDI elements; got %s" % (counts, lengths))
             x = get_default()
             for (setter, index, subindex, shift) in convert:
-                setter(x, tdi[index][subindex] >> shift)
+                setter(x, int(tdi[index][subindex]) >> shift)
             return x
         return tdi_builder
+
+    def get_xfer_func(self):
+        numbits = self.transaction_bit_length
+        tms = numbits and int(self.tms_string, 2)
+        tdi_builder = self.get_tdi_builder()
+
+        if self.tdo_bits:
+            tdo_extractor = self.get_tdo_extractor()
+            def func(driver, tdi_array):
+                return tdo_extractor(driver.xfer_bin(tms, tdi_builder(tdi_array), numbits, True))
+        else:
+            def func(driver, tdi_array):
+                driver.xfer_bin(tms, tdi_builder(tdi_array), numbits, False)
+
+        vars(self).clear()
+        return func
@@ -0,0 +1,170 @@
+'''
+This module contains the BitRuns class, which stores a sequence of
+bits (e.g. the TMS values of a template) as a list of runs.
+
+A template used to keep one list element per clock, so a
+RUNTEST of a million clocks, or a loop that is repeated a few
+thousand times, built (and copied, and added, and multiplied)
+lists with millions of elements.  A BitRuns instance only has
+one element per run of identical bits, so the cost of building
+a template depends on the number of operations used to build
+it rather than on the number of clocks.
+
+Runs are always merged with their neighbors, so two BitRuns
+with the same bits have the same runs (and the same repr).
+
+BitRuns still behaves like a read-only list of 0 and 1 values
+(len, iteration, indexing and slicing) so that code which expects
+the old list of bits keeps working.  Code that needs speed should
+use the runs directly, or bitstring().
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import itertools
+
+class BitRuns(object):
+    ''' A sequence of bits, stored as a list of (value, count) tuples.
+    '''
+    __slots__ = 'runs', 'length'
+
+    def __init__(self, bits=()):
+        self.runs = []
+        self.length = 0
+        self.extend(bits)
+
+    def copy(self):
+        new = BitRuns()
+        new.runs = list(self.runs)
+        new.length = self.length
+        return new
+
+    def append_run(self, value, count):
+        ''' Add count copies of value to the end of the sequence.
+        '''
+        assert count >= 0, count
+        if not count:
+            return
+        self.length += count
+        runs = self.runs
+        if runs and runs[-1][0] == value:
+            count += runs.pop()[1]
+        runs.append((value, count))
+
+    def append(self, value):
+        self.append_run(value, 1)
+
+    def extend(self, bits, groupby=itertools.groupby):
+        ''' Add bits from another BitRuns, or from
+            any iterable of 0 and 1 values.
+        '''
+        if isinstance(bits, BitRuns):
+            self.extend_runs(bits.runs)
+        else:
+            self.extend_runs((value, sum(1 for x in group)) for (value, group) in groupby(bits))
+
+    def extend_runs(self, runs):
+        append_run = self.append_run
+        for value, count in runs:
+            append_run(value, count)
+
+    def section(self, start, stop):
+        ''' Return a new BitRuns with the bits from start to stop.
+        '''
+        if start == 0 and stop >= self.length:
+            return self.copy()
+        new = BitRuns()
+        position = 0
+        for value, count in self.runs:
+            end = position + count
+            if end > start:
+                if position >= stop:
+                    break
+                new.append_run(value, min(end, stop) - max(position, start))
+            position = end
+        return new
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        repeat = itertools.repeat
+        for value, count in self.runs:
+            for value in repeat(value, count):
+                yield value
+
+    def __reversed__(self):
+        repeat = itertools.repeat
+        for value, count in reversed(self.runs):
+            for value in repeat(value, count):
+                yield value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                return list(itertools.islice(self, start, stop))
+            return list(self)[index]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('BitRuns index out of range')
+        if index >= self.length // 2:
+            index -= self.length
+            for value, count in reversed(self.runs):
+                index += count
+                if index >= 0:
+                    return value
+        for value, count in self.runs:
+            index -= count
+            if index < 0:
+                return value
+
+    def __eq__(self, other):
+        if isinstance(other, BitRuns):
+            return self.runs == other.runs
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __add__(self, other):
+        return self.copy().__iadd__(other)
+
+    def __imul__(self, multiplier):
+        assert multiplier >= 0 and int(multiplier) == multiplier, multiplier
+        runs = self.runs
+        if not multiplier or not runs:
+            del runs[:]
+            self.length = 0
+        elif multiplier > 1:
+            first, last = runs[0], runs[-1]
+            if len(runs) == 1:
+                runs[0] = first[0], first[1] * multiplier
+            elif first[0] != last[0]:
+                runs *= multiplier
+            else:
+                # Merge the last run of each copy with the first run of the next
+                middle = runs[1:-1]
+                joined = first[0], first[1] + last[1]
+                runs[:] = [first] + (multiplier - 1) * (middle + [joined]) + middle + [last]
+            self.length *= multiplier
+        return self
+
+    def __mul__(self, multiplier):
+        return self.copy().__imul__(multiplier)
+
+    __rmul__ = __mul__
+
+    def bitstring(self):
+        ''' Return a string of '0' and '1' characters, with
+            the first bit as the rightmost character.
+        '''
+        return ''.join(str(value) * count for (value, count) in reversed(self.runs))
+
+    def __repr__(self):
+        return 'BitRuns(%r)' % self.runs
@@ -0,0 +1,121 @@
+'''
+This module keeps runtime counters for device templates.
+
+Every compiled device template counts the number of times it is
+called and the host time spent in those calls.  The number of TCK
+cycles and the number of USB bytes sent and received for each call
+are fixed when the template is compiled, so the totals for those
+are worked out when the counters are read.
+
+Counters are shared by all the device templates with the same
+cmdname and the same sizes, so recompiling a template (e.g. after
+it has been dropped from the intern table) does not start a new
+set of counters.  Templates with different cmdnames that share a
+device template get their own counters (see renamed()).
+
+The counters are always on.  A call costs two timer reads and two
+additions more than it would without them.  Use counters.snapshot()
+to get the totals (summed by cmdname, busiest first),
+counters.report() for a printable table, and counters.reset() to
+start over.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+from timeit import default_timer
+
+class TemplateCounters(object):
+    ''' Counters for the device templates with a given
+        cmdname and per-call sizes.
+    '''
+    __slots__ = 'cmdname', 'tcks', 'bytes_out', 'bytes_in', 'calls', 'seconds'
+
+    def __init__(self, cmdname, tcks, bytes_out, bytes_in):
+        self.cmdname = cmdname
+        self.tcks = tcks
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        self.calls = 0
+        self.seconds = 0.0
+
+class CounterTable(object):
+
+    def __init__(self):
+        self.counters = {}
+
+    def counted(self, func, cmdname, tcks, bytes_out, bytes_in, timer=default_timer):
+        ''' Return a version of a device template transfer
+            function that updates the counters.
+        '''
+        key = cmdname, tcks, bytes_out, bytes_in
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = TemplateCounters(*key)
+        def counted_func(driver, tdi_array):
+            start = timer()
+            result = func(driver, tdi_array)
+            counter.seconds += timer() - start
+            counter.calls += 1
+            return result
+        counted_func.uncounted = func
+        counted_func.sizes = tcks, bytes_out, bytes_in
+        return counted_func
+
+    def renamed(self, func, cmdname):
+        ''' Return a version of a counted device template transfer
+            function that is counted under a different cmdname,
+            for a template that shares another's device template.
+        '''
+        if getattr(func, 'cmdname', cmdname) == cmdname or not hasattr(func, 'uncounted'):
+            return func
+        result = self.counted(func.uncounted, cmdname, *func.sizes)
+        vars(result).update(vars(func))
+        result.cmdname = cmdname
+        result.shared = func    # Keeps the interned device template alive
+        return result
+
+    def reset(self):
+        for counter in self.counters.itervalues():
+            counter.calls = 0
+            counter.seconds = 0.0
+
+    def snapshot(self):
+        ''' Return a list of dictionaries, one per cmdname, with
+            the total calls, tcks, bytes_out, bytes_in and seconds,
+            and the average usec per call.  The templates that
+            have used the most time are first.
+        '''
+        totals = {}
+        for counter in self.counters.values():
+            calls = counter.calls
+            if not calls:
+                continue
+            info = totals.get(counter.cmdname)
+            if info is None:
+                info = totals[counter.cmdname] = dict(cmdname=counter.cmdname,
+                            calls=0, tcks=0, bytes_out=0, bytes_in=0, seconds=0.0)
+            info['calls'] += calls
+            info['tcks'] += calls * counter.tcks
+            info['bytes_out'] += calls * counter.bytes_out
+            info['bytes_in'] += calls * counter.bytes_in
+            info['seconds'] += counter.seconds
+        result = sorted(totals.itervalues(), key=lambda x: (-x['seconds'], x['cmdname']))
+        for info in result:
+            info['usec_per_call'] = 1e6 * info['seconds'] / info['calls']
+        return result
+
+    def report(self, count=None):
+        ''' Return a table of the templates that have used the
+            most time (all of them if count is None).
+        '''
+        lines = ['%-24s %8s %12s %12s %12s %10s %10s' % ('template', 'calls', 'TCKs',
+                    'bytes out', 'bytes in', 'total ms', 'us/call')]
+        for info in self.snapshot()[:count]:
+            lines.append('%-24s %8d %12d %12d %12d %10.1f %10.1f' % (info['cmdname'] or '(none)',
+                    info['calls'], info['tcks'], info['bytes_out'], info['bytes_in'],
+                    1000 * info['seconds'], info['usec_per_call']))
+        if len(lines) == 1:
+            lines.append('(no templates have been run)')
+        return '\n'.join(lines)
+
+counters = CounterTable()
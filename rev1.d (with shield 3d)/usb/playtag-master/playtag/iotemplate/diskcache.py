@@ -0,0 +1,200 @@
+'''
+This module contains an on-disk cache of compiled templates.
+
+Compiling a template for a cable (especially for the FTDI MPSSE) can
+take a noticeable amount of time for large templates, and the same
+templates are compiled every time a tool is started.  The cache
+stores the output of the expensive compilation stages (1 and 2 of
+BaseXString -- the customized tms/tdi/tdo strings) so that a warm
+start only has to build the transfer closures.
+
+The cache is content-addressed.  Each entry lives in its own file,
+named by a hash of:
+
+   - the template's structural fingerprint (tms/tdi/tdo, and the
+     start state of a JTAG template)
+   - the cable type
+   - the converter class
+   - the compiler version, which is a hash of the source of all the
+     modules the converter class is built from, so editing the
+     compiler automatically invalidates old entries.
+
+The total size of the cache directory is bounded.  The least recently
+used entries are removed when a new entry would exceed the limit.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import os
+import sys
+import zlib
+import hashlib
+import cPickle as pickle
+from .profiler import profiler
+
+class TemplateCacheDefaults(object):
+    TEMPLATE_CACHE = '~/.playtag/templates'    # Directory, or None to disable
+    TEMPLATE_CACHE_SIZE = 64 * 1024 * 1024     # Maximum size in bytes
+    SHOW_TEMPLATE_CACHE = True                 # Report hits/misses at startup
+
+_versions = {}
+
+def compiler_version(converter):
+    ''' Return a hash of the source of all the modules that define
+        the converter, or that its customize_template() relies on.
+    '''
+    result = _versions.get(converter)
+    if result is None:
+        modnames = [x.__module__ for x in converter.__mro__ if x is not object]
+        modnames.extend(converter.compiler_deps)
+        digest = hashlib.sha1()
+        for modname in sorted(set(modnames)):
+            fname = getattr(sys.modules[modname], '__file__', None)
+            if fname is None:
+                digest.update(modname)
+                continue
+            if fname.endswith(('.pyc', '.pyo')):
+                fname = fname[:-1]
+            f = open(fname, 'rb')
+            digest.update(f.read())
+            f.close()
+        result = _versions[converter] = digest.hexdigest()
+    return result
+
+class TemplateCache(object):
+    ''' A directory of pickled, compressed, compiled templates.
+    '''
+    suffix = '.tpl'
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = self.misses = self.stores = self.evictions = self.errors = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.entries = entries = {}
+        for fname in os.listdir(path):
+            if fname.endswith(self.suffix):
+                stat = os.stat(os.path.join(path, fname))
+                entries[fname] = stat.st_mtime, stat.st_size
+        self.size = sum(x[1] for x in entries.itervalues())
+        self.evict(maxsize)
+
+    @classmethod
+    def open(cls, UserConfig):
+        ''' Return a cache based on the user configuration,
+            or None if the cache is disabled or unusable.
+        '''
+        UserConfig.add_defaults(TemplateCacheDefaults)
+        path = UserConfig.TEMPLATE_CACHE
+        if not path:
+            return None
+        try:
+            return cls(os.path.expanduser(path), UserConfig.TEMPLATE_CACHE_SIZE)
+        except (IOError, OSError), s:
+            print "\nWarning: template cache disabled: %s\n" % s
+            return None
+
+    def key(self, cable, converter, base_template):
+        info = (base_template.devkey or base_template.fingerprint(),
+                '%s.%s' % (type(cable).__module__, type(cable).__name__),
+                '%s.%s' % (converter.__module__, converter.__name__),
+                compiler_version(converter))
+        return hashlib.sha1(repr(info)).hexdigest() + self.suffix
+
+    def compile(self, cable, converter, base_template):
+        ''' Return a compiled converter instance for the template,
+            from the cache if possible.
+        '''
+        with profiler.stage('cache'):
+            key = self.key(cable, converter, base_template)
+            state = self.load(key)
+        if state is not None:
+            self.hits += 1
+            return converter.from_state(state)
+        self.misses += 1
+        compiled = converter.compile(base_template)
+        with profiler.stage('cache'):
+            self.store(key, vars(compiled))
+        return compiled
+
+    def load(self, key):
+        if key not in self.entries:
+            return None
+        fname = os.path.join(self.path, key)
+        try:
+            f = open(fname, 'rb')
+            try:
+                state = pickle.loads(zlib.decompress(f.read()))
+            finally:
+                f.close()
+            os.utime(fname, None)
+        except Exception:
+            self.errors += 1
+            self.remove(key)
+            return None
+        self.entries[key] = os.path.getmtime(fname), self.entries[key][1]
+        return state
+
+    def store(self, key, state):
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.maxsize:
+            return
+        self.evict(self.maxsize - len(data))
+        fname = os.path.join(self.path, key)
+        tmpname = '%s.%d.tmp' % (fname, os.getpid())
+        try:
+            f = open(tmpname, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            if os.path.exists(fname):
+                os.remove(fname)
+            os.rename(tmpname, fname)
+        except (IOError, OSError):
+            self.errors += 1
+            return
+        self.remove(key, False)
+        self.entries[key] = os.path.getmtime(fname), len(data)
+        self.size += len(data)
+        self.stores += 1
+
+    def remove(self, key, delete=True):
+        info = self.entries.pop(key, None)
+        if info is not None:
+            self.size -= info[1]
+        if delete:
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+
+    def evict(self, maxsize):
+        ''' Remove the least recently used entries until
+            the cache is no larger than maxsize.
+        '''
+        if self.size <= maxsize:
+            return
+        for mtime, key in sorted((x[0], y) for (y, x) in self.entries.iteritems()):
+            self.remove(key)
+            self.evictions += 1
+            if self.size <= maxsize:
+                break
+
+    def report(self):
+        info = ['%d entries' % len(self.entries), '%d KB' % ((self.size + 1023) / 1024)]
+        if self.evictions:
+            info.append('%d evicted' % self.evictions)
+        if self.errors:
+            info.append('%d errors' % self.errors)
+        return 'Template cache %s: %d hits, %d misses (%s)' % (
+                    self.path, self.hits, self.misses, ', '.join(info))
+
+def show_report(cable, UserConfig):
+    ''' Print the cache hit/miss counts, if the cable has a cache and
+        the user wants to see it.  Tools call this after startup.
+    '''
+    cache = getattr(cable, 'template_cache', None)
+    if cache is not None and UserConfig.SHOW_TEMPLATE_CACHE:
+        print '\n%s\n' % cache.report()
@@ -0,0 +1,143 @@
+'''
+This module contains code to optimize application of I/O templates for
+drivers which expect binary data.  It is based on stringconvert, but
+instead of formatting TDI data into strings of '0' and '1' characters
+and parsing TDO data back out of them on every call, it compiles the
+template strings once into a shift/mask plan.
+
+Applying the plan only requires integer operations:
+
+   - All the TDI data is merged into a single Python integer (bit 0 is
+     the first bit sent), starting with the constant bits from the
+     template, and or-ing in the variable fields.
+   - The TDO data is returned from the driver as a little-endian
+     byte string (bit 0 of byte 0 is the first bit received), and
+     each requested word is sliced out of that.
+
+The TDI data streams passed in by the application may be any indexable
+sequence of integers, e.g. lists, array.array instances, or ctypes arrays.
+The TDO data is returned as an iterator over a list of integers.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import struct
+import itertools
+from binascii import hexlify
+from .basexstring import BaseXString, bitplan
+
+class TemplateInts(BaseXString):
+    ''' This class contains code to help compile device-independent template
+        information into device-specific data.  The first two stages are the
+        same as for TemplateStrings:
+          1) First, long strings are generated for tms, tdi, and tdo.
+          2) Then, a device-specific customization may modify the tdi and
+             tdo strings (e.g. to insert commands for the FTDI MPSSE).
+          3) Then the strings are examined to create a shift/mask plan
+             for the tdi_combiner and tdo_extractor functions.
+          4) Finally, the template is applied (possibly multiple times) to
+             send/receive data.  The driver is passed integers and returns
+             a byte string.
+    '''
+    def get_tdi_combiner(self, len=len, izip=itertools.izip):
+        ''' Create a combiner function that will merge the
+            constant and variable portions of the TDI data
+            into a single integer.
+
+            The variable pieces are merged pairwise, so the
+            cost of building a long integer is proportional
+            to the length of the integer times the log of the
+            number of pieces, rather than the product of the two.
+        '''
+        xstring = self.tdi_xstring
+        const = xstring.replace('*', '0').replace('x', '0')
+        const = const and int(const, 2) or 0
+        counts = []
+        fields = []
+        for numbits, index in self.tdi_bits:
+            missing = index + 1 - len(counts)
+            if missing:
+                counts.extend(missing * [0])
+            fields.append((numbits, (index, counts[index])))
+            counts[index] += 1
+        pieces = list(bitplan(fields, self.x_runs(xstring)))
+        plan = [(index, subindex, shift, (1 << numbits) - 1)
+                    for ((index, subindex), shift, numbits, offset) in pieces]
+        offsets = [x[3] for x in pieces]
+        first = offsets and offsets[0] or 0
+
+        # Precompute the relative shifts for each merge level
+        levels = []
+        while len(offsets) > 1:
+            levels.append([y - x for (x, y) in izip(offsets[::2], offsets[1::2])])
+            offsets = offsets[::2]
+        del fields, pieces, offsets
+
+        def tdi_combiner(tdi, int=int):
+            ''' Return one big integer with all the TDI data.
+            '''
+            lengths = [len(x) for x in tdi]
+            if lengths != counts and (counts or sum(lengths)):
+                raise ValueError("Expected %s TDI elements; got %s" % (counts, lengths))
+            if not plan:
+                return const
+            values = [(int(tdi[index][subindex]) >> shift) & mask
+                         for (index, subindex, shift, mask) in plan]
+            for shifts in levels:
+                odd = values[-1:] if len(values) & 1 else []
+                values = [x | (y << z) for (x, y, z) in izip(values[::2], values[1::2], shifts)]
+                values += odd
+            return const | (values[0] << first)
+        return tdi_combiner
+
+    def get_tdo_extractor(self, len=len, int=int, hexlify=hexlify, unpack=struct.Struct('<Q').unpack_from):
+        ''' Define a function that will extract a list of integers
+            from the TDO byte string returned by the driver.
+
+            Pieces of up to 64 bits (after alignment) are extracted
+            using struct; larger pieces are converted via hex.
+        '''
+        words = [[] for x in self.tdo_bits]
+        fields = [(x, y) for (y, x) in enumerate(self.tdo_bits)]
+        for index, shift, numbits, offset in bitplan(fields, self.x_runs(self.tdo_xstring)):
+            start = offset >> 3
+            stop = (offset + numbits + 7) >> 3
+            words[index].append((start, stop, offset & 7, (1 << numbits) - 1, shift))
+        sourcesize = (len(self.tdo_xstring) + 7) >> 3
+        simple = [x[0][:4] for x in words if len(x) == 1 and x[0][1] - x[0][0] <= 8]
+        simple = len(simple) == len(words) and [x[0::2] + x[3:] for x in simple]
+        del fields
+
+        if simple:
+            def tdo_extractor(s):
+                assert len(s) == sourcesize, (len(s), sourcesize)
+                s += '\0' * 8
+                return iter([(unpack(s, start)[0] >> shift) & mask
+                               for (start, shift, mask) in simple])
+        else:
+            def tdo_extractor(s):
+                assert len(s) == sourcesize, (len(s), sourcesize)
+                result = []
+                for pieces in words:
+                    value = 0
+                    for start, stop, shift, mask, wordshift in pieces:
+                        value |= ((int(hexlify(s[start:stop][::-1]), 16) >> shift) & mask) << wordshift
+                    result.append(value)
+                return iter(result)
+        return tdo_extractor
+
+    def get_xfer_func(self):
+        numbits = self.transaction_bit_length
+        tms = numbits and int(self.tms_string, 2)
+        tdi_combiner = self.get_tdi_combiner()
+
+        if self.tdo_bits:
+            tdo_extractor = self.get_tdo_extractor()
+            def func(driver, tdi_array):
+                return tdo_extractor(driver.xfer_ints(tms, tdi_combiner(tdi_array), numbits, True))
+        else:
+            def func(driver, tdi_array):
+                driver.xfer_ints(tms, tdi_combiner(tdi_array), numbits, False)
+
+        vars(self).clear()
+        return func
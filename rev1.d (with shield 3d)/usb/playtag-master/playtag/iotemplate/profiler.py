@@ -0,0 +1,234 @@
+'''
+This module contains a profiler for template compilation and
+application.  When it is enabled, the wall clock and CPU time of
+each stage is accumulated, keyed by the template cmdname and the
+stage name.
+
+The compile stages are:
+
+   compile         -- all of make_template() for the cable
+   cache           -- loading or storing the template cache entry
+   strings         -- BaseXString stage 1 (building the tms/tdi/tdo strings)
+   customize       -- BaseXString stage 2 (e.g. inserting MPSSE commands)
+   get_xfer_func   -- building the transfer function, which includes:
+   get_tdi_combiner, get_tdo_extractor, get_tdi_builder
+
+Every call to a template adds time to:
+
+   apply           -- the whole call, including TDI/TDO conversion
+   driver          -- just the cable driver's part of the call
+
+Profiling is turned on and off at runtime with profiler.enable().
+When it is off, the only cost when applying a template is a check
+of profiler.enabled.  It can also be turned on with the
+PROFILE_TEMPLATES configuration option; set that to True to print
+a table at exit, or to the name of a file to write JSON to at exit.
+
+Structurally identical templates share a device template, so the
+compile stages are counted under the cmdname of the first template
+that was compiled, but calls are counted under their own.  CPU
+time is for the whole process, so when templates are run on an I/O
+thread it includes time spent in other threads.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import os
+import sys
+import time
+import json
+import atexit
+
+from ..lib.userconfig import constants
+
+class ProfilerDefaults(object):
+    PROFILE_TEMPLATES = None    # True for a table at exit, or JSON file name
+
+if sys.platform == 'win32':
+    # time.clock() is wall clock time on Windows
+    def cputime(times=os.times):
+        info = times()
+        return info[0] + info[1]
+else:
+    cputime = time.clock
+
+class NullStage(object):
+    ''' Returned by TemplateProfiler.stage() when profiling is off.
+    '''
+    def __enter__(self):
+        pass
+    def __exit__(self, *exc):
+        pass
+
+nullstage = NullStage()
+
+class Stage(object):
+    ''' Context manager that adds its elapsed time to
+        the [calls, wall, cpu] totals for a key.
+    '''
+    def __init__(self, stats, key):
+        self.stats = stats
+        self.key = key
+
+    def __enter__(self):
+        self.cpu = cputime()
+        self.wall = time.time()
+
+    def __exit__(self, *exc):
+        wall = time.time() - self.wall
+        cpu = cputime() - self.cpu
+        info = self.stats.get(self.key)
+        if info is None:
+            info = self.stats[self.key] = [0, 0.0, 0.0]
+        info[0] += 1
+        info[1] += wall
+        info[2] += cpu
+
+class CompileStage(Stage):
+    ''' Times make_template(), and sets the cmdname
+        for the stages inside it.
+    '''
+    def __init__(self, profiler, cmdname):
+        Stage.__init__(self, profiler.stats, (cmdname, 'compile'))
+        self.profiler = profiler
+        self.cmdname = cmdname
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.prevname, profiler.cmdname = profiler.cmdname, self.cmdname
+        Stage.__enter__(self)
+
+    def __exit__(self, *exc):
+        Stage.__exit__(self, *exc)
+        self.profiler.cmdname = self.prevname
+
+class TimedDriver(object):
+    ''' Stands in for the cable driver when a template
+        is applied, and times the calls to the driver.
+    '''
+    def __init__(self, driver, stage):
+        self.driver = driver
+        self.stage = stage
+
+    def __call__(self, *args):
+        with self.stage:
+            return self.driver(*args)
+
+    def xfer_ints(self, *args):
+        with self.stage:
+            return self.driver.xfer_ints(*args)
+
+    def xfer_bin(self, *args):
+        with self.stage:
+            return self.driver.xfer_bin(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+class TemplateProfiler(object):
+    enabled = False
+    cmdname = ''
+    report_at_exit = None
+
+    xfer_builders = 'get_tdi_combiner', 'get_tdo_extractor', 'get_tdi_builder'
+
+    def __init__(self):
+        self.stats = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.stats = {}
+
+    def configure(self, UserConfig):
+        ''' Turn profiling on if the user asked for it,
+            and arrange for the results to be reported.
+        '''
+        UserConfig.add_defaults(ProfilerDefaults)
+        setting = UserConfig.PROFILE_TEMPLATES
+        if isinstance(setting, str):
+            setting = constants.get(setting, setting)
+        if not setting:
+            return
+        self.enable()
+        if self.report_at_exit is None:
+            atexit.register(self.exit_report)
+        self.report_at_exit = setting
+
+    def exit_report(self):
+        setting = self.report_at_exit
+        if isinstance(setting, str):
+            f = open(setting, 'wb')
+            self.dump(f)
+            f.close()
+        else:
+            print '\n%s\n' % self.report()
+
+    def stage(self, name):
+        ''' Return a context manager to time a stage
+            of the template currently being compiled.
+        '''
+        if not self.enabled:
+            return nullstage
+        return Stage(self.stats, (self.cmdname, name))
+
+    def compiling(self, cmdname):
+        ''' Return a context manager to time a call
+            to make_template() for a template.
+        '''
+        if not self.enabled:
+            return nullstage
+        return CompileStage(self, cmdname)
+
+    def instrument(self, compiled):
+        ''' Time the calls get_xfer_func() makes to build the
+            TDI and TDO functions.  The timed versions are
+            instance variables, so they go away when
+            get_xfer_func() clears the instance.
+        '''
+        stats, cmdname = self.stats, self.cmdname
+        for name in self.xfer_builders:
+            method = getattr(compiled, name, None)
+            if method is not None:
+                setattr(compiled, name, self.timed_method(method, Stage(stats, (cmdname, name))))
+
+    @staticmethod
+    def timed_method(method, stage):
+        def timed(*args, **kwds):
+            with stage:
+                return method(*args, **kwds)
+        return timed
+
+    def timed(self, func):
+        ''' Return a version of a device template transfer
+            function that records the apply and driver times.
+        '''
+        cmdname = getattr(func, 'cmdname', '')
+        stats = self.stats
+        def timed_func(driver, tdi_array):
+            with Stage(stats, (cmdname, 'apply')):
+                result = func(TimedDriver(driver, Stage(stats, (cmdname, 'driver'))), tdi_array)
+                if result is not None:
+                    result = iter(list(result))
+            return result
+        return timed_func
+
+    def results(self):
+        ''' Return a list of dictionaries, one
+            per (cmdname, stage), sorted by cmdname.
+        '''
+        return [dict(cmdname=cmdname, stage=stage, calls=calls, wall=wall, cpu=cpu)
+                   for ((cmdname, stage), (calls, wall, cpu)) in sorted(self.stats.iteritems())]
+
+    def dump(self, f):
+        json.dump(self.results(), f, indent=1, sort_keys=True)
+
+    def report(self):
+        lines = ['%-24s %-18s %8s %12s %12s' % ('template', 'stage', 'calls', 'wall (ms)', 'cpu (ms)')]
+        for info in self.results():
+            lines.append('%-24s %-18s %8d %12.3f %12.3f' % (info['cmdname'] or '(none)', info['stage'],
+                            info['calls'], 1000 * info['wall'], 1000 * info['cpu']))
+        return '\n'.join(lines)
+
+profiler = TemplateProfiler()
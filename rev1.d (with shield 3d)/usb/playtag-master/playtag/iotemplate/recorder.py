@@ -0,0 +1,229 @@
+'''
+This module records the transfers that compiled templates make
+through a cable driver to a log file, and reads them back, so that
+a session can be replayed without the cable (see cables/replay),
+and the host side of it timed on its own.
+
+Recording is turned on for any cable with the RECORD_FILE
+configuration option.  The driver is then called through a
+RecordingDriver, which logs the data sent and received on each
+transfer and when it was made.
+
+Every transfer is logged the same way, whichever converter made
+it, so a session recorded with one converter can be replayed with
+another.  There are two styles of transfer, from the two styles
+of driver interface:
+
+   JTAG   -- TMS and TDI for each clock (e.g. the digilent cable)
+   MPSSE  -- a stream of MPSSE command bytes (the ftdi cable)
+
+The log file starts with the line in 'magic', which is followed by
+a record for each transfer.  A record is a 'header' struct of:
+
+   style     -- JTAG or MPSSE
+   numbits   -- the number of clocks (JTAG) or bits in the stream (MPSSE)
+   inbits    -- the number of TDO bits received
+   start     -- the time the transfer started, in seconds from the
+                start of the log
+   duration  -- the time the driver took for the transfer, in seconds
+
+followed by the data:  the TMS bytes (only for JTAG), the TDI (or
+MPSSE stream) bytes, and the TDO bytes.  All the data is little-endian,
+with bit 0 of byte 0 sent or received first.
+
+BytesDriver is a mix-in for a cable that handles every transfer as
+bytes in this form.  It is used by the null and replay cables.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import time
+import atexit
+import struct
+from binascii import hexlify, unhexlify
+from ctypes import string_at, addressof
+
+class RecorderDefaults(object):
+    RECORD_FILE = None      # Name of a file to log all the cable transfers to
+
+magic = 'playtag transfer log 1\n'
+header = struct.Struct('<BIIdd')
+JTAG, MPSSE = 1, 2
+
+def tobytes(value, numbits, unhexlify=unhexlify):
+    numbytes = (numbits + 7) / 8
+    return unhexlify('%0*x' % (2 * numbytes, value))[::-1]
+
+def frombytes(data, hexlify=hexlify):
+    return int(hexlify(data[::-1]) or '0', 16)
+
+def string_args(*args):
+    ''' Return (style, numbits, inbits, tms, tdi) for a call
+        to a driver's __call__ method, with tms and tdi as
+        bytes.  MPSSE stream strings must already be joined.
+    '''
+    if isinstance(args[1], str):
+        tms, tdi, usetdo = args
+        numbits = len(tms)
+        if not numbits:
+            return JTAG, 0, 0, '', ''
+        return (JTAG, numbits, usetdo and numbits or 0,
+                tobytes(int(tms, 2), numbits), tobytes(int(tdi, 2), numbits))
+    tdi, numbits, rcvlen = args
+    if not numbits:
+        return MPSSE, 0, 0, '', ''
+    return MPSSE, numbits, rcvlen or 0, '', tobytes(int(tdi[0], 2), numbits)
+
+def int_args(*args):
+    ''' Return (style, numbits, inbits, tms, tdi) for a call
+        to a driver's xfer_ints method.
+    '''
+    if len(args) == 4:
+        tms, tdi, numbits, usetdo = args
+        if not numbits:
+            return JTAG, 0, 0, '', ''
+        return (JTAG, numbits, usetdo and numbits or 0,
+                tobytes(tms, numbits), tobytes(tdi, numbits))
+    tdi, numbits, rcvlen = args
+    if not numbits:
+        return MPSSE, 0, 0, '', ''
+    return MPSSE, numbits, rcvlen or 0, '', tobytes(tdi, numbits)
+
+def bin_args(*args):
+    ''' Return (style, numbits, inbits, tms, tdi) for a call
+        to a driver's xfer_bin method.
+    '''
+    if len(args) == 4:
+        tms, tdi, numbits, usetdo = args
+        if not numbits:
+            return JTAG, 0, 0, '', ''
+        return (JTAG, numbits, usetdo and numbits or 0,
+                tobytes(tms, numbits), string_at(addressof(tdi), (numbits + 7) / 8))
+    tdi, numbits, rcvlen = args
+    if not numbits:
+        return MPSSE, 0, 0, '', ''
+    return MPSSE, numbits, rcvlen or 0, '', string_at(addressof(tdi), (numbits + 7) / 8)
+
+def tdo_string(tdo, inbits):
+    ''' Return TDO bytes as a list of one string, the way
+        a driver's __call__ method returns it.
+    '''
+    return ['{0:0{1}b}'.format(frombytes(tdo) & ((1 << inbits) - 1), inbits)]
+
+class TransferLog(object):
+    ''' A log file that transfers are written to.
+    '''
+    def __init__(self, fname):
+        self.f = open(fname, 'wb')
+        self.f.write(magic)
+        self.start = time.time()
+        atexit.register(self.close)
+
+    def write(self, style, numbits, inbits, start, duration, tms, tdi, tdo):
+        self.f.write(header.pack(style, numbits, inbits, start - self.start, duration) +
+                     tms + tdi + tdo)
+
+    def close(self):
+        self.f.close()
+
+def readlog(fname):
+    ''' Return a list of the (style, numbits, inbits, start,
+        duration, tms, tdi, tdo) records in a log file.
+    '''
+    f = open(fname, 'rb')
+    data = f.read()
+    f.close()
+    if not data.startswith(magic):
+        raise ValueError('%s is not a transfer log' % repr(fname))
+    records = []
+    append = records.append
+    unpack_from, headersize = header.unpack_from, header.size
+    position, end = len(magic), len(data)
+    while position < end:
+        if position + headersize > end:
+            raise ValueError('Transfer log %s is truncated' % repr(fname))
+        style, numbits, inbits, start, duration = unpack_from(data, position)
+        position += headersize
+        outbytes = (numbits + 7) / 8
+        tmsbytes = outbytes if style == JTAG else 0
+        tdibytes = tmsbytes + outbytes
+        tdobytes = tdibytes + (inbits + 7) / 8
+        if position + tdobytes > end:
+            raise ValueError('Transfer log %s is truncated' % repr(fname))
+        append((style, numbits, inbits, start, duration, data[position:position + tmsbytes],
+                data[position + tmsbytes:position + tdibytes],
+                data[position + tdibytes:position + tdobytes]))
+        position += tdobytes
+    return records
+
+class RecordingDriver(object):
+    ''' Stands in for the cable driver when a template
+        is applied, and logs the calls to the driver.
+    '''
+    def __init__(self, driver, fname):
+        self.driver = driver
+        self.log = TransferLog(fname)
+
+    def __call__(self, *args):
+        if not isinstance(args[1], str):
+            args = [''.join(args[0])], args[1], args[2]
+        info = string_args(*args)
+        if not info[1]:
+            return self.driver(*args)
+        start = time.time()
+        tdo = self.driver(*args)
+        if tdo is not None:
+            tdo = list(tdo)
+        duration = time.time() - start
+        inbits = info[2]
+        tdobytes = tobytes(int(''.join(reversed(tdo)), 2), inbits) if inbits else ''
+        self.log.write(*(info[:3] + (start, duration) + info[3:] + (tdobytes,)))
+        return tdo
+
+    def xfer_ints(self, *args):
+        return self.logged(self.driver.xfer_ints, int_args(*args), args)
+
+    def xfer_bin(self, *args):
+        return self.logged(self.driver.xfer_bin, bin_args(*args), args)
+
+    def logged(self, method, info, args):
+        if not info[1]:
+            return method(*args)
+        start = time.time()
+        tdo = method(*args)
+        duration = time.time() - start
+        self.log.write(*(info[:3] + (start, duration) + info[3:] + (tdo if info[2] else '',)))
+        return tdo
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+class BytesDriver(object):
+    ''' Mix-in for a cable driver that handles every transfer
+        as bytes, in the form they are logged in.  It has both
+        the JTAG and the MPSSE style of driver interface, and
+        calls self.transfer(style, numbits, inbits, tms, tdi),
+        which returns the TDO bytes.
+    '''
+    def __call__(self, *args):
+        if not isinstance(args[1], str):
+            args = [''.join(args[0])], args[1], args[2]
+        style, numbits, inbits, tms, tdi = string_args(*args)
+        if numbits:
+            tdo = self.transfer(style, numbits, inbits, tms, tdi)
+            if inbits:
+                return tdo_string(tdo, inbits)
+
+    def xfer_ints(self, *args):
+        style, numbits, inbits, tms, tdi = int_args(*args)
+        if numbits:
+            tdo = self.transfer(style, numbits, inbits, tms, tdi)
+            if inbits:
+                return tdo
+
+    def xfer_bin(self, *args):
+        style, numbits, inbits, tms, tdi = bin_args(*args)
+        if numbits:
+            tdo = self.transfer(style, numbits, inbits, tms, tdi)
+            if inbits:
+                return tdo
@@ -16,7 +16,38 @@ Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 import itertools
-from .basexstring import BaseXString
+import collections
+from .basexstring import BaseXString, bitplan
+
+class TdoChunks(object):
+    ''' The TDO data from a driver that reads it from the cable
+        a chunk at a time.  This is an iterator over the chunks,
+        which are strings in the form the TDO extractor expects.
+        readchunk(start, size) is called to read each chunk, with
+        start and size in whatever units the driver likes.
+
+        Chunks are only read when the TDO extractor asks for them,
+        so the first words can be used before the last ones have
+        been read.  Before the driver starts another transfer, it
+        must call finish(), which reads the chunks that have not
+        been asked for yet and saves them.
+    '''
+    def __init__(self, readchunk, total, chunksize):
+        self.readchunk = readchunk
+        self.sizes = iter([(x, min(chunksize, total - x)) for x in xrange(0, total, chunksize)])
+        self.saved = collections.deque()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.saved:
+            return self.saved.popleft()
+        return self.readchunk(*self.sizes.next())
+
+    def finish(self):
+        readchunk = self.readchunk
+        self.saved.extend(readchunk(*x) for x in self.sizes)
 
 class TemplateStrings(BaseXString):
     ''' This class contains code to help compile device-independent template
@@ -112,63 +143,56 @@ class TemplateStrings(BaseXString):
                 yield const
         return tdi_combiner
 
-    def get_tdo_extractor_slices(self, len=len, slice=slice):
-        ''' This function is somewhat complicated by support for
-            things like the FTDI driver, where the input bits for
-            a word might not be all together.
-
-            The output of this function is two lists of slices.
-            The first list, "keep", defines the slices to keep
-            from the string coming from the driver.  These slices
-            are then concatenated together before extracting each
-            tdo value individually using the "extract" list.
-            To reduce the number of slice operations involved,
-            the "keep" list will keep returned data between valid
-            words.  In some cases, this might mean keeping all
-            the data.
-        '''
-        strings = self.x_splitter(self.tdo_xstring)
-        constbits = (len(x) for x in itertools.islice(strings, 0, None, 2))
-        varbits = (len(x) for x in itertools.islice(strings, 1, None, 2))
-        wordbits = list(self.tdo_bits)
-        source_index = 0
-        extract_index = 0
-        collected = 0
-        keep_start = [None]
-        keep_stop = []
-        extract = []
-        for inc, size in itertools.izip(constbits, varbits):
-            source_index += inc
-            if collected:
-                keep_start.append(source_index)
-            else:
-                extract_index += inc
-            source_index += size
-            collected += size
-            while collected and collected >= wordbits[-1]:
-                length = wordbits.pop()
-                collected -= length
-                extract.append(slice(extract_index, extract_index + length))
-                extract_index += length
-            if collected:
-                keep_stop.append(source_index)
-        keep_stop.append(None)
-        keep = [slice(x,y) for (x,y) in itertools.izip(keep_start, keep_stop)]
-        extract.reverse()
-        return keep, extract
-
     def get_tdo_extractor(self, len=len, int=int):
-        ''' Define a function that will extract a list of integers
-            from the TDO string from the driver.
+        ''' Define a generator function that will extract the
+            integers from the TDO data from the driver.
+
+            The driver returns an iterable of strings, in the order
+            they were received from the cable (the earliest bit of
+            each string is the rightmost character).  This lets a
+            driver hand over the TDO a chunk at a time as it reads
+            it.  Each word is yielded as soon as the chunk holding
+            its last bit arrives, and only the bits that have not
+            been used yet are kept, so a long read never needs the
+            whole TDO string in memory.
+
+            Words are not necessarily contiguous (e.g. the FTDI
+            driver reads the last bit of a shift separately), so
+            each word is a list of (offset, numbits, shift) pieces.
         '''
-        keep, extract = self.get_tdo_extractor_slices()
+        words = [[] for x in self.tdo_bits]
+        fields = [(x, y) for (y, x) in enumerate(self.tdo_bits)]
+        for index, shift, numbits, offset in bitplan(fields, self.x_runs(self.tdo_xstring)):
+            words[index].append((offset, numbits, shift))
+        # (first offset, stop offset, pieces) for each word, with
+        # pieces of None if the word is all together
+        plan = [(x[0][0], x[-1][0] + x[-1][1], len(x) > 1 and x or None) for x in words]
         sourcesize = len(self.tdo_xstring)
-        join=''.join
-        def tdo_extractor(s):
-            s = ''.join(s)
-            assert len(s) == sourcesize, (len(s), sourcesize)
-            s = join(s[x] for x in keep)
-            return (int(s[x], 2) for x in extract)
+        plan.append((sourcesize, sourcesize + 1, None))
+        del fields, words
+
+        def tdo_extractor(chunks):
+            nextword = iter(plan).next
+            first, stop, pieces = nextword()
+            pending = ''
+            received = 0
+            for chunk in chunks:
+                pending = chunk + pending
+                received += len(chunk)
+                while stop <= received:
+                    if pieces is None:
+                        yield int(pending[received - stop:received - first], 2)
+                    else:
+                        value = 0
+                        for offset, numbits, shift in pieces:
+                            offset = received - offset
+                            value |= int(pending[offset - numbits:offset], 2) << shift
+                        yield value
+                    first, stop, pieces = nextword()
+                # Drop the bits before the next word
+                keep = received - first
+                pending = pending[:keep] if keep > 0 else ''
+            assert received == sourcesize, (received, sourcesize)
         return tdo_extractor
 
     def get_xfer_func(self, join=''.join):
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+'''
+Testcases for the run-length TMS representation.  Random sequences
+of operations are applied to BitRuns instances and to plain lists,
+and the results are compared.  Also checks that long templates are
+cheap to build.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.iotemplate.bitruns import BitRuns
+from playtag.jtag.template import JtagTemplate
+
+numtests = 500
+seed = 42
+
+def check(runs, bits):
+    assert list(runs) == bits, (runs, bits)
+    assert len(runs) == len(bits)
+    assert runs == BitRuns(bits)
+    assert runs.bitstring() == ''.join(str(x) for x in reversed(bits))
+    assert list(reversed(runs)) == bits[::-1]
+    for index in range(-len(bits), len(bits)):
+        assert runs[index] == bits[index]
+    assert runs[1:-2] == bits[1:-2]
+    assert runs[::3] == bits[::3]
+    for x, y in zip(runs.runs, runs.runs[1:]):
+        assert x[0] != y[0] and x[1] and y[1], runs
+
+def randbits(rand):
+    return [rand.choice((0, 0, 1)) for i in range(rand.randrange(8))]
+
+def run():
+    rand = random.Random(seed)
+    for i in range(numtests):
+        bits = randbits(rand)
+        runs = BitRuns(bits)
+        check(runs, bits)
+        for j in range(5):
+            op = rand.randrange(4)
+            if op == 0:
+                other = randbits(rand)
+                runs += BitRuns(other) if rand.randrange(2) else other
+                bits += other
+            elif op == 1:
+                value, count = rand.randrange(2), rand.randrange(4)
+                runs.append_run(value, count)
+                bits += count * [value]
+            elif op == 2:
+                multiplier = rand.randrange(4)
+                runs *= multiplier
+                bits *= multiplier
+            else:
+                copy = runs.copy()
+                copy.append(1)     # Must not change runs
+                other = randbits(rand)
+                runs = runs + other
+                bits = bits + other
+            check(runs, bits)
+
+def run_template():
+    ''' A million idle clocks and a loop repeated a few thousand times are still small.
+    '''
+    template = JtagTemplate(None)
+    template.update(template.idle).update(1000000).update(template.select_dr).loop()
+    template.writei(6, 2).writed(35, 1).readd(35)
+    template.endloop(4096)
+    assert len(template.tms.runs) < 100000, len(template.tms.runs)
+    first = template.copy()
+    assert first.tms == template.tms and first.fingerprint() == template.fingerprint()
+
+if __name__ == '__main__':
+    run()
+    run_template()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+'''
+Testcases for the on-disk template cache.  Random templates are
+compiled once into an empty cache and then again from a fresh cache
+object on the same directory, and the results are compared.
+
+Also tests that structurally identical templates share a single
+device template, and that TEMPLATE_CACHE=None on the command line
+disables the cache.
+'''
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.lib.userconfig import UserConfig
+from playtag.iotemplate import interned
+from playtag.iotemplate.diskcache import TemplateCache
+from playtag.iotemplate.testconvert import MpsseIntDriver, BinDriver, randtemplate
+
+numtemplates = 50
+seed = 42
+
+def runall(driver, path, maxsize=2**20):
+    config = UserConfig()
+    config.TEMPLATE_CACHE = path
+    config.TEMPLATE_CACHE_SIZE = maxsize
+    driver.template_config(config)
+    results = []
+    for index in range(numtemplates):
+        template, tdi = randtemplate(driver, random.Random(index))
+        random.seed(seed + index)
+        tdo = template(*tdi)
+        results.append((driver.sent, tdo is not None and list(tdo)))
+    return driver.template_cache, results
+
+def run():
+    path = tempfile.mkdtemp()
+    try:
+        for driver in (MpsseIntDriver, BinDriver):
+            cold, expected = runall(driver(), path)
+            assert (cold.hits, cold.misses) == (0, numtemplates), cold.report()
+            warm, actual = runall(driver(), path)
+            assert (warm.hits, warm.misses) == (numtemplates, 0), warm.report()
+            assert expected == actual
+            assert warm.size == sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+
+        # Corrupt entries are recompiled
+        for fname in os.listdir(path):
+            open(os.path.join(path, fname), 'wb').write('junk')
+        cache, actual = runall(BinDriver(), path)
+        assert (cache.hits, cache.errors) == (0, numtemplates), cache.report()
+        assert expected == actual
+
+        # Size limit is honored
+        maxsize = cache.size / 4
+        cache, actual = runall(BinDriver(), path, maxsize)
+        assert cache.evictions and cache.size <= maxsize, cache.report()
+        assert expected == actual
+    finally:
+        shutil.rmtree(path)
+
+def run_intern():
+    driver, other = BinDriver(), BinDriver()
+    count = len(interned)
+    templates = [randtemplate(cable, random.Random(index)) for (cable, index) in
+                        ((driver, seed), (driver, seed), (other, seed), (driver, seed + 1))]
+    for template, tdi in templates:
+        template(*tdi)
+    first, second, third, fourth = (x[0].devtemplate for x in templates)
+    assert first is second
+    assert first is not third       # Different cable
+    assert first is not fourth      # Different structure
+    assert len(interned) == count + 3
+    del templates[:], first, second, third, fourth, template
+    assert len(interned) == count
+
+def run_disabled():
+    path = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        config = UserConfig()
+        config.readargs(['TEMPLATE_CACHE=None'])
+        assert TemplateCache.open(config) is None
+        assert not os.listdir(path)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    run()
+    run_intern()
+    run_disabled()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+'''
+Testcases for the template converters.  Random JTAG templates are
+compiled with each converter, and the data sent to the driver and
+the data extracted from the driver are checked against the data
+from the original string converter.
+'''
+
+import os
+import sys
+import random
+from binascii import hexlify, unhexlify
+from ctypes import string_at, sizeof, addressof
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.jtag.template import JtagTemplate, TDIVariable
+from playtag.iotemplate.stringconvert import TemplateStrings, TdoChunks
+from playtag.iotemplate.intconvert import TemplateInts
+from playtag.iotemplate.binconvert import BinTemplate
+from playtag.cables.ftdi.mpsse_template import MpsseTemplate, MpsseInts, MpsseBin
+from playtag.cables.ftdi.mpsse_commands import Commands
+
+numtemplates = 300
+seed = 42
+
+def tobytes(value, numbits):
+    numbytes = (numbits + 7) / 8
+    return unhexlify('%0*x' % (2 * numbytes, value))[::-1]
+
+def fromstruct(struct):
+    return int(hexlify(string_at(addressof(struct), sizeof(struct))[::-1]) or '0', 16)
+
+class StrDriver(TemplateStrings.mix_me_in()):
+    def __call__(self, tms, tdi, usetdo):
+        self.sent = int(tms, 2), int(tdi, 2)
+        if usetdo:
+            return ['{0:0{1}b}'.format(random.getrandbits(len(tms)), len(tms))]
+
+def chunked(driver, tdo):
+    ''' Hand the TDO over a random sized chunk at a time, from
+        a buffer that is overwritten by the next transfer.
+    '''
+    if driver.tdo_chunks is not None:
+        driver.tdo_chunks.finish()
+        driver.tdo_chunks = None
+    if tdo is None:
+        return
+    driver.buffer = tdo = ''.join(tdo)
+    def readchunk(start, size):
+        stop = len(driver.buffer) - start
+        return driver.buffer[stop - size:stop]
+    driver.tdo_chunks = TdoChunks(readchunk, len(tdo), random.Random(len(tdo)).randint(1, 70))
+    return driver.tdo_chunks
+
+class ChunkedStrDriver(StrDriver):
+    tdo_chunks = None
+    def __call__(self, *args):
+        return chunked(self, StrDriver.__call__(self, *args))
+
+class IntDriver(TemplateInts.mix_me_in()):
+    def xfer_ints(self, tms, tdi, numbits, usetdo):
+        self.sent = tms, tdi
+        if usetdo:
+            return tobytes(random.getrandbits(numbits), numbits)
+
+class BinDriver(BinTemplate.mix_me_in()):
+    def xfer_bin(self, tms, tdi, numbits, usetdo):
+        self.sent = tms, fromstruct(tdi)
+        if usetdo:
+            return tobytes(random.getrandbits(numbits), numbits)
+
+class MpsseStrDriver(MpsseTemplate.mix_me_in()):
+    def __call__(self, tdi, numbits, rcvlen):
+        self.sent = int(''.join(tdi), 2)
+        if rcvlen:
+            return ['{0:0{1}b}'.format(random.getrandbits(rcvlen), rcvlen)]
+
+class ChunkedMpsseStrDriver(MpsseStrDriver):
+    tdo_chunks = None
+    def __call__(self, *args):
+        return chunked(self, MpsseStrDriver.__call__(self, *args))
+
+class MpsseIntDriver(MpsseInts.mix_me_in()):
+    def xfer_ints(self, tdi, numbits, rcvlen):
+        self.sent = tdi
+        if rcvlen:
+            return tobytes(random.getrandbits(rcvlen), rcvlen)
+
+class MpsseBinDriver(MpsseBin.mix_me_in()):
+    def xfer_bin(self, tdi, numbits, rcvlen):
+        self.sent = fromstruct(tdi)
+        if rcvlen:
+            return tobytes(random.getrandbits(rcvlen), rcvlen)
+
+class EchoDriver(TemplateInts.mix_me_in()):
+    ''' Loops TDI back to TDO, and counts transfers.
+    '''
+    transfers = 0
+    def xfer_ints(self, tms, tdi, numbits, usetdo):
+        self.transfers += 1
+        if usetdo:
+            return tobytes(tdi, numbits)
+
+class MpsseSimDriver(MpsseInts.mix_me_in()):
+    ''' Decodes the MPSSE commands into the TMS and TDI
+        values for each clock, and loops TDI back to TDO.
+    '''
+    def xfer_ints(self, tdi, numbits, rcvlen):
+        stream = '{0:0{1}b}'.format(tdi, numbits)[::-1]
+        self.tms, self.tdi = tmsbits, tdibits = [], []
+        reads = []
+        tmspin = tdipin = '0'
+        position = 0
+        while position < numbits:
+            command = stream[position:position+24]
+            op, lo, hi = (int(command[i:i+8][::-1], 2) for i in (0, 8, 16))
+            position += 16
+            if op & Commands._bitmode:
+                length = lo + 1
+            else:
+                length = 8 * (lo + 256 * hi + 1)
+                position += 8
+            if op & Commands._tms_wr:
+                data = stream[position:position+8]
+                position += 8
+                tdipin = data[7]
+                clocks = [(x, tdipin) for x in data[:length]]
+            elif op & Commands._tdi_wr:
+                data = stream[position:position+length]
+                position += (length + 7) // 8 * 8
+                clocks = [(tmspin, x) for x in data]
+            else:
+                clocks = [(tmspin, tdipin)] * length
+            for tmspin, tdipin in clocks:
+                tmsbits.append(int(tmspin))
+                tdibits.append(int(tdipin))
+            if op & Commands._tdo_rd:
+                pad = '0' * (-length % 8)
+                reads.append(pad + ''.join(x[1] for x in clocks))
+        assert position == numbits, (position, numbits)
+        reads = ''.join(reads)
+        assert len(reads) == rcvlen, (len(reads), rcvlen)
+        if rcvlen:
+            return tobytes(int(reads[::-1], 2), rcvlen)
+
+def randtemplate(cable, rand):
+    ''' Build a random template, and the data to go with it.
+    '''
+    template = JtagTemplate(cable)
+    tdi = [[], []]
+    for i in range(rand.randint(1, 6)):
+        numbits = rand.choice((1, 2, 3, 7, 8, 9, 31, 32, 33, 64, 65, 200))
+        adv = numbits == 1 or rand.random() < 0.7   # MPSSE can't do single x then exit
+        index = rand.randint(0, 1)
+        value = rand.choice((TDIVariable(index), rand.getrandbits(numbits)))
+        if isinstance(value, TDIVariable):
+            tdi[index].append(rand.getrandbits(numbits))
+        if rand.random() < 0.5:
+            op = rand.choice((template.writei, template.writed))
+            op(numbits, value, adv=adv)
+        else:
+            op = rand.choice((template.readi, template.readd))
+            op(numbits, adv=adv, tdi=value)
+    while tdi and not tdi[-1]:
+        tdi.pop()
+    return template, tdi
+
+def randloops(cable, rand, depth=2):
+    ''' Build a random template with nested loops,
+        and the data to go with it.
+    '''
+    template = JtagTemplate(cable)
+    template.update(template.select_dr)
+
+    def addbody(depth):
+        for i in range(rand.randint(1, 3)):
+            choice = rand.random() if i else 1    # Loop bodies can't be empty
+            if depth and choice < 0.3:
+                template.loop()
+                addbody(depth - 1)
+                template.endloop(rand.choice((0, 1, 2, 3, 7, 40)))
+            elif choice < 0.4:
+                template.update(template.idle).update(rand.randint(1, 20)).update(template.select_dr)
+            else:
+                numbits = rand.choice((1, 2, 7, 8, 9, 32, 33))
+                value = rand.choice((TDIVariable(rand.randint(0, 1)), rand.getrandbits(numbits)))
+                op = rand.choice((template.writei, template.writed, template.readi, template.readd))
+                if op in (template.writei, template.writed):
+                    op(numbits, value)
+                else:
+                    op(numbits, tdi=value)
+    addbody(depth)
+    tdi = [[], []]
+    for numbits, value in template.tdi:
+        if isinstance(value, TDIVariable):
+            tdi[value.index].append(rand.getrandbits(numbits))
+    while tdi and not tdi[-1]:
+        tdi.pop()
+    return template, tdi
+
+def run():
+    checks = ((StrDriver, IntDriver, BinDriver, ChunkedStrDriver),
+              (MpsseStrDriver, MpsseIntDriver, MpsseBinDriver, ChunkedMpsseStrDriver))
+    for index in range(numtemplates):
+        for drivers in checks:
+            results = []
+            for driver in drivers:
+                driver = driver()
+                template, tdi = randtemplate(driver, random.Random(index))
+                random.seed(seed + index)
+                tdo = template(*tdi)
+                tdo = tdo is not None and list(tdo)
+                results.append((driver.sent, tdo))
+            expected = results[0]
+            for actual in results[1:]:
+                assert expected == actual, (index, drivers, expected, actual)
+
+def run_many():
+    ''' Check that apply_many() gives the same results as
+        calling the template once per set of TDI data.
+    '''
+    for index in range(numtemplates / 10):
+        driver = EchoDriver()
+        rand = random.Random(index)
+        template, tdi = randtemplate(driver, rand)
+        count = rand.randint(0, 5)
+        tdi_list = [[[rand.getrandbits(200) for x in stream] for stream in tdi] for i in range(count)]
+        expected = [template(*x) for x in tdi_list]
+        expected = [x is not None and list(x) for x in expected]
+        transfers = driver.transfers
+        actual = template.apply_many(tdi_list)
+        actual = count * [False] if actual is None else [list(x) for x in actual]
+        assert driver.transfers == transfers + bool(count), (driver.transfers, transfers, count)
+        assert expected == actual, (index, expected, actual)
+
+        # Split to fit the cable's limit, without compiling the template itself
+        other = template.copy()
+        driver.max_tcks = 2 * len(template.tms) + 1
+        transfers = driver.transfers
+        actual = other.apply_many(tdi_list)
+        actual = count * [False] if actual is None else [list(x) for x in actual]
+        assert driver.transfers == transfers + (count + 1) // 2, (driver.transfers, transfers, count)
+        assert expected == actual, (index, expected, actual)
+        assert other.devtemplate is None
+        del driver.max_tcks
+
+    # Only the last few batch sizes are kept
+    for count in range(template.max_batches + 5):
+        template.apply_many(count * [[[0 for x in stream] for stream in tdi]])
+    assert len(template.batches) == template.max_batches
+    assert (template.devkey, count) in template.batches
+
+def run_chunks():
+    ''' Check that TDO handed over in chunks is still right if it
+        is not used until after the next transfer.
+    '''
+    for index in range(numtemplates / 10):
+        results = []
+        for cls in (StrDriver, ChunkedStrDriver):
+            driver = cls()
+            random.seed(seed + index)
+            template, tdi = randtemplate(driver, random.Random(index))
+            template.readd(random.randint(1, 5000))
+            first = template(*tdi)
+            second = template(*tdi)
+            results.append((list(second), list(first)))
+        assert results[0] == results[1], index
+
+def run_long():
+    ''' Check a template that is too long for a single MPSSE
+        byte command, both for idle clocks and for data.
+    '''
+    value = random.Random(seed).getrandbits(540007)
+    results = []
+    for cls in (MpsseSimDriver, EchoDriver):
+        template = JtagTemplate(cls())
+        template.update(template.idle).update(600000).update(template.select_dr)
+        template.readd(540007, tdi=TDIVariable(0)).readd(9)
+        results.append(list(template([value])))
+    assert results[0] == results[1] and results[0][0] == value
+
+def run_loops():
+    ''' Check that templates with loops give the same results as
+        the same templates with the loops expanded, and that the
+        MPSSE commands for them are correct.
+    '''
+    for index in range(numtemplates):
+        for drivers in ((StrDriver, IntDriver, BinDriver), (MpsseSimDriver, EchoDriver)):
+            results = []
+            for cls in drivers:
+                for expand in (False, True):
+                    driver = cls()
+                    template, tdi = randloops(driver, random.Random(index))
+                    if expand:
+                        template.loops = []
+                    random.seed(seed + index)
+                    tdo = template(*tdi)
+                    tdo = tdo is not None and list(tdo)
+                    if cls is MpsseSimDriver:
+                        # Check the clocks against the Digilent-style driver
+                        other = IntDriver()
+                        template, tdi = randloops(other, random.Random(index))
+                        template(*tdi)
+                        tms, tdibits = other.sent
+                        mask = TemplateInts.compile(template).tdi_xstring[::-1]
+                        assert driver.tms == list(template.tms), index
+                        for i, (x, y) in enumerate(zip(mask, driver.tdi)):
+                            assert x == '*' or y == (tdibits >> i) & 1, (index, i)
+                    results.append(tdo if cls in (MpsseSimDriver, EchoDriver) else (driver.sent, tdo))
+            expected = results[0]
+            for actual in results[1:]:
+                assert expected == actual, (index, drivers, expected, actual)
+
+if __name__ == '__main__':
+    run()
+    run_many()
+    run_chunks()
+    run_long()
+    run_loops()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+'''
+Testcases for the template runtime counters.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.iotemplate import interned
+from playtag.iotemplate.counters import counters
+from playtag.iotemplate.testconvert import IntDriver, MpsseIntDriver, randtemplate
+
+def run():
+    counters.reset()
+    for driver, name in ((IntDriver(), 'digilent'), (MpsseIntDriver(), 'mpsse')):
+        template, tdi = randtemplate(driver, random.Random(3))
+        template.cmdname = name
+        numcalls = 5
+        for i in range(numcalls):
+            template(*tdi)
+        info, = [x for x in counters.snapshot() if x['cmdname'] == name]
+        assert info['calls'] == numcalls, info
+        assert info['tcks'] == numcalls * len(template.tms), info
+        assert info['bytes_out'] > 0 and info['seconds'] > 0, info
+        assert bool(info['bytes_in']) == bool(template.tdo), info
+        if name == 'digilent':
+            assert info['bytes_out'] == numcalls * ((2 * len(template.tms) + 7) // 8), info
+
+        # Recompiling the same template keeps the same counters
+        template.devtemplate = None
+        template(*tdi)
+        assert len([x for x in counters.counters if x[0] == name]) == 1
+        assert [x['calls'] for x in counters.snapshot() if x['cmdname'] == name] == [numcalls + 1]
+
+    # Templates with the same structure share a device
+    # template, but are counted under their own cmdnames
+    driver = IntDriver()
+    polls = []
+    for name in ('write', 'poll'):
+        template, tdi = randtemplate(driver, random.Random(4))
+        template.cmdname = name
+        polls.append((template, tdi))
+    for i in range(3):
+        for template, tdi in polls[i and 1:]:
+            template(*tdi)
+    first, second = (x[0].devtemplate for x in polls)
+    assert second.shared is first is interned[id(driver), polls[0][0].devkey]
+    calls = dict((x['cmdname'], x['calls']) for x in counters.snapshot())
+    assert calls['write'] == 1 and calls['poll'] == 3, calls
+
+    assert 'digilent' in counters.report() and 'mpsse' in counters.report(2)
+    counters.reset()
+    assert not counters.snapshot()
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''
+Testcases for the template profiler.
+'''
+
+import os
+import sys
+import json
+import random
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.iotemplate.profiler import profiler, TemplateProfiler
+from playtag.lib.userconfig import UserConfig
+from playtag.iotemplate.testconvert import IntDriver, MpsseBinDriver, StrDriver, randtemplate
+
+def run():
+    profiler.reset()
+    for driver in (IntDriver, MpsseBinDriver, StrDriver):
+        driver = driver()
+        template, tdi = randtemplate(driver, random.Random(1))
+        template.cmdname = 'before'
+        template(*tdi)
+        assert not profiler.stats
+
+        profiler.enable()
+        template, tdi = randtemplate(driver, random.Random(2))
+        template.cmdname = 'during'
+        for i in range(3):
+            tdo = template(*tdi)
+            if tdo is not None:
+                list(tdo)
+        profiler.enable(False)
+        template(*tdi)
+
+        stats = profiler.stats
+        stages = set(x[1] for x in stats)
+        assert set(x[0] for x in stats) == set(['during']), stats
+        assert stages >= set('compile strings customize get_xfer_func apply driver'.split()), stages
+        assert stats['during', 'apply'][0] == stats['during', 'driver'][0] == 3, stats
+        assert stats['during', 'compile'][0] == 1
+        assert ('during', 'get_tdi_combiner') in stats or ('during', 'get_tdi_builder') in stats
+        assert stats['during', 'apply'][1] >= stats['during', 'driver'][1]
+        results = json.loads(json.dumps(profiler.results()))
+        assert len(results) == len(stats)
+        dump = StringIO()
+        profiler.dump(dump)
+        assert json.loads(dump.getvalue()) == results
+        assert 'during' in profiler.report()
+        profiler.reset()
+
+def run_config():
+    ''' The command line forms in the manual must not
+        be taken as the name of a JSON file.
+    '''
+    for arg, expected in (('True', True), ('False', None), ('None', None),
+                          ('prof.json', 'prof.json')):
+        config = UserConfig()
+        config.readargs(['PROFILE_TEMPLATES=' + arg])
+        other = TemplateProfiler()
+        other.report_at_exit = False     # Don't register with atexit
+        other.configure(config)
+        assert other.enabled == bool(expected), arg
+        assert other.report_at_exit == (expected or False), arg
+
+if __name__ == '__main__':
+    run()
+    run_config()
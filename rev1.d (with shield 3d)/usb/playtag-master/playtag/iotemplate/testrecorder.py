@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+'''
+Testcases for transfer recording, and the replay and null cables.
+Random templates are applied through a driver for each converter
+with recording on, and the session is replayed with each converter
+for the same style of driver, which must give the same TDO.
+'''
+
+import os
+import sys
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.lib.userconfig import UserConfig
+from playtag.iotemplate.recorder import RecordingDriver, readlog, JTAG, MPSSE
+from playtag.iotemplate.testconvert import (StrDriver, ChunkedStrDriver, IntDriver, BinDriver,
+            MpsseStrDriver, ChunkedMpsseStrDriver, MpsseIntDriver, MpsseBinDriver, randtemplate)
+from playtag.cables import null, replay
+
+numtemplates = 40
+
+styles = ((JTAG, (StrDriver, ChunkedStrDriver, IntDriver, BinDriver)),
+          (MPSSE, (MpsseStrDriver, ChunkedMpsseStrDriver, MpsseIntDriver, MpsseBinDriver)))
+
+def session(cable, seed):
+    ''' Apply random templates, and return the TDO.
+    '''
+    rand = random.Random(seed)
+    results = []
+    for i in range(numtemplates):
+        template, tdi = randtemplate(cable, rand)
+        tdo = template(*tdi)
+        results.append(tdo is not None and list(tdo))
+    return results
+
+def makeconfig(cablename, converter):
+    config = UserConfig()
+    config.CABLE_NAME = cablename
+    config.TEMPLATE_CONVERTER = converter
+    config.TEMPLATE_CACHE = None
+    config.TRACK_TAP_STATE = False
+    return config
+
+def run():
+    fname = tempfile.mktemp(suffix='.log')
+    try:
+        for seed, (style, drivers) in enumerate(styles):
+            for driver in drivers:
+                cable = driver()
+                cable.recorder = RecordingDriver(cable, fname)
+                expected = session(cable, seed)
+                cable.recorder.log.close()
+                records = readlog(fname)
+                assert len(records) == numtemplates
+                assert set(x[0] for x in records) == set([style])
+                for converter in ('strings', 'ints', 'bin'):
+                    cable = replay.Jtagger(makeconfig(fname, converter))
+                    assert session(cable, seed) == expected, (driver, converter)
+                    assert cable.transfers == numtemplates
+
+                # Different data must be caught
+                cable = replay.Jtagger(makeconfig(fname, 'ints'))
+                try:
+                    session(cable, seed + 10)
+                except replay.ReplayError:
+                    pass
+                else:
+                    raise AssertionError('Replay did not check the data sent')
+    finally:
+        os.remove(fname)
+
+def run_null():
+    for name, style in (('jtag', JTAG), ('mpsse', MPSSE)):
+        for converter in ('strings', 'ints', 'bin'):
+            cable = null.Jtagger(makeconfig(name, converter))
+            results = session(cable, 1)
+            assert cable.transfers == numtemplates and cable.outbits
+            assert set(sum((x for x in results if x), [])) == set([0])
+
+if __name__ == '__main__':
+    run()
+    run_null()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+Testcases for cable transactions.  Random templates are called one
+at a time and inside a transaction, with a driver that loops TDI
+back to TDO, and the TDO from each call is checked.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.iotemplate.transaction import TransactionError
+from playtag.iotemplate.testconvert import EchoDriver, randtemplate, randloops
+
+numtests = 100
+
+def randcalls(driver, rand):
+    ''' Return a list of random (template, tdi) calls.
+    '''
+    calls = []
+    for i in range(rand.randint(1, 8)):
+        maker = rand.choice((randtemplate, randloops))
+        calls.append(maker(driver, random.Random(rand.getrandbits(32))))
+    return calls
+
+def results(tdo):
+    return [tdo is not None and list(tdo) for tdo in tdo]
+
+def run():
+    for index in range(numtests):
+        driver = EchoDriver()
+        calls = randcalls(driver, random.Random(index))
+        expected = results([template(*tdi) for (template, tdi) in calls])
+        transfers = driver.transfers
+        for repeat in range(2):
+            with driver.transaction():
+                tdo = [template(*tdi) for (template, tdi) in calls]
+                assert driver.transfers == transfers
+            transfers += 1
+            assert driver.transfers == transfers, index
+            assert results(tdo) == expected, index
+        assert len(driver.joined_templates) == (len(calls) > 1), index
+
+def run_dependency():
+    ''' Using the TDO inside the block sends the calls made so far.
+    '''
+    driver = EchoDriver()
+    calls = [randtemplate(driver, random.Random(x)) for x in range(40)]
+    reads = [x for x in calls if x[0].tdo]
+    writes = [x for x in calls if not x[0].tdo]
+    expected = results([template(*tdi) for (template, tdi) in reads])
+    transfers = driver.transfers
+    with driver.transaction():
+        writes[0][0](*writes[0][1])
+        tdo = [template(*tdi) for (template, tdi) in reads]
+        assert results(tdo[:1]) == expected[:1]
+        assert driver.transfers == transfers + 1
+        writes[1][0](*writes[1][1])
+        with driver.transaction():
+            writes[2][0](*writes[2][1])
+        assert driver.transfers == transfers + 1
+        driver.flush()
+        assert driver.transfers == transfers + 2
+        assert results(tdo[1:]) == expected[1:]
+        writes[3][0](*writes[3][1])
+    assert driver.transfers == transfers + 3
+
+    # Calls that are not committed are dropped if there is an error
+    try:
+        with driver.transaction():
+            tdo = reads[0][0](*reads[0][1])
+            raise ValueError
+    except ValueError:
+        pass
+    assert driver.transfers == transfers + 3
+    try:
+        list(tdo)
+    except TransactionError:
+        pass
+    else:
+        raise AssertionError('Expected TransactionError')
+    assert driver.session is None
+
+if __name__ == '__main__':
+    run()
+    run_dependency()
@@ -0,0 +1,178 @@
+'''
+This module lets a series of different template calls share a single
+cable transfer.
+
+Inside a "with cable.transaction():" block, calling a template does
+not start a transfer.  The call is added to the transaction, and a
+template with TDO returns a DeferredTdo instead of the TDO data.  When
+the block ends, the calls are committed:  the templates are joined
+into a single template (which is kept, so the same series of calls
+is only compiled once), and that template is applied with the TDI
+data from all the calls.
+
+A DeferredTdo is an iterator over the TDO words of its call.  If it is
+used before the block ends (e.g. a register is read and the value is
+needed to decide what to write next), the calls made so far are
+committed first, and the rest of the block starts a new transfer.
+Calling cable.flush() also commits the calls made so far.
+
+Transactions can be nested; the calls are committed when the
+outermost block ends.  If the block ends with an exception, the
+calls that have not been committed are dropped, and using a
+DeferredTdo from one of them raises TransactionError.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import itertools
+
+class TransactionError(RuntimeError):
+    pass
+
+class TdoWords(object):
+    ''' The TDO data from a committed transfer, which is
+        turned into a list when it is first needed.
+    '''
+    words = None
+
+    def __init__(self, tdo):
+        self.tdo = tdo
+
+    def get(self, start, stop):
+        words = self.words
+        if words is None:
+            words = self.words = list(self.tdo)
+            self.tdo = None
+        return words[start:stop]
+
+class DeferredTdo(object):
+    ''' The TDO data from a template call in a transaction.
+    '''
+    iterator = None
+    source = None
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+    def resolve(self, source, start, stop):
+        self.transaction = None
+        self.source = source, start, stop
+
+    def abandon(self):
+        self.transaction = None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        iterator = self.iterator
+        if iterator is None:
+            if self.transaction is not None:
+                self.transaction.commit()
+            if self.source is None:
+                raise TransactionError('TDO from a transaction that was not committed')
+            source, start, stop = self.source
+            iterator = self.iterator = iter(source.get(start, stop))
+        return iterator.next()
+
+class Transaction(object):
+    ''' Collects the template calls for a cable, and
+        commits them as a single transfer.
+    '''
+    max_calls = 64          # Commit automatically after this many calls
+    max_joined = 256        # Number of joined templates kept
+
+    depth = 0
+
+    def __init__(self, cable, joined):
+        self.cable = cable
+        self.joined = joined
+        self.pending = []
+
+    def __enter__(self):
+        if not self.depth:
+            self.cable.session = self
+        self.depth += 1
+        return self
+
+    def __exit__(self, exctype, value, tb):
+        self.depth -= 1
+        if self.depth:
+            return
+        self.cable.session = None
+        if exctype is None:
+            self.commit()
+        else:
+            self.abandon()
+
+    def add(self, template, tdi):
+        ''' Add a template call.  Returns a DeferredTdo
+            if the template has TDO, otherwise None.
+        '''
+        if template.devtemplate is None:
+            template.devtemplate = template.intern()
+            template.apply_template = self.cable.apply_template
+        result = DeferredTdo(self) if template.tdo else None
+        pending = self.pending
+        pending.append((template, [list(x) for x in tdi], result))
+        if len(pending) >= self.max_calls:
+            self.commit()
+        return result
+
+    def abandon(self):
+        ''' Drop the calls that have not been committed.  The
+            cable's TAP state was updated for them, so it is
+            no longer known.
+        '''
+        invalidate = getattr(self.cable, 'invalidate_tap', None)
+        if invalidate is not None:
+            invalidate()
+        pending, self.pending = self.pending, []
+        for template, tdi, result in pending:
+            if result is not None:
+                result.abandon()
+
+    def commit(self, chain=itertools.chain.from_iterable):
+        ''' Send all the calls made so far in a single transfer.
+        '''
+        pending = self.pending
+        if not pending:
+            return
+        try:
+            if len(pending) == 1:
+                template, tdi, result = pending[0]
+                tdo = template.apply_template(template.devtemplate, tdi)
+            else:
+                template = self.join(pending)
+                numstreams = max(len(x[1]) for x in pending)
+                tdi = [list(chain(x[1][i] for x in pending if len(x[1]) > i))
+                            for i in range(numstreams)]
+                tdo = self.cable.apply_template(template.devtemplate, tdi)
+        except:
+            self.abandon()
+            raise
+        self.pending = []
+        source = TdoWords(tdo)
+        position = 0
+        for template, tdi, result in pending:
+            if result is not None:
+                numwords = len(template.tdo)
+                result.resolve(source, position, position + numwords)
+                position += numwords
+
+    def join(self, pending):
+        ''' Return the joined template for a list of calls.
+        '''
+        key = tuple(x[0].devkey for x in pending)
+        joined = self.joined
+        template = joined.get(key)
+        if template is None:
+            template = pending[0][0]
+            for other, tdi, result in pending[1:]:
+                template = template.join(other)
+            if len(joined) >= self.max_joined:
+                joined.clear()
+            joined[key] = template
+        if template.devtemplate is None:
+            template.devtemplate = template.intern()
+        return template
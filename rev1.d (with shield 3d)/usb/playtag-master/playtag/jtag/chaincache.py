@@ -0,0 +1,89 @@
+'''
+This module contains an on-disk cache of discovered JTAG chains.
+
+Chain discovery reads the IDCODEs and the IR capture several times
+each, and then has to work out the instruction register lengths.
+The results are saved under the cable's serial number, and the
+next time a chain is discovered on that cable, a single IDCODE and
+IR capture scan is compared with the saved ones.  If they match,
+the saved instruction register lengths are used; if not (a
+different board, or a changed chain), the chain is discovered
+again from scratch.
+
+Each entry is a small JSON file in the cache directory, named by a
+hash of the cable's serial number and the Chain limits (max_irbits
+etc.) that it was discovered with.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import os
+import json
+import hashlib
+
+class ChainCacheDefaults(object):
+    CHAIN_CACHE = '~/.playtag/chains'          # Directory, or None to disable
+
+class ChainCache(object):
+    ''' A directory of discovered chains, by cable.
+    '''
+    suffix = '.chain'
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @classmethod
+    def open(cls, UserConfig):
+        ''' Return a cache based on the user configuration,
+            or None if the cache is disabled or unusable.
+        '''
+        UserConfig.add_defaults(ChainCacheDefaults)
+        path = UserConfig.CHAIN_CACHE
+        if not path:
+            return None
+        try:
+            return cls(os.path.expanduser(path))
+        except (IOError, OSError), s:
+            print "\nWarning: chain cache disabled: %s\n" % s
+            return None
+
+    def key(self, serial, limits):
+        info = serial, sorted(limits.items())
+        return hashlib.sha1(repr(info)).hexdigest() + self.suffix
+
+    def load(self, key):
+        ''' Return (dev_ids, ir, ilengths) for a chain,
+            or None if it is not in the cache.
+        '''
+        try:
+            f = open(os.path.join(self.path, key), 'rb')
+            try:
+                info = json.load(f)
+            finally:
+                f.close()
+            return info['dev_ids'], info['ir'], tuple(info['ilengths'])
+        except Exception:
+            return None
+
+    def store(self, key, dev_ids, ir, ilengths):
+        fname = os.path.join(self.path, key)
+        tmpname = '%s.%d.tmp' % (fname, os.getpid())
+        try:
+            f = open(tmpname, 'wb')
+            try:
+                json.dump(dict(dev_ids=dev_ids, ir=ir, ilengths=ilengths), f)
+            finally:
+                f.close()
+            if os.path.exists(fname):
+                os.remove(fname)
+            os.rename(tmpname, fname)
+        except (IOError, OSError):
+            pass
+
+    def remove(self, key):
+        try:
+            os.remove(os.path.join(self.path, key))
+        except OSError:
+            pass
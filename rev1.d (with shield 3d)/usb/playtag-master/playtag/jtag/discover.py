@@ -5,7 +5,6 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
 
 import collections
-import itertools
 
 from .template import JtagTemplate
 from ..bsdl.lookup import PartInfo
@@ -13,12 +12,12 @@ from ..bsdl.lookup import PartInfo
 binnum = '{0:b}'.format
 
 class Chain(list):
-    mindev_idcode = 2
     maxdev_idcode = 32
     maxdev_noid = 32
     max_irbits = 10     # Max instruction length
     min_irbits = 2      # At least INTEST, EXTEST, and BYPASS
     repeat_count = 4
+    limitnames = 'maxdev_idcode maxdev_noid max_irbits min_irbits'.split()
 
     def error(self, msg):
         raise SystemExit('\nError: %s\n' % msg)
@@ -29,26 +28,107 @@ class Chain(list):
             self.error("Bad argument(s): %s" % ', '.join(sorted(bad)))
         vars(self).update(kw)
         self.jtagrw = jtagrw
-        idcodes = self.repeat_read(self.read_ids, 'IDCODE')
-        self.dev_ids = dev_ids = self.find_ids(idcodes)
+        cache = getattr(jtagrw, 'chain_cache', None)
+        serial = getattr(jtagrw, 'cable_serial', None)
+        key = cache is not None and serial is not None and cache.key(serial, self.limits())
+        cached = key and cache.load(key)
+        self.from_cache = bool(cached) and self.revalidate(*cached)
+        if self.from_cache:
+            dev_ids, ir, ilengths = cached
+            self.setparts(dev_ids)
+            icapture = self.icapture_values(ir, ilengths)
+        else:
+            icapture = self.discover()
+            if key:
+                cache.store(key, self.dev_ids, self.ir, [x[0] for x in icapture])
+        self.updateparts(icapture)
+        self.reverse()
+        self.add_bypass_info()
+
+    def limits(self):
+        ''' Return the settings that the result of discovery
+            depends on, for the chain cache.
+        '''
+        return dict((x, getattr(self, x)) for x in self.limitnames)
+
+    def setparts(self, dev_ids):
+        self.dev_ids = dev_ids
         self.numdevs = len(dev_ids)
-        ir = self.repeat_read(self.read_ir, 'IR')
+        self[:] = [PartInfo(x) for x in dev_ids]
+
+    def discover(self):
+        ''' Read the IDCODEs and IR capture values, and
+            return the IR capture value of each device.
+        '''
+        maxdevs = self.maxdev_idcode + self.maxdev_noid
+        idreads, irreads = self.read_chain(maxdevs)
+        maxlen = self.id_maxlen()
+        for idinfo in idreads:
+            if not self.checkread(idinfo, maxlen, "IDCODE/BYPASS"):
+                self.error("JTAG chain appears to have more than %s devices in it." % self.maxdev_idcode)
+        idcodes = self.repeat_read(idreads, 'IDCODE')
+        dev_ids = self.find_ids(idcodes)
+        self.setparts(dev_ids)
+        if self.numdevs > maxdevs:
+            # IR scans were too short for this many devices
+            irreads = self.read_chain(self.numdevs, False)[1]
+        maxlen = self.numdevs * self.max_irbits + 1
+        for ir in irreads:
+            if not self.checkread(ir, maxlen, "IR"):
+                self.error("Unexpectedly long instruction register: %s" % binnum(ir))
+        self.ir = ir = self.repeat_read(irreads, 'IR')
         ilengths = self.find_ilengths(ir)
         if len(ilengths) > 1 and len(set(dev_ids)) != len(dev_ids):
             self.stripdups(ilengths)
         icapture = set(self.icapture_values(ir, x) for x in ilengths)
-        self[:] = [PartInfo(x) for x in dev_ids]
         self.constrain_parts(icapture)
         if len(icapture) != 1:
-            self.diagnose_chain(ir)
+            self.diagnose_chain(ir, icapture)
             raise SystemExit
         icapture, = icapture
-        self.updateparts(icapture)
-        self.reverse()
-        self.add_bypass_info()
+        return icapture
+
+    def revalidate(self, dev_ids, ir, ilengths):
+        ''' Check a chain from the cache with one scan of the
+            IDCODEs and IR capture values, and return True if
+            it is the same chain.  As in read_chain(), a single 1
+            is shifted in, and the IDCODE scan is long enough to
+            see 32 bits after it.
+        '''
+        expected = shift = 0
+        for idcode in dev_ids:
+            expected |= idcode << shift
+            shift += 32 if idcode else 1
+        expected |= 1 << shift
+        template = JtagTemplate(self.jtagrw).readd(shift + 33, tdi=1)
+        template.readi(self.ir_readlen(len(dev_ids)), tdi=1)
+        idinfo, irinfo = template()
+        return idinfo == expected and irinfo == ir
 
-    def repeat_read(self, func, info):
-        readset = set(func() for i in range(self.repeat_count))
+    def read_chain(self, numdevs, readids=True):
+        ''' Read the IDCODEs (unless readids is false) and the IR
+            capture values repeat_count times each, back to back
+            in a single template, so the whole read is one transfer.
+
+            A single 1 is shifted in behind the IDCODE/BYPASS bits,
+            and the IDCODE scans are long enough for the longest
+            chain allowed, so the length of the chain is found by
+            looking for the 1, rather than by trying longer and
+            longer scans.  The IR scans are long enough for numdevs
+            devices.  Returns (idcode reads, IR reads).
+        '''
+        template = JtagTemplate(self.jtagrw)
+        count = self.repeat_count
+        if readids:
+            for i in range(count):
+                template.readd(self.id_maxlen() + 33, tdi=1)
+        for i in range(count):
+            template.readi(self.ir_readlen(numdevs), tdi=1)
+        values = list(template())
+        return values[:-count], values[-count:]
+
+    def repeat_read(self, values, info):
+        readset = set(values)
         if len(readset) > 1:
             readset = sorted(readset)
             badlist = "\n    ".join(binnum(x) for x in readset)
@@ -65,24 +145,11 @@ class Chain(list):
         value, = readset
         return value
 
-    def read_ids(self):
-        while 1:
-            maxlen = 32 * self.mindev_idcode + self.maxdev_noid + 1
-            idinfo = JtagTemplate(self.jtagrw).readd(maxlen+33, tdi=1)().next()
-            if self.checkread(idinfo, maxlen, "IDCODE/BYPASS"):
-                break
-            if self.mindev_idcode >= self.maxdev_idcode:
-                self.error("JTAG chain appears to have more than %s devices in it." % self.maxdev_idcode)
-            self.mindev_idcode = min(self.mindev_idcode * 2, self.maxdev_idcode)
-        return idinfo
+    def id_maxlen(self):
+        return 32 * self.maxdev_idcode + self.maxdev_noid + 1
 
-    def read_ir(self):
-        max_irbits = self.max_irbits
-        maxlen = self.numdevs * max_irbits + 1
-        ir = JtagTemplate(self.jtagrw).readi(maxlen + max_irbits + 1, tdi=1)().next()
-        if not self.checkread(ir, maxlen, "IR"):
-            self.error("Unexpectedly long instruction register: %x" % binnum(ir))
-        return ir
+    def ir_readlen(self, numdevs):
+        return numdevs * self.max_irbits + self.max_irbits + 2
 
     def checkread(self, code, maxlen, op):
         mask = (1 << maxlen) - 1
@@ -97,7 +164,7 @@ class Chain(list):
         devices = []
         codelen = 32
         mask = (1 << codelen) - 1
-        while idcodes & (idcodes-1):
+        while idcodes > 1:
             if not (idcodes & 1):
                 devices.append(0)
                 idcodes >>= 1
@@ -123,12 +190,65 @@ class Chain(list):
             self.error("Broken instruction register: expected %d devices, got:\n    %s" % (numdevs, istring))
         if numdevs == 1:
             return [(total,)]
-        combinations = itertools.combinations(ones[1:], numdevs-1)
-        start, end = (0,), (total,)
-        combinations = [zip(x+end, start+x) for x in combinations]
-        result = [tuple(x-y for (x,y) in z) for z in combinations]
-        min_irbits = self.min_irbits
-        return set(x for x in result if min(x) >= min_irbits)
+        # If no solution matches the IR capture values of the known
+        # parts, just use the lengths, and let updateparts() warn.
+        return (self.solve_ilengths(ir, ones, total, self.ir_constraints(total, True)) or
+                self.solve_ilengths(ir, ones, total, self.ir_constraints(total, False)))
+
+    def ir_constraints(self, total, useparts):
+        ''' Return (minlen, maxlen, mask, value) for each device:
+            the range of IR lengths it can have, and the bits its
+            IR capture value must have.  Unknown parts can have
+            any length from min_irbits to max_irbits.
+        '''
+        result = []
+        for part in self:
+            capture = part.ir_capture
+            if not capture:
+                result.append((self.min_irbits, self.max_irbits, 0, 0))
+            elif useparts:
+                mask = int(capture.replace('0', '1').replace('x', '0'), 2)
+                value = int(capture.replace('x', '0'), 2)
+                result.append((len(capture), len(capture), mask, value))
+            else:
+                result.append((self.min_irbits, total, 0, 0))
+        return result
+
+    def solve_ilengths(self, ir, ones, total, constraints):
+        ''' Return the set of IR length tuples that split the IR
+            capture into one value per device, where each value
+            starts with a 1 and meets its device's constraints.
+
+            The capture is walked once, from the end back to the
+            start, finding every position where each device could
+            start with a valid split of the rest of the capture
+            after it.  The solutions are then built from the start
+            forward along those positions only, so no partial
+            solution is ever thrown away.
+        '''
+        numdevs = len(constraints)
+        nextpos = [None] * numdevs + [{total: None}]
+        for index in range(numdevs - 1, -1, -1):
+            minlen, maxlen, mask, value = constraints[index]
+            after = nextpos[index + 1]
+            found = nextpos[index] = {}
+            for start in ones:
+                if maxlen - minlen < len(after):
+                    stops = (start + x for x in range(minlen, maxlen + 1) if start + x in after)
+                else:
+                    stops = (x for x in after if minlen <= x - start <= maxlen)
+                stops = [x for x in stops if (ir >> start) & ((1 << (x - start)) - 1) & mask == value]
+                if stops:
+                    found[start] = stops
+            if not found:
+                return set()
+        if 0 not in nextpos[0]:
+            return set()
+        solutions = [((), 0)]
+        for found in nextpos[:-1]:
+            solutions = [(lengths + (stop - start,), stop) for (lengths, start) in solutions
+                                                        for stop in found[start]]
+        return set(x[0] for x in solutions)
 
     def stripdups(self, ilengths):
         devdict = collections.defaultdict(list)
@@ -165,6 +285,27 @@ class Chain(list):
                     kill.add(possibility)
             captureset -= kill
 
+    def diagnose_chain(self, ir, captureset, maxshow=10):
+        ''' Report that the instruction register lengths
+            could not be worked out.
+        '''
+        print
+        print 'Error: %s instruction register lengths for IR capture:' % (
+                    'Ambiguous' if captureset else 'No valid')
+        print '    %s' % binnum(ir)
+        print
+        print 'Devices (the first is nearest TDO):'
+        for i, part in enumerate(self):
+            print '   #%d - %s' % (i, part)
+        if captureset:
+            print
+            print 'Possible lengths:'
+            for capture in sorted(captureset)[:maxshow]:
+                print '    %s' % ' '.join(str(x[0]) for x in capture)
+            if len(captureset) > maxshow:
+                print '    ... (%d in all)' % len(captureset)
+        print
+
     def updateparts(self, captureinfo):
         assert len(self) == len(captureinfo)
         for index, (part, capture) in enumerate(reversed(zip(self, captureinfo))):
@@ -0,0 +1,369 @@
+'''
+This module contains a peephole optimizer for JTAG templates.
+
+Templates are built up a piece at a time, and the state paths between
+the pieces are not always the shortest ones.  For example, readwrite()
+parks in select_dr after every advancing shift, and a user can ask
+for a run/idle (or pause) visit with no clocks in it.  Before a
+template is compiled, the optimizer walks the states that the
+template's TMS takes the TAP through, and replaces each stretch
+between two states that matter with the shortest TMS path between
+them.
+
+States that matter are capture, shift, update and reset, and the
+start and end states of the template (and of each loop body).  The
+other states do nothing by themselves, so they can be skipped:
+
+   select_dr, select_ir, exit1 and exit2   -- always
+   idle and pause                          -- if only one clock is
+                                              spent in them (e.g.
+                                              update(idle).update(0))
+
+A pause on the way from a shift back to the same shift is dropped
+entirely, which merges the two shifts.
+
+TDI is ignored outside the shift states, and TDO is only read in the
+shift states, so the only other changes to the template are to
+shorten the TDI records (and move the TDO offsets) for the clocks
+that are removed.  The TDI and TDO records are never added or
+removed, so loops that are not changed keep their place in the
+template.  A loop with changes inside its body is compiled flat.
+
+The optimizer works on the runs of TMS bits and on the state path
+records, so its cost grows with the number of state changes in the
+template rather than with the number of clocks.
+
+The number of TCKs saved is kept by template cmdname.  Use
+optimizer.snapshot() or optimizer.report() to see it, and
+optimizer.enable(False) to turn the optimizer off.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import bisect
+import collections
+
+from .states import states as jtagstates
+from ..iotemplate import BitRuns, TDIVariable
+
+# States that can be skipped if only one clock is spent in them.
+# (select, exit1 and exit2 can only be visited for one clock.)
+passable = set([jtagstates.select_dr, jtagstates.select_ir, jtagstates.idle,
+                jtagstates.exit1_dr, jtagstates.exit2_dr, jtagstates.pause_dr,
+                jtagstates.exit1_ir, jtagstates.exit2_ir, jtagstates.pause_ir])
+
+reset_length = len(jtagstates.unknown.reset)
+
+def shortest_path(start, end, cache={}):
+    ''' Return the shortest list of TMS values that gets from
+        start to end, only going through passable states on
+        the way.  Going from a state to itself stays put for
+        one clock, if that is possible.
+    '''
+    key = start, end
+    path = cache.get(key)
+    if path is None:
+        if start == end and start in (start[0], start[1]):
+            path = [start.cyclevalue()]
+        else:
+            paths = {start: []}
+            todo = collections.deque([start])
+            while end not in paths:
+                state = todo.popleft()
+                for value in (0, 1):
+                    next = state[value]
+                    if next not in paths and (next == end or next in passable):
+                        paths[next] = paths[state] + [value]
+                        todo.append(next)
+            path = paths[end]
+        cache[key] = path
+    return path
+
+class Visit(object):
+    ''' A stay of one or more clocks in a state.
+    '''
+    __slots__ = 'state', 'clock', 'length', 'fixed'
+
+    def __init__(self, state, clock, length=0, fixed=False):
+        self.state = state
+        self.clock = clock
+        self.length = length
+        self.fixed = fixed
+
+def scan_runs(runs, state, clock):
+    ''' Return a list of the visits that a list of TMS runs
+        takes the TAP through, starting in state at clock.
+        The first and last visits are marked fixed; the last
+        one is the state at the end, with no clocks in it.
+    '''
+    visit = Visit(state, clock, fixed=True)
+    visits = [visit]
+    for value, count in runs:
+        while count:
+            next = state[value]
+            if next == state:
+                visit.length += count
+                break
+            visit.length += 1
+            count -= 1
+            state = next
+            visit = Visit(state, visit.clock + visit.length)
+            visits.append(visit)
+    visit.fixed = True
+    return visits
+
+def find_edits(visits, edits):
+    ''' Add a (clock, oldlength, newtms) edit to the edits
+        list for each stretch of visits that can be replaced
+        by a shorter TMS path.  The clock is the last clock
+        of the visit the stretch starts from.
+    '''
+    start = None
+    for index, visit in enumerate(visits):
+        if not visit.fixed and visit.length == 1 and visit.state in passable:
+            continue
+        if start is not None and index - start > 1:
+            first = visits[start]
+            path = shortest_path(first.state, visit.state)
+            if len(path) < index - start:
+                edits.append((first.clock + first.length - 1, index - start, path))
+        start = index
+
+def scan_template(template, state, clock, edits, dropped):
+    ''' Find the edits for a template that starts in state
+        at the given clock.  Each loop body is scanned on its
+        own, once for each different state it starts in, and
+        the index of each loop that has edits in it is added
+        to dropped.  Returns the ending state.
+    '''
+    tms = template.tms
+    position = 0
+    for index, (start, tdiindex, tdoindex, body, count) in enumerate(template.loops):
+        state = scan_section(tms.section(position, start), state, clock + position, edits)
+        bodylen = len(body.tms)
+        before = len(edits)
+        i = 0
+        while i < count:
+            bodyedits = []
+            endstate = scan_template(body, state, clock + start + i * bodylen, bodyedits, [])
+            edits.extend(bodyedits)
+            i += 1
+            if endstate == state:
+                # The rest of the iterations are the same as this one
+                for j in xrange(1, count - i + 1):
+                    edits.extend((x + j * bodylen, y, z) for (x, y, z) in bodyedits)
+                break
+            state = endstate
+        if len(edits) > before:
+            dropped.append(index)
+        position = start + count * bodylen
+    return scan_section(tms.section(position, len(tms)), state, clock + position, edits)
+
+def scan_section(tms, state, clock, edits):
+    ''' Find the edits for a section of TMS with no loops.
+    '''
+    if not tms:
+        return state
+    runs = tms.runs
+    if state == jtagstates.unknown:
+        # Leave the reset sequence alone
+        if runs[0][0] != 1 or runs[0][1] < reset_length:
+            raise ValueError("Template does not start with a reset sequence")
+        tms = tms.section(reset_length, len(tms))
+        state = jtagstates.reset
+        clock += reset_length
+        runs = tms.runs
+    visits = scan_runs(runs, state, clock)
+    find_edits(visits, edits)
+    return visits[-1].state
+
+class OptimizerStats(object):
+    ''' Counts of TCKs before and after optimization,
+        for the templates with a given cmdname.
+    '''
+    __slots__ = 'cmdname', 'templates', 'changed', 'tcks', 'saved'
+
+    def __init__(self, cmdname):
+        self.cmdname = cmdname
+        self.templates = self.changed = self.tcks = self.saved = 0
+
+class TemplateOptimizer(object):
+    ''' Shortens the state paths in templates, and keeps
+        count of the TCKs saved.
+    '''
+    enabled = True
+
+    def __init__(self):
+        self.stats = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.stats = {}
+
+    def optimize(self, template):
+        ''' Return an optimized copy of the template, or the
+            template itself if it cannot be improved.
+        '''
+        if not self.enabled:
+            return template
+        edits = []
+        dropped = []
+        try:
+            scan_template(template, template.states[0], 0, edits, dropped)
+        except ValueError:
+            edits = []
+        edits = self.check_edits(template, edits)
+        saved = sum(oldlen - len(path) for (clock, oldlen, path) in edits)
+        stats = self.stats.get(template.cmdname)
+        if stats is None:
+            stats = self.stats[template.cmdname] = OptimizerStats(template.cmdname)
+        stats.templates += 1
+        stats.tcks += len(template.tms)
+        if not saved:
+            return template
+        stats.changed += 1
+        stats.saved += saved
+        return self.apply_edits(template, edits, dropped)
+
+    @staticmethod
+    def check_edits(template, edits, bisect=bisect.bisect_left):
+        ''' Only keep the edits that do not change any clocks
+            with variable TDI or with TDO reads.  (This can only
+            happen with odd templates, e.g. with variable TDI
+            while moving between states.)
+        '''
+        if not edits:
+            return edits
+        variable, reads = [], []
+        clock = 0
+        for numbits, value in template.tdi:
+            if isinstance(value, TDIVariable):
+                variable.append((clock, clock + numbits))
+            clock += numbits
+        clock = 0
+        for offset, numbits in template.tdo:
+            clock += offset
+            reads.append((clock, clock + numbits))
+        checks = [([x[0] for x in ranges], ranges) for ranges in (variable, reads) if ranges]
+        result = []
+        for edit in sorted(edits):
+            clock, oldlen, path = edit
+            start, stop = clock + 1, clock + oldlen
+            for starts, ranges in checks:
+                # The ranges do not overlap, so only the last
+                # one starting before stop can overlap the edit.
+                index = bisect(starts, stop) - 1
+                if index >= 0 and ranges[index][1] > start:
+                    break
+            else:
+                result.append(edit)
+        return result
+
+    @staticmethod
+    def apply_edits(template, edits, dropped):
+        ''' Return a copy of the template with the edits made.
+        '''
+        new = template.copy()
+        sentinel = len(template.tms) + 1, 0, []
+
+        # TMS -- replace each stretch with its new path
+        tms = new.tms = BitRuns()
+        todo = iter(edits + [sentinel])
+        start, length, path = todo.next()
+        skip = 0
+        position = 0
+        for value, count in template.tms.runs:
+            while count:
+                if skip:
+                    take = min(skip, count)
+                    skip -= take
+                elif position == start:
+                    tms.extend(path)
+                    skip = length
+                    start, length, path = todo.next()
+                    continue
+                else:
+                    take = min(count, start - position)
+                    tms.append_run(value, take)
+                count -= take
+                position += take
+
+        # The (start, stop) ranges of clocks that are removed
+        removed = [(clock + len(path), clock + oldlen) for (clock, oldlen, path) in edits]
+        removed = [(start, stop) for (start, stop) in removed if stop > start]
+        starts = [start for (start, stop) in removed]
+        totals = [0]
+        for start, stop in removed:
+            totals.append(totals[-1] + stop - start)
+
+        def removed_before(clock, bisect=bisect.bisect_right):
+            # Ranges never straddle a clock that is asked about
+            return totals[bisect(starts, clock - 1)]
+
+        # TDI -- shorten the records with removed clocks
+        tdi = new.tdi = []
+        index = 0
+        clock = 0
+        for numbits, value in template.tdi:
+            end = clock + numbits
+            cut = []
+            while index < len(removed) and removed[index][0] < end:
+                start, stop = max(removed[index][0], clock), min(removed[index][1], end)
+                if stop > start:
+                    cut.append((start - clock, stop - clock))
+                if removed[index][1] > end:
+                    break
+                index += 1
+            if cut:
+                if not isinstance(value, str):
+                    value = '{0:0{1}b}'.format(value & ((1 << numbits) - 1), numbits)
+                # Strings are reversed, so cut from the latest clocks first
+                for start, stop in reversed(cut):
+                    size = len(value)
+                    value = value[:size - stop] + value[size - start:]
+                numbits = len(value)
+            tdi.append((numbits, value))
+            clock = end
+
+        # TDO -- move the reads back by the clocks removed before them
+        tdo = new.tdo = []
+        clock = prevread = 0
+        for offset, numbits in template.tdo:
+            clock += offset
+            start = clock - removed_before(clock)
+            tdo.append((start - prevread, numbits))
+            prevread = start
+        new.prevread = prevread
+
+        # Loops -- drop the ones that changed and move the others
+        new.loops = [(clock - removed_before(clock), tdiindex, tdoindex, body, count)
+                        for (index, (clock, tdiindex, tdoindex, body, count))
+                        in enumerate(template.loops) if index not in dropped]
+        return new
+
+    def snapshot(self):
+        ''' Return a list of dictionaries, one per cmdname, with
+            the number of templates optimized, how many of them
+            were changed, and the TCKs before optimization and
+            saved by it.  The templates that saved the most
+            TCKs are first.
+        '''
+        result = [dict(cmdname=x.cmdname, templates=x.templates, changed=x.changed,
+                       tcks=x.tcks, saved=x.saved) for x in self.stats.itervalues()]
+        result.sort(key=lambda x: (-x['saved'], x['cmdname']))
+        return result
+
+    def report(self):
+        lines = ['%-24s %10s %10s %12s %12s' % ('template', 'templates', 'changed',
+                    'TCKs', 'TCKs saved')]
+        total = 0
+        for info in self.snapshot():
+            lines.append('%-24s %10d %10d %12d %12d' % (info['cmdname'] or '(none)',
+                    info['templates'], info['changed'], info['tcks'], info['saved']))
+            total += info['saved']
+        lines.append('%d TCKs saved' % total)
+        return '\n'.join(lines)
+
+optimizer = TemplateOptimizer()
@@ -54,8 +54,12 @@ class OneState(str):
     ''' For each state, maintain a dictionary:
           Dictionary keys = other states
           Dictionary values = TMS sequences to transition to the other states
+
+        The dictionaries are filled in by findpaths() the first
+        time any of them is used.
     '''
     order = []
+    pathsfound = False
     def __new__(cls, name, cache={}):
         name = str(name)
         try:
@@ -64,11 +68,17 @@ class OneState(str):
             pass
         cache[name] = self = str.__new__(cls, name)
         self.shifting = name.startswith('shift')
-        self.sequences = {}
+        self._sequences = {}
         setattr(states, self, self)
         self.order.append(self)
         return self
 
+    @property
+    def sequences(self):
+        if not self.pathsfound:
+            findpaths()
+        return self._sequences
+
     def __getitem__(self, index):
         if isinstance(index, str):
             return TMSPath(self, index)
@@ -77,12 +87,17 @@ class OneState(str):
     def __getattr__(self, name):
         return TMSPath(self, name)
 
-    def cyclestate(self, count=1):
+    def cyclevalue(self):
+        ''' Return the TMS value that keeps the state machine in this state.
+        '''
         for value in range(2):
             if self[value] == self:
-                return count * [value]
+                return value
         raise ValueError("%s is not a valid cycle state" % self)
 
+    def cyclestate(self, count=1):
+        return count * [self.cyclevalue()]
+
 
 class TMSPath(list):
     ''' Define a list of TMS transitions required to get from one state to another.
@@ -136,7 +151,7 @@ def calcpaths():
                for those two states already exists.
     '''
     undone = set((x,y) for x in transitions for y in transitions)
-    sequences = dict((x, x.sequences) for x in transitions)
+    sequences = dict((x, x._sequences) for x in transitions)
 
     # Create initial set of transitions of length 1
     dict0 = {}
@@ -170,26 +185,31 @@ def checkpaths():
         3) Determine the path to get from 'unknown' state through reset to
            any desired state.
     '''
-    resetseq = max(x.sequences[states.reset] for x in transitions)
+    resetseq = max(x._sequences[states.reset] for x in transitions)
     for start in transitions:
         state = start
         for index in resetseq:
             state = state[index]
         assert state is states.reset, (start, state)
-    sequences = states.unknown.sequences
+    sequences = states.unknown._sequences
     sequences[states.reset] = resetseq
     for state in transitions:
         if state not in (states.unknown, states.reset):
-            sequences[state] = resetseq + states.reset[state]
+            sequences[state] = resetseq + states.reset._sequences[state]
+
+def findpaths():
+    ''' Calculate the minimum paths between states, and then the
+        reset value and paths.
+    '''
+    calcpaths()
+    checkpaths()
+    OneState.pathsfound = True
 
 OneState('unknown')
 # Convert the transitions into something usable
 transitions = (x for x in transitions.splitlines() if x.strip())
 transitions = ((OneState(y) for y in x.split()) for x in transitions)
 transitions = dict((a, (b, c)) for (a, b, c) in transitions)
-# Calculate the minimum paths between states, and then the reset value and paths
-calcpaths()
-checkpaths()
 
 if __name__ == '__main__':
     for state1 in OneState.order:
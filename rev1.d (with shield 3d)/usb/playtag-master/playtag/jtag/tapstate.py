@@ -0,0 +1,67 @@
+'''
+This module keeps track of the state of a cable's TAP between
+template calls.
+
+A JtagTemplate that starts in the unknown state begins with the
+5-clock reset sequence, which also resets the instruction register,
+so a template that uses a device's data register has to load the
+instruction again on every call.  When the cable keeps a TapState,
+each call records the state the TAP is left in, and the value of the
+instruction register if it is known.  A template that starts in the
+unknown state and then loads a constant instruction can then be run
+from the state the TAP is in, without the reset.  If the instruction
+register already has the value that would be loaded, the instruction
+load is skipped too.
+
+A template that does anything else before it loads an instruction
+(e.g. reads the IDCODE data register that the reset selects) is
+always run with its reset.
+
+The IR value that is tracked is the whole chain's (the instruction
+for the device plus the bypass bits for the others), so it covers
+every device on the chain.
+
+The tracking must be told when something happens to the TAP outside
+of the templates:  call cable.invalidate_tap() after a TRST, or
+after anything else that leaves the TAP in an unknown state.  An
+error from a template call (including one that is reported by a
+later call in async mode, or by a transaction) does this
+automatically, and so does a call to a plain IOTemplate (e.g. the
+arbitrary TMS from the XVC server), since it can leave the TAP in
+any state.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+from .states import states as jtagstates
+
+class TapStateDefaults(object):
+    TRACK_TAP_STATE = True      # Skip resets and IR loads that are not needed
+
+class TapState(object):
+    ''' The state of a cable's TAP, and the value in the
+        instruction register (None if it is not known).
+    '''
+    state = jtagstates.unknown
+    ir = None
+
+    def __init__(self):
+        self.resets_skipped = 0
+        self.irloads_skipped = 0
+
+    def invalidate(self):
+        self.state = jtagstates.unknown
+        self.ir = None
+
+    def update(self, template):
+        ''' Record the effect of a template call.
+        '''
+        self.state = template.states[-1]
+        if template.irfirst is not None:
+            self.ir = template.irlast
+        elif template.states[0] == jtagstates.unknown:
+            self.ir = None
+
+    def __repr__(self):
+        return 'TapState(%s, ir=%r, resets_skipped=%d, irloads_skipped=%d)' % (
+                    self.state, self.ir, self.resets_skipped, self.irloads_skipped)
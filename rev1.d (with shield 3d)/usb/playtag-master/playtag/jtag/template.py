@@ -12,6 +12,7 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 
 from .states import states as jtagstates
 from .. import iotemplate
+from . import peephole
 
 TDIVariable = iotemplate.TDIVariable
 defaultvar = TDIVariable()
@@ -29,6 +30,18 @@ class JtagTemplate(iotemplate.IOTemplate):
     # Get the jtag state vars from the states module
     vars().update(vars(jtagstates))
 
+    # Instruction register changes, used for tracking the TAP between
+    # calls (see tapstate.py).  irfirst is None if the template does
+    # not change the IR (other than by the reset at the start, if it
+    # starts in the unknown state), or (start, stop, value) for the
+    # first change, where start and stop are tdi indices.  The value
+    # is only set if the change is a load of a constant instruction
+    # that could be skipped.  irlast is the IR value after the last
+    # change, or None if it is not known.
+    irfirst = None
+    irlast = None
+    variants = None     # Copies to run from known states, by (state, skipir)
+
     def protocol_init(self, kwds):
         ''' Called by __init__.  Sets up protocol-specific instance info.
         '''
@@ -47,6 +60,8 @@ class JtagTemplate(iotemplate.IOTemplate):
         '''
         new.states = list(self.states)
         new.bypass_info = self.bypass_info
+        new.irfirst = self.irfirst
+        new.irlast = self.irlast
         return new
 
     def protocol_loop(self, prev):
@@ -60,14 +75,55 @@ class JtagTemplate(iotemplate.IOTemplate):
             Makes sure they are compatible (ending state of first
             == starting state of second) and then add them together.
         '''
+        self.check_add(other)
+        assert self.bypass_info is other.bypass_info, (self.bypass_info, other.bypass_info)
+        self.states.extend(other.states[1:])
+        return self.add_ir(other)
+
+    def check_add(self, other):
         states, ostates = self.states, other.states
         assert states[-1][ostates[1]] == ostates[0][ostates[1]], (
             "Mismatched state transitions on add:  %s -> %s not same TMS values as %s -> %s" %
             (states[-1], ostates[1], ostates[0], ostates[1]))
-        assert self.bypass_info is other.bypass_info, (self.bypass_info, other.bypass_info)
-        states.extend(ostates[1:])
+
+    def protocol_join(self, other):
+        ''' Called by self.join().  A template that starts
+            in the unknown state can follow anything;
+            otherwise the states have to match as for
+            addition.  The templates are usually for different
+            commands, so they only need the same bypass bits,
+            not the same bypass_info.
+        '''
+        ostates = other.states
+        offset = len(self.tdi) - len(other.tdi)
+        if ostates[0] == self.unknown:
+            self.note_ir(offset, offset + 1, None)    # Reset at the start of other
+        else:
+            self.check_add(other)
+            for state in (self.shift_ir, self.shift_dr):
+                assert self.bypass_info(state) == other.bypass_info(state), state
+        self.states.extend(ostates[1:])
+        return self.add_ir(other)
+
+    def add_ir(self, other):
+        ''' Add the IR changes from the other template,
+            whose tdi has been added to ours.
+        '''
+        if other.irfirst is not None:
+            offset = len(self.tdi) - len(other.tdi)
+            start, stop, value = other.irfirst
+            self.note_ir(start + offset, stop + offset, value)
+            self.irlast = other.irlast
         return self
 
+    def note_ir(self, start, stop, value):
+        ''' Record a change to the IR by the tdi
+            records from start to stop.
+        '''
+        if self.irfirst is None:
+            self.irfirst = start, stop, value
+        self.irlast = value
+
     def protocol_mul(self, multiplier):
         ''' Called when multiplying an instance by an integer.
             Make sure this is legal (ending state same as startin
@@ -82,6 +138,33 @@ class JtagTemplate(iotemplate.IOTemplate):
         states.append(endstate)
         return self
 
+    def protocol_batch(self, original, count):
+        ''' Called by apply_many.  The original template can be
+            run back to back if it starts in the unknown state
+            (so its TMS will work from any state), or if its
+            ending state has the same TMS values as its
+            starting state to get to its next state.
+        '''
+        states = original.states
+        if len(states) > 1 and states[0] != self.unknown:
+            assert states[-1][states[1]] == states[0][states[1]], (
+                "Template cannot be batched:  %s -> %s not same TMS values as %s -> %s" %
+                (states[-1], states[1], states[0], states[1]))
+        self.states = states[:1] + count * states[1:]
+        return self
+
+    def protocol_optimize(self):
+        ''' Called by intern.  Returns a copy of the template
+            with shorter state paths, if there are any.
+        '''
+        return peephole.optimizer.optimize(self)
+
+    def protocol_fingerprint(self, digest):
+        ''' Called by fingerprint.  The optimized state paths
+            depend on the starting state, so it is included.
+        '''
+        digest.update(repr(self.states[0]))
+
     def update(self, state, tdi=defaultvar, adv=None, read=False):
         ''' update is the primary function that adds information to the
             template.  Other functions call update.
@@ -93,9 +176,9 @@ class JtagTemplate(iotemplate.IOTemplate):
             read is set true to add information to the template to capture
             TDO for the time of the update.
         '''
-        self.devtemplate = None
-        tmslist = self.tms
-        tmslen = len(tmslist)
+        self.devtemplate = self.variants = None
+        tms = self.tms
+        tmslen = len(tms)
         states = self.states
         oldstate = states[-1]
         if isinstance(state, str) and state.isdigit() and tdi is defaultvar:
@@ -103,10 +186,14 @@ class JtagTemplate(iotemplate.IOTemplate):
             state = len(tdi)
         if isinstance(state, int):
             numbits = state
-            tmslist.extend(oldstate.cyclestate(numbits))
+            tmsvalue = oldstate.cyclevalue()
             if adv:
-                tmslist[-1] ^= 1
-                states.append(oldstate[tmslist[-1]])
+                assert numbits > 0, numbits
+                tms.append_run(tmsvalue, numbits - 1)
+                tms.append(tmsvalue ^ 1)
+                states.append(oldstate[tmsvalue ^ 1])
+            else:
+                tms.append_run(tmsvalue, numbits)
             if not oldstate.shifting:
                 # Handle run/idle
                 assert not read
@@ -116,8 +203,16 @@ class JtagTemplate(iotemplate.IOTemplate):
             assert adv is None, state
             newtms = oldstate[state]
             states.append(state)
-            tmslist.extend(newtms)
+            tms.extend(newtms)
             numbits = len(newtms)
+            if oldstate != self.unknown:
+                # Going through update_ir or reset changes the IR
+                for value in newtms:
+                    oldstate = oldstate[value]
+                    if oldstate in (self.update_ir, self.reset):
+                        index = len(self.tdi)
+                        self.note_ir(index, index + 1, None)
+                        break
             if tdi is defaultvar:
                 tdi = numbits * '*'
             assert not read
@@ -129,7 +224,10 @@ class JtagTemplate(iotemplate.IOTemplate):
 
     def readwrite(self, state, numbits, tdi, adv, read):
         prefix, suffix = self.bypass_info(state, ('', ''))
-        if self.states[-1] != state:
+        start = len(self.tdi)
+        irfirst = self.irfirst
+        whole = self.states[-1] != state
+        if whole:
             self.update(state)
             if prefix:
                 self.update(prefix)
@@ -138,8 +236,69 @@ class JtagTemplate(iotemplate.IOTemplate):
             if suffix:
                 self.update(suffix, adv=True)
             self.update(self.select_dr)
+            if state == self.shift_ir and whole and not isinstance(tdi, TDIVariable):
+                # A load of a known instruction
+                value = prefix, numbits, tdi, suffix
+                self.irlast = value
+                if irfirst is None:
+                    self.irfirst = start, len(self.tdi), None if read else value
         return self
 
+    def __call__(self, *tdi):
+        ''' Apply the template.  If the cable is keeping track
+            of its TAP, a copy of the template that does not
+            reset the TAP (or load the IR) may be used instead.
+        '''
+        tap = getattr(self.cable, 'tapstate', None)
+        if tap is None:
+            return iotemplate.IOTemplate.send(self, *tdi)
+        template = self
+        state = tap.state
+        irfirst = self.irfirst
+        if (state != self.unknown and self.states[0] == self.unknown and
+                irfirst is not None and irfirst[2] is not None and irfirst[0] <= 1):
+            skipir = irfirst[2] == tap.ir
+            variants = self.variants
+            if variants is None:
+                variants = self.variants = {}
+            key = state, skipir
+            template = variants.get(key)
+            if template is None:
+                template = variants[key] = self.variant(state, skipir)
+            if template is not self:
+                tap.resets_skipped += 1
+                tap.irloads_skipped += skipir
+        try:
+            result = iotemplate.IOTemplate.send(template, *tdi)
+        except:
+            tap.invalidate()
+            raise
+        tap.update(self)
+        return result
+
+    def variant(self, state, skipir):
+        ''' Return a copy of the template that starts in the
+            given state rather than resetting the TAP, and skips
+            the first IR load if skipir is set.  Returns the
+            template itself if that cannot be done.
+        '''
+        start, stop, value = self.irfirst
+        if skipir:
+            index, target = stop, self.select_dr
+        else:
+            index, target = start + 1, self.shift_ir
+        if min([x[1] for x in self.loops] or [index]) < index:
+            return self
+        new = type(self)(self.cable, self.cmdname, startstate=state)
+        new.bypass_info = self.bypass_info
+        if state != target:
+            new.update(target)
+        new = new.concat(self.tail(index))
+        new.states = new.states[:2] + self.states[-1:]
+        new.irfirst = 0, len(new.tdi), None
+        new.irlast = self.irlast
+        return new
+
     def writei(self, numbits, tdi=defaultvar, adv=True):
         ''' Write to the JTAG instruction register
         '''
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+'''
+Testcases for the chain cache.  Chains on the sim cable are
+discovered, then found again from the cache with a single transfer,
+and changed chains must be discovered again.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.lib.userconfig import UserConfig
+from playtag.jtag.discover import Chain
+from playtag.cables.sim import Jtagger
+
+parts = 'xc3s500e noid:5 0x1234567f:6 xcf04s'
+
+def makecable(path, parts=parts):
+    config = UserConfig()
+    config.TEMPLATE_CACHE = None
+    config.CHAIN_CACHE = path
+    config.CABLE_NAME = parts
+    return Jtagger(config)
+
+def summary(chain):
+    return [(x.idcode, x.ir_capture, x.bypass_info) for x in chain]
+
+def run():
+    path = tempfile.mkdtemp()
+    try:
+        cable = makecable(path)
+        chain = Chain(cable)
+        assert not chain.from_cache and cable.transfers == 1
+        expected = summary(chain)
+
+        cable = makecable(path)
+        chain = Chain(cable)
+        assert chain.from_cache and cable.transfers == 1
+        assert summary(chain) == expected
+
+        # Different limits are kept separately
+        cable = makecable(path)
+        assert not Chain(cable, max_irbits=12).from_cache
+        assert Chain(cable, max_irbits=12).from_cache
+
+        # A different chain on the same cable
+        for other in ('xc3s500e noid:5 0x1234567f:6', 'xc3s500e noid:4 0x1234567f:7 xcf04s',
+                      'xc3s500e noid:5 0x1234567f:6 xcf04s noid:3'):
+            cable = makecable(path, other)
+            cable.cable_serial = makecable(path).cable_serial
+            chain = Chain(cable)
+            assert not chain.from_cache, other
+            assert [len(x.ir_capture) for x in chain] == [x.irlen for x in cable.chain.devices]
+        cable = makecable(path)
+        assert not Chain(cable).from_cache
+        assert Chain(cable).from_cache
+
+        # A damaged entry is ignored
+        for fname in os.listdir(path):
+            open(os.path.join(path, fname), 'wb').write('{"dev_ids": [')
+        cable = makecable(path)
+        assert summary(Chain(cable)) == expected
+        assert Chain(cable).from_cache
+
+        # No cache
+        cable = makecable(None)
+        assert cable.chain_cache is None
+        assert not Chain(cable).from_cache
+    finally:
+        shutil.rmtree(path)
+
+def run_disabled():
+    ''' CHAIN_CACHE=None on the command line disables the cache.
+    '''
+    path = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        config = UserConfig()
+        config.TEMPLATE_CACHE = None
+        config.CABLE_NAME = parts
+        config.readargs(['CHAIN_CACHE=None'])
+        cable = Jtagger(config)
+        assert cable.chain_cache is None
+        assert not Chain(cable).from_cache
+        assert not os.listdir(path)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    run()
+    run_disabled()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''
+Testcases for working out the instruction register lengths in
+chain discovery.  The solver is checked against a search of every
+way of splitting the IR capture, and long chains are discovered
+on the simulated cable, with all the reads in a single transfer.
+'''
+
+import os
+import sys
+import time
+import random
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.lib.userconfig import UserConfig
+from playtag.jtag.discover import Chain
+from playtag.bsdl.lookup import PartInfo
+from playtag.cables.sim import Jtagger
+from playtag.cables.sim.chain import partnames
+
+numtests = 300
+
+def reference(ir, parts, min_irbits, max_irbits):
+    ''' Try every split of the IR capture at its 1 bits.
+    '''
+    ones = [i for i in range(ir.bit_length() - 1) if ir >> i & 1]
+    total = ir.bit_length() - 1
+    result = set()
+    for starts in itertools.combinations(ones[1:], len(parts) - 1):
+        bounds = (0,) + starts + (total,)
+        lengths = tuple(y - x for (x, y) in zip(bounds, bounds[1:]))
+        values = [(n, ir >> x & ((1 << n) - 1)) for (x, n) in zip(bounds, lengths)]
+        for part, (n, value) in zip(parts, values):
+            if part.ir_capture:
+                if (n, value) not in part.possible_ir:
+                    break
+            elif not min_irbits <= n <= max_irbits:
+                break
+        else:
+            result.add(lengths)
+    return result
+
+def lookup(name):
+    return PartInfo(partnames()[name][0].replace('x', '0'))
+
+def makechain(parts, min_irbits=2, max_irbits=10):
+    chain = Chain.__new__(Chain)
+    chain[:] = parts
+    chain.numdevs = len(parts)
+    chain.min_irbits = min_irbits
+    chain.max_irbits = max_irbits
+    return chain
+
+def run():
+    known = [lookup(x) for x in ('xcf04s', 'xc3s500e', 'xc2v3000')]
+    unknown = PartInfo(0)
+    for index in range(numtests):
+        rand = random.Random(index)
+        numdevs = rand.randint(2, 6)
+        parts = [rand.choice(known + [unknown] * 3) for i in range(numdevs)]
+        chain = makechain(parts, 2, rand.choice((4, 6, 10)))
+        values = []
+        for part in parts:
+            capture = part.ir_capture or '1'.rjust(rand.randint(2, chain.max_irbits), rand.choice('01'))
+            capture = capture.replace('x', '0')
+            # Make the capture look like another split now and then
+            if not part.ir_capture and rand.random() < 0.3:
+                capture = ''.join(rand.choice('01') for x in capture[:-1]) + '1'
+            values.append(capture)
+        ir = int('1' + ''.join(reversed(values)), 2)
+        expected = reference(ir, parts, chain.min_irbits, chain.max_irbits)
+        assert tuple(len(x) for x in values) in expected, index
+        assert chain.find_ilengths(ir) == expected, (index, values)
+
+def run_nomatch():
+    ''' If no split matches the known parts, every split
+        at the 1 bits is returned, as if they were unknown.
+    '''
+    part = lookup('xcf04s')
+    chain = makechain([part, part])
+    ir = int('1' + '10000001' + '10000011', 2)
+    assert chain.find_ilengths(ir) == set([(7, 9), (8, 8)])
+    assert reference(ir, [PartInfo(0)] * 2, 2, 16) == set([(7, 9), (8, 8)])
+
+def run_long():
+    ''' Long chains of known and unknown parts.
+    '''
+    for numdevs in (33, 64):
+        rand = random.Random(numdevs)
+        names = [rand.choice(('xcf04s', 'xc3s500e', 'xc2v3000', 'noid:5', '0x1234567f:6'))
+                    for i in range(numdevs)]
+        config = UserConfig()
+        config.TEMPLATE_CACHE = None
+        config.CABLE_NAME = ' '.join(names)
+        cable = Jtagger(config)
+        start = time.time()
+        chain = Chain(cable, maxdev_idcode=64)
+        elapsed = time.time() - start
+        assert [x.idcode for x in chain] == [x.idcode for x in cable.chain.devices]
+        assert [len(x.ir_capture) for x in chain] == [x.irlen for x in cable.chain.devices]
+        assert elapsed < 1, elapsed
+
+def run_transfers():
+    ''' Chains of any length are read in one transfer, unless
+        there are more devices than the IR scans were sized for.
+    '''
+    for names, transfers in (('xcf04s', 1), ('xc3s500e noid:5 0x1234567f:6 xcf04s', 1),
+                             (' '.join(['xc3s500e'] * 32), 1), (' '.join(['noid:5'] * 64), 1),
+                             ('xcf04s ' + ' '.join(['noid:5'] * 70), 2)):
+        config = UserConfig()
+        config.TEMPLATE_CACHE = None
+        config.CHAIN_CACHE = None
+        config.CABLE_NAME = names
+        cable = Jtagger(config)
+        chain = Chain(cable)
+        assert cable.transfers == transfers, (names, cable.transfers)
+        assert [x.idcode for x in chain] == [x.idcode for x in cable.chain.devices]
+        assert [len(x.ir_capture) for x in chain] == [x.irlen for x in cable.chain.devices]
+
+if __name__ == '__main__':
+    run()
+    run_nomatch()
+    run_long()
+    run_transfers()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+'''
+Testcases for the template peephole optimizer.  Random JTAG templates
+with wasted state changes in them are run with and without the
+optimizer, and the clocks sent to the driver are checked to do the
+same things to the TAP.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.jtag.template import JtagTemplate, TDIVariable
+from playtag.jtag.states import states as jtagstates
+from playtag.jtag.peephole import optimizer, passable, reset_length
+from playtag.iotemplate.testconvert import EchoDriver
+
+numtemplates = 300
+
+class RecordDriver(EchoDriver):
+    ''' Loops TDI back to TDO, and keeps the clocks sent.
+    '''
+    def xfer_ints(self, tms, tdi, numbits, usetdo):
+        self.sent = tms, tdi, numbits
+        return EchoDriver.xfer_ints(self, tms, tdi, numbits, usetdo)
+
+def events(driver, startstate):
+    ''' Return what the clocks sent to a driver do to the TAP:
+        the TDI bits shifted, and the visits to states other
+        than the ones the optimizer is allowed to skip.
+    '''
+    tms, tdi, numbits = driver.sent
+    result = []
+    state = startstate
+    clock = 0
+    if state == jtagstates.unknown:
+        assert tms & ((1 << reset_length) - 1) == (1 << reset_length) - 1
+        state = jtagstates.reset
+        clock = reset_length
+    length = 0
+    for clock in range(clock, numbits):
+        if state.shifting:
+            result.append((state, (tdi >> clock) & 1))
+        length += 1
+        next = state[(tms >> clock) & 1]
+        if next != state:
+            if state == jtagstates.reset:
+                # Going back to reset from reset is the same as staying
+                if result[-1:] != [(state, 0)]:
+                    result.append((state, 0))
+            elif not state.shifting and (length > 1 or state not in passable):
+                result.append((state, length))
+            state, length = next, 0
+    result.append((state, 0))
+    return result
+
+def randtemplate(cable, rand, depth=2):
+    ''' Build a random template with loops and wasted state
+        changes, and the TDI data to go with it.
+    '''
+    template = JtagTemplate(cable, 'random')
+    template.update(template.select_dr)
+
+    def addbody(depth):
+        for i in range(rand.randint(1, 4)):
+            choice = rand.random()
+            if depth and choice < 0.2:
+                template.loop()
+                addbody(depth - 1)
+                template.endloop(rand.choice((0, 1, 2, 5)))
+            elif choice < 0.4:
+                waiting = rand.choice((template.idle, template.pause_dr, template.pause_ir))
+                template.update(waiting).update(rand.choice((0, 0, 1, 3)))
+                template.update(template.select_dr)
+            else:
+                numbits = rand.choice((1, 2, 7, 8, 33))
+                value = rand.choice((TDIVariable(rand.randint(0, 1)), rand.getrandbits(numbits)))
+                op = rand.choice((template.writei, template.writed, template.readi, template.readd))
+                if op in (template.writei, template.writed):
+                    op(numbits, value, adv=False)
+                else:
+                    op(numbits, tdi=value, adv=False)
+                shift = template.states[-1]
+                pause = shift == template.shift_dr and template.pause_dr or template.pause_ir
+                for j in range(rand.randint(0, 2)):
+                    template.update(pause).update(rand.choice((0, 0, 2)))
+                    count = rand.choice((1, 4))
+                    template.update(shift).update(count, rand.getrandbits(count))
+                template.update(template.select_dr)
+    addbody(depth)
+    tdi = [[], []]
+    for numbits, value in template.tdi:
+        if isinstance(value, TDIVariable):
+            tdi[value.index].append(rand.getrandbits(numbits))
+    while tdi and not tdi[-1]:
+        tdi.pop()
+    return template, tdi
+
+def run():
+    optimizer.reset()
+    total = 0
+    for index in range(numtemplates):
+        results = []
+        drivers = []
+        for enabled in (False, True):
+            optimizer.enable(enabled)
+            driver = RecordDriver()
+            drivers.append(driver)
+            template, tdi = randtemplate(driver, random.Random(index))
+            tdo = template(*tdi)
+            tdo = tdo is not None and list(tdo)
+            results.append((events(driver, template.states[0]), tdo))
+        assert results[0] == results[1], index
+        total += drivers[0].sent[2] - drivers[1].sent[2]
+    optimizer.enable()
+    stats = optimizer.snapshot()
+    assert len(stats) == 1 and stats[0]['saved'] == total > 0, (stats, total)
+    assert stats[0]['templates'] == numtemplates, stats
+    assert '%d TCKs saved' % total in optimizer.report()
+
+def run_simple():
+    ''' Check the savings for a few simple templates.
+    '''
+    template = JtagTemplate(RecordDriver())
+    template.update(template.idle).update(10)
+    assert optimizer.optimize(template) is template
+    template.writed(8, 0x55).update(template.idle).update(0).update(template.select_dr)
+    assert optimizer.optimize(template) is template     # goes through reset
+    template.update(template.shift_dr).update(8, 0x12)
+    template.update(template.pause_dr).update(template.shift_dr).update(8, 0x34)
+    template.update(template.exit1_dr).update(template.update_dr)
+    template.update(template.idle).update(template.select_dr)
+    new = optimizer.optimize(template)
+    assert len(template) - len(new) == 3 + 1, (len(template), len(new))
+    assert new.tdi[-8:] == [(8, 0x12), (1, '*'), (0, ''), (8, 0x34),
+                            (1, '*'), (1, '*'), (1, '*'), (0, '')], new.tdi
+    optimizer.enable(False)
+    assert optimizer.optimize(template) is template
+    optimizer.enable()
+
+def run_startstate():
+    ''' Templates with the same clocks but different starting
+        states are optimized differently, so they must not
+        share a device template.
+    '''
+    S = jtagstates
+    cable = RecordDriver()
+    idle = JtagTemplate(cable, startstate=S.idle).update(1).update(S.shift_dr).readd(8)
+    update = JtagTemplate(cable, startstate=S.update_dr)
+    update.update(S.idle, tdi=0).update(S.shift_dr).readd(8)
+    assert idle.tms == update.tms and idle.tdi == update.tdi and idle.tdo == update.tdo
+    assert idle.fingerprint() != update.fingerprint()
+    assert len(optimizer.optimize(update)) < len(optimizer.optimize(idle)) == len(idle)
+    for template in (update, idle):
+        list(template())
+        assert cable.sent[2] == len(optimizer.optimize(template)), template.states[0]
+
+if __name__ == '__main__':
+    run_simple()
+    run_startstate()
+    run()
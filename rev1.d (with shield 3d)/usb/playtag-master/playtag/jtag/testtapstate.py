@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+'''
+Testcases for TAP state tracking.  The same random series of template
+calls is run on a simple simulated TAP with and without tracking,
+and the TDO and the register contents are checked to be the same.
+'''
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.jtag.template import JtagTemplate, TDIVariable
+from playtag.iotemplate import IOTemplate, BitRuns
+from playtag.iotemplate.testconvert import EchoDriver, tobytes
+from playtag.lib.userconfig import UserConfig
+
+numtests = 50
+
+class TapSim(EchoDriver):
+    ''' One device with a 4 bit IR, a 32 bit IDCODE
+        register, BYPASS, and 32 bit user registers.
+    '''
+    idcode = 0x1234567f
+    irlen = 4
+    clocks = 0
+
+    def __init__(self):
+        self.state = JtagTemplate.reset
+        self.ir = 1
+        self.regs = {1: self.idcode}
+
+    def xfer_ints(self, tms, tdi, numbits, usetdo):
+        self.transfers += 1
+        self.clocks += numbits
+        tdo = 0
+        state, ir, regs = self.state, self.ir, self.regs
+        for i in range(numbits):
+            if state == JtagTemplate.reset:
+                ir = 1
+            elif state == JtagTemplate.capture_ir:
+                shift, length = 1, self.irlen
+            elif state == JtagTemplate.capture_dr:
+                shift, length = regs.get(ir, 0), 1 if ir == 15 else 32
+            elif state.shifting:
+                tdo |= (shift & 1) << i
+                shift = (shift >> 1) | (((tdi >> i) & 1) << (length - 1))
+            elif state == JtagTemplate.update_ir:
+                ir = shift
+            elif state == JtagTemplate.update_dr and ir not in (1, 15):
+                regs[ir] = shift
+            state = state[(tms >> i) & 1]
+        self.state, self.ir = state, ir
+        if usetdo:
+            return tobytes(tdo, numbits)
+
+def maketemplates(cable):
+    ''' Return a list of templates, and the number of
+        TDI values each one needs.
+    '''
+    var = TDIVariable(0)
+    templates = []
+    for reg in (2, 3):
+        t = JtagTemplate(cable, 'write%d' % reg)
+        templates.append((t.update(t.select_dr).writei(4, reg).writed(32, var), 1))
+        t = JtagTemplate(cable, 'read%d' % reg)
+        templates.append((t.writei(4, reg).readd(32), 0))
+        t = JtagTemplate(cable, 'swap%d' % reg)
+        templates.append((t.writei(4, reg).readd(32, tdi=var).readd(32, tdi=var), 2))
+    t = JtagTemplate(cable, 'idcode')
+    templates.append((t.readd(32), 0))
+    t = JtagTemplate(cable, 'loop')
+    t.update(t.select_dr).loop().writei(4, 2).writed(32, var).endloop(2)
+    templates.append((t, 2))
+    t = JtagTemplate(cable, 'readir')
+    templates.append((t.readi(4, tdi=3).readd(32), 0))
+    t = JtagTemplate(cable, 'partial')
+    templates.append((t.writei(4, 2).writed(16, var, adv=False).writed(16, var), 2))
+    return templates
+
+def runcalls(track, rand, batch=1):
+    ''' Make 30 random calls, in transactions of batch calls.
+    '''
+    cable = TapSim()
+    if track:
+        cable.track_tap()
+    templates = maketemplates(cable)
+    results = []
+    for i in range(0, 30, batch):
+        with cable.transaction():
+            for j in range(batch):
+                template, numvalues = rand.choice(templates)
+                results.append(template([rand.getrandbits(16) for x in range(numvalues)]))
+    return cable, [tdo is not None and list(tdo) for tdo in results]
+
+def run():
+    saved = 0
+    for index in range(numtests):
+        plain, expected = runcalls(False, random.Random(index))
+        for batch in (1, 5):
+            tracked, actual = runcalls(True, random.Random(index), batch)
+            assert expected == actual, index
+            assert plain.regs == tracked.regs, index
+            assert tracked.clocks <= plain.clocks, index
+        saved += plain.clocks - tracked.clocks
+    tap = tracked.tapstate
+    assert saved > 0 and tap.resets_skipped and tap.irloads_skipped, (saved, tap)
+
+def run_invalidate():
+    ''' The tracking has to be told about a TRST.
+    '''
+    cable = TapSim()
+    cable.track_tap()
+    templates = maketemplates(cable)
+    read2, idcode = templates[1][0], templates[6][0]
+    read2()
+    assert cable.tapstate.state == JtagTemplate.select_dr and cable.tapstate.ir is not None
+    cable.state, cable.ir = JtagTemplate.reset, 1
+    cable.invalidate_tap()
+    assert list(read2()) == [0]
+    assert list(idcode()) == [TapSim.idcode]
+
+def run_plain():
+    ''' A plain IOTemplate can leave the TAP anywhere.
+    '''
+    cable = TapSim()
+    cable.track_tap()
+    templates = maketemplates(cable)
+    write2, read2 = templates[0][0], templates[1][0]
+    write2([5])
+    reset = IOTemplate(cable)
+    reset.tms = BitRuns([1] * 5 + [0])
+    reset.tdi = [(6, 0)]
+    reset()
+    assert cable.tapstate.state == JtagTemplate.unknown
+    assert list(read2()) == [5]
+
+def run_config():
+    ''' TRACK_TAP_STATE=False on the command line turns
+        tracking off, and unknown settings are rejected.
+    '''
+    config = UserConfig()
+    config.readargs(['TRACK_TAP_STATE=False'])
+    cable = TapSim()
+    cable.track_tap()
+    cable.track_tap(config.TRACK_TAP_STATE)
+    assert cable.tapstate is None
+    cable.track_tap('True')
+    assert cable.tapstate is not None
+    cable.track_tap('False')
+    assert cable.tapstate is None
+    try:
+        cable.track_tap('off')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Expected ValueError')
+
+if __name__ == '__main__':
+    run()
+    run_invalidate()
+    run_plain()
+    run_config()
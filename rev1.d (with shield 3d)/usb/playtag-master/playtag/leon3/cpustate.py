@@ -94,6 +94,10 @@ class LeonCfg(object):
 
     def reset(self, firsttime=False):
         ### TODO: Add randomize, full stuff
+        with self.ahb.transaction():
+            self.reset_dsu(firsttime)
+
+    def reset_dsu(self, firsttime):
         dsu = self.dsu
         ctl = self.ctl
         brk = self.brk
@@ -137,13 +141,14 @@ class LeonCfg(object):
 
     def flushcache(self):
         asi = self.asireg
-        saveasi = asi.load().value
-        asi.store(2)
-        CCR = self.asi2.CCR
-        CCR.load()
-        CCR.FD = CCR.FI = 1  # Flush the caches
-        CCR.store()
-        asi.store(saveasi)
+        with self.ahb.transaction():
+            saveasi = asi.load().value
+            asi.store(2)
+            CCR = self.asi2.CCR
+            CCR.load()
+            CCR.FD = CCR.FI = 1  # Flush the caches
+            CCR.store()
+            asi.store(saveasi)
 
     def remap_addr(self, addr):
         topbits = addr & self.ram_mask
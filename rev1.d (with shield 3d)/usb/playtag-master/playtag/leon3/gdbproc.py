@@ -11,6 +11,8 @@ License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 
 from itertools import izip
 from ..gdb.parser import CmdGdb, hex2int, int2hex
+from ..iotemplate.counters import counters
+from ..jtag.peephole import optimizer
 from .cpustate import LeonCfg
 from .traptypes import traptypes
 
@@ -90,15 +92,16 @@ class CmdProcessor(CmdGdb):
         def poll(ctrlc=False):
             ctl = load_dsuctl()
             brk = load_dsubrk()
-            if not ctl.value & stopmask:
-                if not ctrlc:
-                    return
-                if not ctl.EE:
-                    self.write_console('\nWarning: DSU disabled!  System in inconsistent state.\n')
-                store_dsubrk(1)
+            with transaction():
+                if not ctl.value & stopmask:
+                    if not ctrlc:
+                        return
+                    if not ctl.EE:
+                        self.write_console('\nWarning: DSU disabled!  System in inconsistent state.\n')
+                    store_dsubrk(1)
 
-            store_dsuctl()
-            trap = load_dsutrap()
+                store_dsuctl()
+                trap = load_dsutrap()
             status = [traptypes[trap.TYPE] + (trap.EM and ' (error)' or '')]
             if ctl.PW:
                 status.append('powered-down')
@@ -119,6 +122,7 @@ class CmdProcessor(CmdGdb):
         store_dsuctl = self.store_dsuctl
         store_dsubrk = self.store_dsubrk
         stopmask = self.stopmask
+        transaction = self.transaction
         store_dsuctl()
         store_dsubrk(0)
         return poll
@@ -166,6 +170,7 @@ class CmdProcessor(CmdGdb):
         self.ahb_writebyte = ahb.writebyte
         self.ahb_writestring = ahb.writestring
         self.ahb_readstring = ahb.readstring
+        self.transaction = ahb.transaction
         self.psr = psr = dsu.PSR
         self.load_dsuctl = dsu.Control.load
         self.load_dsubrk = dsu.Break.load
@@ -255,6 +260,27 @@ class CmdProcessor(CmdGdb):
         self.ahb_write(0)
         return "Done."
 
+    def monitor_stats(self, line):
+        ''' Show the JTAG templates that have used the most time.
+            'stats <n>' shows the top n (default 10),
+            'stats all' shows all of them, 'stats reset'
+            clears the counters, and 'stats tcks' shows the
+            TCKs saved by the template optimizer.
+        '''
+        line = line.strip()
+        if line == 'reset':
+            counters.reset()
+            return "Template counters cleared"
+        if line == 'all':
+            return counters.report()
+        if line == 'tcks':
+            return optimizer.report()
+        try:
+            count = int(line or 10)
+        except ValueError:
+            return "Expected 'stats', 'stats <count>', 'stats all', 'stats tcks' or 'stats reset'"
+        return counters.report(count)
+
     def monitor_reset(self, line):
         if '-q' not in line.split():
             self.write_console("\n\nResetting the CPU.\n\nNOTE:  GDB DOESN'T KNOW THIS AND REGISTERS WILL BE WRONG!!!")
@@ -97,10 +97,15 @@ class BusDriver(dict):
         return cmd
 
     def readsingle(self, addr, size):
-        ''' Read an aligned byte, halfword, or word
+        ''' Read an aligned byte, halfword, or word.
+            The read is issued immediately, but the
+            result is not waited for until it is used.
+            The AHB returns the whole word, so the other
+            byte lanes are masked off.
         '''
-        cmd = self[False, 1, size]
-        yield (cmd([addr]).next() << (8 * (size + (addr & 3)))) >> 32
+        shift = 8 * (size + (addr & 3))
+        mask = (1 << (8 * size)) - 1
+        return (((x << shift) >> 32) & mask for x in self[False, 1, size]([addr]))
 
     def writesingle(self, addr, size, value):
         ''' Write an aligned byte, halfword, or word
@@ -113,17 +118,30 @@ class BusDriver(dict):
         ''' Read a power of 2 number of words.
             AHB transfers should not cross 1024-byte blocks, so
             we send one read address for each block.
+            The read is issued immediately, but the result
+            is not waited for until it is used.
         '''
         cmd = self[False, length, 4]
         addr = range(addr, addr + length * 4, 1024)
-        for word in cmd(addr):
-            yield word
+        return cmd(addr)
+
+    def transaction(self):
+        ''' Return a cable transaction, so that a series of
+            accesses can be sent in a single transfer.
+        '''
+        return self.jtagrw.transaction()
 
     def writemultiple(self, addr, value, offset, length):
         ''' write a power of 2 number of words.
             AHB transfers should not cross 1024-byte blocks, so
             we send one write address for each block.
+            A length of 0 waits for any queued writes.
         '''
+        if not length:
+            flush = getattr(self.jtagrw, 'flush', None)
+            if flush is not None:
+                flush()
+            return
         cmd = self[True, length, 4]
         addr = range(addr, addr + length * 4, 1024)
         cmd(addr, value[offset:offset+length])
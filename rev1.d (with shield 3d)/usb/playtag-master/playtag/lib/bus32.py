@@ -29,6 +29,9 @@ writestring requires a string parameter (even number of characters) and
 all the other write methods can accept either a single integer value or
 a list of values.
 
+"with bus.transaction():" lets the driver combine the accesses made inside
+the block (if it knows how to), e.g. into a single JTAG cable transfer.
+
 Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
 License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
 '''
@@ -36,6 +39,16 @@ import collections
 import ctypes
 import itertools
 from binascii import hexlify, unhexlify
+from .tracer import tracer
+
+class NoTransaction(object):
+    ''' Stands in for a transaction when the
+        driver cannot combine calls.
+    '''
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        pass
 
 class Bus32(object):
     _cachesize = 256
@@ -58,6 +71,22 @@ class Bus32(object):
         self._readmultiple = driver.readmultiple
         self._writesingle = driver.writesingle
         self._writemultiple = driver.writemultiple
+        self._transaction = getattr(driver, 'transaction', NoTransaction)
+        if tracer.enabled:
+            traced = tracer.traced
+            self._readsingle = traced(driver.readsingle, 'readsingle', 'bus', ('addr', 'size'))
+            self._readmultiple = traced(driver.readmultiple, 'readmultiple', 'bus', ('addr', 'length'))
+            self._writesingle = traced(driver.writesingle, 'writesingle', 'bus', ('addr', 'size'))
+            self._writemultiple = traced(driver.writemultiple, 'writemultiple', 'bus',
+                                         ('addr', None, 'offset', 'length'))
+
+    def transaction(self):
+        ''' Return a context manager that combines the driver
+            accesses made inside it into as few transfers as
+            possible.  Reads still return their data, but a
+            read sends the accesses made before it.
+        '''
+        return self._transaction()
 
     def _chunkinfo(self, addr, count, size=4):
         ''' For aligned accesses, return "chunks"
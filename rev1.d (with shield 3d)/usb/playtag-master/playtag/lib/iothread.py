@@ -0,0 +1,146 @@
+'''
+This module provides a per-cable I/O thread for asynchronous
+template execution.
+
+When a cable is in async mode, each template call is queued to the
+cable's I/O thread instead of being run by the caller:
+
+   - Write-only templates return None immediately.  Any error from
+     the driver is raised by the next call (or by flush()).
+   - Templates with TDO return a TdoFuture.  This is an iterator
+     over the TDO words, and only waits for the transfer when the
+     first word is requested.
+
+The calls are executed in order, so a read issued after a write
+sees the result of the write.  The cable drivers release the GIL
+during USB transfers, so the caller can build the next command while
+the cable is busy.
+
+The TDI data is copied when the call is queued, so the caller is free
+to reuse its buffers.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import sys
+import atexit
+import threading
+import Queue
+
+class IOThreadDefaults(object):
+    ASYNC_IO = False           # Run templates on a separate I/O thread
+
+# The threads that have not been stopped
+live_threads = set()
+
+def stop_all():
+    ''' Finish the queued calls on all the I/O threads at exit.
+    '''
+    for thread in list(live_threads):
+        thread.stop()
+
+atexit.register(stop_all)
+
+class TdoFuture(object):
+    ''' The TDO data from a queued template call.
+    '''
+    iterator = None
+    error = None
+
+    def __init__(self):
+        self.lock = lock = threading.Lock()
+        lock.acquire()
+
+    def set_result(self, result, error=None):
+        self.result_list = result
+        self.error = error
+        self.lock.release()
+
+    def done(self):
+        return not self.lock.locked()
+
+    def result(self):
+        ''' Wait for the transfer, and return a list of the TDO words.
+        '''
+        lock = self.lock
+        lock.acquire()
+        lock.release()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result_list
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        iterator = self.iterator
+        if iterator is None:
+            iterator = self.iterator = iter(self.result())
+        return iterator.next()
+
+class IOThread(threading.Thread):
+    ''' Runs template calls in order for a single cable.
+    '''
+    error = None
+    stopped = False
+
+    def __init__(self, name='playtag I/O'):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.queue = Queue.Queue()
+        self.start()
+        live_threads.add(self)
+
+    def run(self):
+        queue = self.queue
+        while 1:
+            item = queue.get()
+            if item is None:
+                queue.task_done()
+                break
+            func, args, future = item
+            try:
+                result = func(*args)
+                if future is not None:
+                    future.set_result(list(result))
+            except:
+                if future is not None:
+                    future.set_result(None, sys.exc_info())
+                else:
+                    self.error = sys.exc_info()
+            queue.task_done()
+
+    def check(self):
+        ''' Raise any error from a previous write-only call.
+        '''
+        error = self.error
+        if error is not None:
+            self.error = None
+            raise error[0], error[1], error[2]
+
+    def submit(self, func, driver, tdi_array, hastdo):
+        ''' Queue a template call.  Returns a TdoFuture
+            if the template has TDO data, otherwise None.
+        '''
+        self.check()
+        future = TdoFuture() if hastdo else None
+        tdi_array = [list(x) for x in tdi_array]
+        self.queue.put((func, (driver, tdi_array), future))
+        return future
+
+    def flush(self):
+        ''' Wait for all queued calls to finish.
+        '''
+        self.queue.join()
+        self.check()
+
+    def stop(self):
+        ''' Wait for all queued calls, and then end the thread.
+            Safe to call more than once.
+        '''
+        if not self.stopped:
+            self.stopped = True
+            live_threads.discard(self)
+            self.queue.put(None)
+            self.queue.join()
+        self.check()
@@ -0,0 +1,151 @@
+'''
+This module profiles how long playtag takes to start up.
+
+If the PLAYTAG_STARTUP environment variable is set to a non-empty
+value when the playtag package is first imported, then playtag
+records how long each module after that takes to import, and how
+long each of the one-time initializations that are put off until
+they are first needed takes.  A report of both is written to stderr
+at exit.  (The environment is used, rather than a configuration
+option, because most of the imports are done before the command
+line has been read.)
+
+The import report is in the same form as python 3's -X importtime:
+the time spent in the module itself, the time including the modules
+it imported, and the module name, indented to show which module
+imported it.
+
+The initializations that are timed are listed in deferred below,
+by module and attribute name.  Chain discovery is included, so its
+"done at" time is the time from startup to the first IDCODE.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import os
+import sys
+import imp
+import time
+import atexit
+
+# Initializations to time, by module, as attribute names in the
+# module (with a dot for a method or classmethod of a class).
+deferred = {
+    'playtag.bsdl.lookup': ['PartInfo.loadcaches'],
+    'playtag.jtag.states': ['findpaths'],
+    'playtag.cables.ftdi.d2xx': ['sysinfo'],
+    'playtag.cables.ftdi.d2xx_wrapper': ['bindlibrary'],
+    'playtag.jtag.discover': ['Chain.__init__'],
+}
+
+class ModuleLoader(object):
+    ''' Loads one module for the profiler.
+    '''
+    def __init__(self, profile, info):
+        self.profile = profile
+        self.info = info
+
+    def load_module(self, fullname):
+        profile = self.profile
+        f = self.info[0]
+        depth = len(profile.stack)
+        profile.stack.append(0.0)
+        start = time.time()
+        try:
+            module = imp.load_module(fullname, *self.info)
+        finally:
+            if f is not None:
+                f.close()
+            total = time.time() - start
+            children = profile.stack.pop()
+            if profile.stack:
+                profile.stack[-1] += total
+            profile.imports.append((total - children, total, depth, fullname))
+        profile.wrap(module)
+        return module
+
+class StartupProfile(object):
+    ''' Records module imports (as a finder on sys.meta_path),
+        and the deferred initializations.
+    '''
+    enabled = False
+
+    def __init__(self):
+        self.imports = []
+        self.inits = []
+        self.stack = []
+        self.initdepth = 0
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.start = time.time()
+        sys.meta_path.insert(0, self)
+        atexit.register(self.report)
+
+    def find_module(self, fullname, path=None):
+        try:
+            info = imp.find_module(fullname.rpartition('.')[2], path)
+        except ImportError:
+            return None
+        return ModuleLoader(self, info)
+
+    def wrap(self, module):
+        for name in deferred.get(module.__name__, ()):
+            names = name.split('.')
+            owner = module
+            for attrname in names[:-1]:
+                owner = getattr(owner, attrname)
+            attrname = names[-1]
+            func = vars(owner)[attrname]
+            if isinstance(func, classmethod):
+                func = classmethod(self.timed(func.__func__, module.__name__, name))
+            else:
+                func = self.timed(func, module.__name__, name)
+            setattr(owner, attrname, func)
+
+    def timed(self, func, modname, name):
+        ''' Return a version of func that records how long it takes.
+        '''
+        inits = self.inits
+        def timed_func(*args, **kwds):
+            depth = self.initdepth
+            self.initdepth = depth + 1
+            start = time.time()
+            try:
+                return func(*args, **kwds)
+            finally:
+                stop = time.time()
+                self.initdepth = depth
+                inits.append((stop - start, stop - self.start, depth, modname, name))
+        timed_func.__name__ = func.__name__
+        timed_func.__doc__ = func.__doc__
+        return timed_func
+
+    def results(self):
+        ''' Return the report as a string.
+        '''
+        result = ['', 'Playtag startup profile (times in ms)', '',
+                  '     self     total  module']
+        for selftime, total, depth, name in self.imports:
+            result.append('%9.2f %9.2f  %s%s' % (selftime * 1000, total * 1000, '  ' * depth, name))
+        result.extend(['', '     time   done at  initialization'])
+        for elapsed, done, depth, modname, name in self.inits:
+            result.append('%9.2f %9.2f  %s%s %s' % (elapsed * 1000, done * 1000, '  ' * depth, modname, name))
+        toplevel = sum(x[1] for x in self.imports if not x[2])
+        result.extend(['', 'Imports: %0.2f ms' % (toplevel * 1000),
+                       'Initializations: %0.2f ms' % (sum(x[0] for x in self.inits if not x[2]) * 1000),
+                       'Total since playtag import: %0.2f ms' % ((time.time() - self.start) * 1000), ''])
+        return '\n'.join(result)
+
+    def report(self, f=None):
+        (f or sys.stderr).write(self.results())
+
+profile = StartupProfile()
+
+def configure(environ=os.environ):
+    ''' Turn the profiler on if the user asked for it.
+    '''
+    if environ.get('PLAYTAG_STARTUP'):
+        profile.enable()
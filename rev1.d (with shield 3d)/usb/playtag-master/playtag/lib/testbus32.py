@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
+import os
+import sys
 import random
 import itertools
 
-from bus32 import Bus32
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.lib.bus32 import Bus32
 
 exhaustive = False
 randomized = True
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+'''
+Testcases for asynchronous template execution.
+'''
+
+import os
+import sys
+import time
+import random
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from playtag.iotemplate.testconvert import EchoDriver, randtemplate
+from playtag.leon3.jtag_ahb import BusDriver
+from playtag.lib.bus32 import Bus32
+from playtag.lib.userconfig import UserConfig
+from playtag.lib.iothread import live_threads
+
+numtemplates = 50
+delay = 0.005
+
+class SlowDriver(EchoDriver):
+    ''' Takes a while for every transfer, and can be told to fail.
+    '''
+    fail = False
+    def xfer_ints(self, tms, tdi, numbits, usetdo):
+        time.sleep(delay)
+        if self.fail:
+            raise IOError("Cable unplugged")
+        return EchoDriver.xfer_ints(self, tms, tdi, numbits, usetdo)
+
+def busdriver(cable):
+    BypassInfo = namedtuple('BypassInfo', 'prev_ir prev_dr next_ir next_dr')
+    driver = BusDriver.__new__(BusDriver)
+    driver.ilength = 6
+    driver.cmdi = 2
+    driver.datai = 3
+    driver.bypass_info = BypassInfo('', '', '', '')
+    driver.jtagrw = cable
+    return driver
+
+def run_templates():
+    ''' Same results as synchronous; write-only calls don't wait.
+    '''
+    for index in range(numtemplates):
+        results = []
+        for enable in (False, True):
+            driver = SlowDriver()
+            driver.async_mode(enable)
+            template, tdi = randtemplate(driver, random.Random(index))
+            tdo = [template(*tdi)]      # Compiles the template
+            start = time.time()
+            tdo += [template(*tdi) for i in range(2)]
+            if not template.tdo and enable:
+                assert time.time() - start < delay, time.time() - start
+            results.append([x is not None and list(x) for x in tdo])
+            driver.async_mode(False)
+        assert results[0] == results[1], (index, results)
+
+def run_errors():
+    driver = SlowDriver()
+    driver.async_mode()
+    template, tdi = randtemplate(driver, random.Random(0))
+    driver.fail = True
+    template.tdo = []
+    template.devtemplate = None
+    template(*tdi)
+    try:
+        driver.flush()
+    except IOError:
+        pass
+    else:
+        raise AssertionError("Expected IOError")
+    driver.fail = False
+    driver.flush()
+    driver.async_mode(False)
+
+def run_bus32():
+    ''' All the chunks are read before any are consumed.
+    '''
+    results = []
+    for enable in (False, True):
+        cable = SlowDriver()
+        cable.async_mode(enable)
+        bus = Bus32(busdriver(cable))
+        data = bus._readaligned(0, 3 * BusDriver.max_bytes / 4)
+        cable.flush()
+        assert cable.transfers == 3, cable.transfers
+        results.append(list(data))
+        cable.async_mode(False)
+    assert results[0] == results[1]
+
+def run_config():
+    ''' ASYNC_IO=False on the command line leaves async mode
+        off, and unknown settings are rejected.
+    '''
+    config = UserConfig()
+    config.readargs(['ASYNC_IO=False'])
+    driver = SlowDriver()
+    driver.async_mode(config.ASYNC_IO)
+    assert driver.iothread is None
+    driver.async_mode('True')
+    assert driver.iothread is not None
+    try:
+        driver.async_mode('yes')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError")
+    driver.async_mode('False')
+    assert driver.iothread is None
+
+    # Stopped threads are not kept until exit
+    for i in range(3):
+        driver.async_mode(True)
+        driver.async_mode(False)
+    assert not live_threads
+
+def run():
+    run_templates()
+    run_errors()
+    run_bus32()
+    run_config()
+
+if __name__ == '__main__':
+    run()
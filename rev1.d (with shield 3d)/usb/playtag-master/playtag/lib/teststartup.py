@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+'''
+Testcases for the startup profiler, and for the initializations
+that are put off until they are first needed.
+'''
+
+import os
+import sys
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+sys.path.insert(0, root)
+
+from playtag.bsdl.lookup import PartInfo, PartParameters
+
+def python(args, **environ):
+    env = dict(os.environ)
+    env.update(environ)
+    process = subprocess.Popen([sys.executable] + args, cwd=root, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    assert not process.returncode, stderr
+    return stdout, stderr
+
+def run_lazy():
+    ''' Nothing is done at import.
+    '''
+    python(['-c', '''if 1:
+        from playtag.bsdl.lookup import PartInfo
+        from playtag.jtag.states import states, OneState
+        from playtag.cables.ftdi import d2xx
+        from playtag.cables.ftdi.d2xx_wrapper import FT, Unbound
+        assert not PartInfo.cachesloaded and not PartInfo.partcache
+        assert not OneState.pathsfound
+        assert d2xx.info is None
+        assert isinstance(vars(FT)['Open'], Unbound)
+        assert states.reset.shift_dr == [0, 1, 0, 0] and OneState.pathsfound
+        assert isinstance(FT.loaded, bool) and not isinstance(vars(FT)['Open'], Unbound)
+        assert PartInfo(0x05046093).name == 'xcf04s' and PartInfo.cachesloaded
+    '''])
+
+def run_lookup():
+    ''' Parts added later win, whether or not they have x's.
+    '''
+    idcode = '00000101000001000110000010010011'
+    assert PartInfo(idcode).name == 'xcf04s'
+    PartInfo.addparts([PartParameters('xxxx' + idcode[4:], '01', 'wild')])
+    assert PartInfo(idcode).name == 'wild'
+    assert PartInfo('1111' + idcode[4:]).name == 'wild'
+    PartInfo.addparts([PartParameters(idcode, '01', 'exact')])
+    assert PartInfo(idcode).name == 'exact'
+    assert PartInfo('1111' + idcode[4:]).name == 'wild'
+    PartInfo.addparts([PartParameters('1111' + idcode[4:-12] + 'x' * 12, '01', 'wider')])
+    assert PartInfo('1111' + idcode[4:]).name == 'wider'
+    assert PartInfo(idcode).name == 'exact'
+
+def run_report():
+    args = ['tools/jtag/discover.py', 'sim', 'xcf04s leon3', 'SHOW_TEMPLATE_CACHE=0']
+    stdout, stderr = python(args, PLAYTAG_STARTUP='1')
+    assert 'xcf04s' in stdout
+    for name in ('playtag.jtag.discover', 'playtag.cables.sim.driver',
+                 'playtag.bsdl.lookup PartInfo.loadcaches', 'playtag.jtag.states findpaths',
+                 'playtag.jtag.discover Chain.__init__', 'Total since playtag import'):
+        assert name in stderr, (name, stderr)
+    stdout, stderr = python(args, PLAYTAG_STARTUP='')
+    assert 'startup' not in stderr, stderr
+
+if __name__ == '__main__':
+    run_lazy()
+    run_lookup()
+    run_report()
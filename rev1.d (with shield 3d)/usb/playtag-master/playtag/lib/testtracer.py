@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+Testcases for the tracer.  GDB memory packets are sent through the
+packet layer to the LEON3 command processor on the sim cable, and
+the spans from each layer must nest inside the ones above it.
+'''
+
+import os
+import sys
+import json
+from StringIO import StringIO
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+sys.path.insert(0, root)
+
+from playtag.lib.tracer import tracer
+from playtag.lib.userconfig import UserConfig
+from playtag.gdb.transport import lowlevel, calcsum
+from playtag.leon3.jtag_ahb import LeonMem, BusDriver
+from playtag.leon3.gdbproc import CmdProcessor
+from playtag.cables.sim import Jtagger
+
+# Each category of span, and the one it must be inside
+parents = dict(command='packet', bus='command', template='bus', usb='template')
+
+def makeconfig():
+    config = UserConfig()
+    config.CABLE_NAME = 'xcf04s leon3'
+    config.TEMPLATE_CACHE = None
+    config.SHOW_CHAIN = False
+    config.JTAGID_FILE = os.path.join(root, 'tools/leon3/example_id.txt')
+    config.DSU_ADDR = 0x70000000
+    config.DSU_ENABLE_ADDR = 0
+    config.AHB_RAM_ADDR = 0x40000000
+    config.AHB_RAM_SIZE = 0x10000
+    return config
+
+def session(processor):
+    ''' Write and read back 8 KB, and return the replies.
+    '''
+    data = ''.join('%02x' % (x & 255) for x in range(4096))
+    packets = ['M40000001,1000:' + data, 'm40000001,1000', 'g']
+    stream = ''.join('$%s#%02x+' % (x, calcsum(x)) for x in packets)
+    chunks = [stream, '']
+    replies = []
+    def write(data, packetize):
+        if packetize:
+            replies.append(data)
+    lowlevel(lambda timeout=None: chunks.pop(0), write, processor)
+    assert replies[:2] == ['OK', data], replies[:2]
+    return replies
+
+def run():
+    tracer.enable(False)
+    tracer.reset()
+    cable = Jtagger(makeconfig())
+    bus = LeonMem(cable, makeconfig())
+    assert isinstance(bus._readmultiple.im_self, BusDriver)     # Not wrapped
+    expected = session(CmdProcessor(bus, makeconfig()))
+    assert not tracer.events
+
+    tracer.enable()
+    cable = Jtagger(makeconfig())
+    processor = CmdProcessor(LeonMem(cable, makeconfig()), makeconfig())
+    tracer.reset()
+    assert session(processor) == expected
+    tracer.enable(False)
+
+    results = json.loads(json.dumps(tracer.results()))
+    events = [x for x in results['traceEvents'] if x['ph'] == 'X']
+    cats = set(x['cat'] for x in events)
+    assert cats >= set('packet command bus template usb'.split()), cats
+    assert len([x for x in events if x['cat'] == 'packet']) == 3
+    for event in events:
+        cat = parents.get(event['cat'])
+        if cat is None:
+            continue
+        start, stop = event['ts'], event['ts'] + event['dur']
+        inside = [x for x in events if x['cat'] == cat and x['tid'] == event['tid'] and
+                    x['ts'] <= start and stop <= x['ts'] + x['dur']]
+        assert inside, event
+    dump = StringIO()
+    tracer.dump(dump)
+    assert json.loads(dump.getvalue()) == results
+    tracer.reset()
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,199 @@
+'''
+This module provides a tracer that records when each layer of
+playtag starts and finishes its part of the work, and writes a
+timeline in the Chrome trace event format, which can be viewed
+with chrome://tracing or https://ui.perfetto.dev.
+
+The spans recorded, and their categories, are:
+
+   packet    -- a GDB remote protocol packet, from when it has
+                been read until the reply is sent (gdb/transport.py)
+   poll      -- a call to a command processor's poll function
+   command   -- the command processor's handling of a packet
+   bus       -- a Bus32 access to its driver (one chunk)
+   template  -- a template call on a cable
+   usb       -- a cable driver transfer, and (for the ftdi
+                cable) the D2XX Write and Read calls inside it
+
+The spans of each thread nest, so e.g. the time between the usb
+spans of a template is host time, and a gap between templates in
+a packet is time spent in the layers above.  With ASYNC_IO, the
+template and usb spans are on the I/O thread.  Reads that return
+their TDO lazily finish their bus and template spans when the
+transfer is done, not when the data is used.
+
+The tracer is turned on with tracer.enable(), or by setting the
+TRACE_FILE configuration option to the name of the file to write
+the trace to at exit.  Each layer only adds its hooks when the
+object that does the work is made (or the GDB connection starts)
+while the tracer is on, so when it is off the only cost is a check
+of tracer.enabled for each template call.
+
+Copyright (C) 2011 by Patrick Maupin.  All rights reserved.
+License information at: http://playtag.googlecode.com/svn/trunk/LICENSE.txt
+'''
+import os
+import time
+import json
+import atexit
+import thread
+import threading
+
+class TracerDefaults(object):
+    TRACE_FILE = None           # Name of a file to write a Chrome trace to at exit
+
+class NullSpan(object):
+    ''' Returned by Tracer.span() when tracing is off.
+    '''
+    def __enter__(self):
+        pass
+    def __exit__(self, *exc):
+        pass
+
+nullspan = NullSpan()
+
+class Span(object):
+    ''' Context manager that records a span when it exits.
+    '''
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.cat, self.start, self.args)
+
+class TracedDriver(object):
+    ''' Stands in for the cable driver when a template
+        is applied, and records a span for each transfer.
+    '''
+    def __init__(self, driver, tracer):
+        self.driver = driver
+        self.tracer = tracer
+
+    def __call__(self, *args):
+        numbits = len(args[0]) if isinstance(args[1], str) else args[1]
+        with self.tracer.span('transfer', 'usb', bits=numbits):
+            return self.driver(*args)
+
+    def xfer_ints(self, *args):
+        with self.tracer.span('transfer', 'usb', bits=args[-2]):
+            return self.driver.xfer_ints(*args)
+
+    def xfer_bin(self, *args):
+        with self.tracer.span('transfer', 'usb', bits=args[-2]):
+            return self.driver.xfer_bin(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+class Tracer(object):
+    enabled = False
+    fname = None
+
+    def __init__(self):
+        self.reset()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.events = []
+        self.threads = {}
+        self.start = time.time()
+
+    def configure(self, UserConfig):
+        ''' Turn tracing on if the user asked for it,
+            and arrange for the trace to be written.
+        '''
+        UserConfig.add_defaults(TracerDefaults)
+        fname = UserConfig.TRACE_FILE
+        if not fname:
+            return
+        self.enable()
+        if self.fname is None:
+            atexit.register(self.exit_write)
+        self.fname = fname
+
+    def exit_write(self):
+        f = open(self.fname, 'wb')
+        self.dump(f)
+        f.close()
+
+    def add(self, name, cat, start, args=None, get_ident=thread.get_ident):
+        ''' Record a span that started at start,
+            and finishes now.
+        '''
+        tid = get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        self.events.append((name, cat, start, time.time(), tid, args))
+
+    def span(self, name, cat, **args):
+        ''' Return a context manager that records
+            a span for the code inside it.
+        '''
+        if not self.enabled:
+            return nullspan
+        return Span(self, name, cat, args or None)
+
+    def traced(self, func, name, cat, argnames=()):
+        ''' Return a version of func that records a span for
+            each call.  The values of the first positional
+            arguments are recorded under argnames (skipping
+            any argument whose name is None).
+        '''
+        span = self.span
+        def traced_func(*args):
+            with span(name, cat, **dict((x, y) for (x, y) in zip(argnames, args) if x)):
+                return func(*args)
+        return traced_func
+
+    def traced_command(self, func):
+        ''' Return a version of a GDB command processor that
+            records a span named by the command letter
+            for each packet it handles.
+        '''
+        span = self.span
+        def traced_func(data):
+            with span(data[:1], 'command'):
+                return func(data)
+        return traced_func
+
+    def traced_template(self, func):
+        ''' Return a version of a device template transfer
+            function that records a span for the call, and
+            for each of its transfers.
+        '''
+        span = self.span
+        cmdname = getattr(func, 'cmdname', '')
+        def traced_func(driver, tdi_array):
+            with span(cmdname, 'template'):
+                return func(TracedDriver(driver, self), tdi_array)
+        return traced_func
+
+    def results(self):
+        ''' Return the trace as a dictionary in the Chrome
+            trace event format, with times in microseconds
+            from when the tracer was reset.
+        '''
+        pid = os.getpid()
+        base = self.start
+        events = [dict(name='thread_name', ph='M', pid=pid, tid=tid, args=dict(name=name))
+                    for (tid, name) in sorted(self.threads.iteritems())]
+        for name, cat, start, stop, tid, args in self.events:
+            event = dict(name=name, cat=cat, ph='X', pid=pid, tid=tid,
+                         ts=round((start - base) * 1e6, 1), dur=round((stop - start) * 1e6, 1))
+            if args:
+                event['args'] = args
+            events.append(event)
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def dump(self, f):
+        json.dump(self.results(), f, separators=(',', ':'))
+
+tracer = Tracer()
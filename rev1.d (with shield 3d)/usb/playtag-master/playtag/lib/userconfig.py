@@ -1,6 +1,19 @@
 import os
 import sys
 
+# Command line values that are not strings
+constants = {'True': True, 'False': False, 'None': None}
+
+def flag(value, name):
+    ''' Return the value of an on/off setting, which can
+        also be given as 'True', 'False' or 'None'.
+    '''
+    if isinstance(value, basestring):
+        if value not in constants:
+            raise ValueError("Expected %s to be True or False, not %s" % (name, repr(value)))
+        value = constants[value]
+    return value
+
 class UserConfig(object):
     LOGPACKETS = False
     CABLE_DRIVER = None
@@ -9,6 +22,7 @@ class UserConfig(object):
     SHOW_CABLE = True
     SHOW_CONFIG = True
     SOCKET_ADDRESS = 2222
+    TEMPLATE_CONVERTER = None
     root = None
 
     def loadfile(self, fname):
@@ -38,7 +52,7 @@ class UserConfig(object):
             try:
                 value = int(value,0)
             except (TypeError, ValueError):
-                pass
+                value = constants.get(value, value)
             setattr(self, name.upper(), value)
         if usesys:
             sys.argv[1:] = args
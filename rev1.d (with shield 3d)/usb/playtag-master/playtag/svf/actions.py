@@ -52,6 +52,9 @@ class SvfActions(object):
 
     def TRST(self, data):
         self.curstate = JtagTemplate.unknown
+        invalidate = getattr(self.driver, 'invalidate_tap', None)
+        if invalidate is not None:
+            invalidate()
 
     def State(self, data):
         prevstate = data.prevstate
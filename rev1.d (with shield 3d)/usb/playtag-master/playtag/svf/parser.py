@@ -233,10 +233,10 @@ class ParseSVF(object):
                         raise SvfError("%s is not a valid integer number" % num)
             elif param in self.stable:
                 if do_end and not did_end and clock_specified:
-                    self.ENDSTATE = states[param]
+                    self.ENDSTATE = self.states[param]
                     did_end = True
                 elif not do_end and not clock_specified:
-                    self.RUNSTATE = self.ENDSTATE = states[param]
+                    self.RUNSTATE = self.ENDSTATE = self.states[param]
                 else:
                     raise SvfError('Unexpected state %s' % param)
             elif do_end:
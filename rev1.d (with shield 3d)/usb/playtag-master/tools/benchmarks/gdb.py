@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+'''
+Time the GDB server path from end to end, without hardware.
+
+A scripted GDB client talks the remote protocol to the real packet
+layer (gdb/transport.lowlevel) and LEON3 command processor, which
+use the real AHB JTAG driver and Bus32 on top of the sim cable with
+a simulated LEON3 (cables/sim/leon3.py).
+
+The client measures:
+
+  - memory write (M) and read (m) throughput, in 4 KB packets
+  - register read (g) latency
+  - the time for a continue (c) until the target stops, and the
+    number of times the DSU was polled
+
+For each, the number of cable transfers and TCKs is shown too,
+since those are what cost time on a real cable.  The time includes
+the simulation, so it is an upper bound on the host overhead.
+
+Configuration options can be given on the command line, e.g.:
+
+    gdb.py TEMPLATE_CONVERTER=bin ASYNC_IO=1
+
+usage: gdb.py [<KB to transfer>] [<option>=<value> ...]
+'''
+
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(__file__), '../..')
+sys.path.insert(0, root)
+
+from playtag.lib.userconfig import UserConfig
+from playtag.gdb.transport import lowlevel, calcsum
+from playtag.leon3.jtag_ahb import LeonMem
+from playtag.leon3.gdbproc import CmdProcessor
+from playtag.cables.sim import Jtagger
+
+class BenchDefaults(object):
+    CABLE_NAME = 'leon3'
+    JTAGID_FILE = os.path.join(root, 'tools/leon3/example_id.txt')
+    DSU_ADDR = 0x70000000
+    DSU_ENABLE_ADDR = 0x78000000
+    DSU_ENABLE_DATA = 0x00000001
+    AHB_RAM_ADDR = 0x10000000
+    AHB_RAM_SIZE = 0x00100000
+    SHOW_CHAIN = False
+    TEMPLATE_CACHE = None
+
+class ScriptedClient(object):
+    ''' Plays the GDB side of the remote protocol, in the same
+        thread as lowlevel().  The script is a generator that
+        yields the packets to send (or None to let a poll
+        timeout happen), and is sent the packets that came back.
+        Received packets are acknowledged automatically.
+    '''
+    def __init__(self, script):
+        self.script = script
+        self.replies = None     # Nothing sent yet
+
+    def packet(self, data):
+        return '$%s#%02x' % (data, calcsum(data))
+
+    def read(self, timeout=None):
+        replies, self.replies = self.replies, []
+        acks = len(replies or ()) * '+'
+        try:
+            data = self.script.send(replies) if replies is not None else self.script.next()
+        except StopIteration:
+            return ''
+        if data is None:
+            if acks:
+                return acks
+            assert timeout is not None, 'Client waiting when the server is not polling'
+            return None
+        return acks + self.packet(data)
+
+    def write(self, data, packetize):
+        if packetize:
+            self.replies.append(data)
+
+def makeserver(config):
+    ''' Return the cable, simulated LEON3, and command processor.
+    '''
+    cable = Jtagger(config)
+    leon, = [x for x in cable.chain.devices if hasattr(x, 'ahb')]
+    processor = CmdProcessor(LeonMem(cable, config), config)
+    return cable, leon, processor
+
+def session(cable, leon, config, numkb, results):
+    ''' The client script.  Each step adds a result of
+        (name, amount, unit, seconds, transfers, tcks).
+    '''
+    ram = config.AHB_RAM_ADDR
+    chunk = 4096
+    data = ''.join('%02x' % (x & 255) for x in range(chunk))
+
+    def mark():
+        cable.flush()
+        return time.time(), cable.transfers, cable.tcks
+
+    def result(name, amount, unit, start):
+        now = mark()
+        results.append((name, amount, unit, now[0] - start[0],
+                        now[1] - start[1], now[2] - start[2]))
+
+    start = mark()
+    for addr in range(ram, ram + numkb * 1024, chunk):
+        reply = yield 'M%x,%x:%s' % (addr, chunk, data)
+        assert reply == ['OK'], reply
+    result('write (M)', numkb, 'KB', start)
+
+    start = mark()
+    for addr in range(ram, ram + numkb * 1024, chunk):
+        reply = yield 'm%x,%x' % (addr, chunk)
+        assert reply == [data], 'Readback error at 0x%x' % addr
+    result('read (m)', numkb, 'KB', start)
+
+    count = 20
+    start = mark()
+    for i in range(count):
+        reply = yield 'g'
+        assert len(reply) == 1 and len(reply[0]) == 72 * 8, reply
+    result('registers (g)', count, 'reads', start)
+
+    count = 5
+    dsu = leon.ahb.dsu
+    polls = dsu.polls
+    start = mark()
+    for i in range(count):
+        reply = yield 'c'
+        while not reply or not reply[-1].startswith('S'):
+            reply = yield None
+    result('continue (c)', count, 'stops', start)
+    results.append(('DSU polls per stop', (dsu.polls - polls) / count, '', None, None, None))
+
+def run(numkb=64, args=None):
+    config = UserConfig()
+    vars(config).update((x, y) for (x, y) in vars(BenchDefaults).items() if x.isupper())
+    config.readargs(args or [])
+    cable, leon, processor = makeserver(config)
+    results = []
+    client = ScriptedClient(session(cable, leon, config, numkb, results))
+    lowlevel(client.read, client.write, processor, poll_ms=0)
+    return results
+
+def report(results):
+    print
+    print '%-20s %10s %-6s %12s %12s %12s' % ('operation', 'count', '', 'rate', 'transfers', 'TCKs')
+    print
+    for name, amount, unit, seconds, transfers, tcks in results:
+        if seconds is None:
+            print '%-20s %10s' % (name, amount)
+            continue
+        if unit == 'KB':
+            rate = '%8.1f KB/s' % (amount / seconds)
+        else:
+            rate = '%8.3f ms' % (1000.0 * seconds / amount)
+        print '%-20s %10d %-6s %12s %12d %12d' % (name, amount, unit, rate, transfers, tcks)
+    print
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = [x for x in args if '=' in x]
+    report(run(*[int(x) for x in args if '=' not in x], args=options))
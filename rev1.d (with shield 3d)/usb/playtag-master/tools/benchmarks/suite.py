@@ -0,0 +1,537 @@
+#! /usr/bin/env python
+'''
+Time the host-side hot paths of playtag, without any hardware,
+and save or compare the results.
+
+Each benchmark times one operation, repeated until MIN_TIME
+milliseconds have passed, and keeps the best time per call out
+of REPEAT tries.  Cable operations use the null cable, so no I/O
+is done.  The inputs (SVF and BSDL files, etc.) are generated
+here, so the results only change when the code does.
+
+Options (given as <option>=<value> on the command line):
+
+    SAVE       -- write the results to this JSON file
+    COMPARE    -- compare the results with this JSON file, and
+                  flag any benchmark that got slower by more than
+                  THRESHOLD percent (the exit status is then 1)
+    THRESHOLD  -- percent slowdown counted as a regression (10)
+    REPEAT     -- number of tries for each benchmark (3)
+    MIN_TIME   -- milliseconds to run each try for (200)
+
+Give benchmark names to run just those (a name ending in '*'
+matches every name that starts with the rest of it).  Without
+any names, all of them are run.  LIST=1 lists them.
+
+    suite.py SAVE=before.json
+    suite.py COMPARE=before.json
+    suite.py COMPARE=before.json apply_*
+
+usage: suite.py [<option>=<value> ...] [<benchmark> ...]
+'''
+
+import os
+import sys
+import time
+import json
+import shutil
+import random
+import platform
+import tempfile
+import itertools
+import subprocess
+
+root = os.path.join(os.path.dirname(__file__), '../..')
+sys.path.insert(0, root)
+
+from playtag.lib.userconfig import UserConfig
+from playtag.lib.bus32 import Bus32
+from playtag.leon3.jtag_ahb import BusDriver
+from playtag.cables.ftdi.mpsse_template import MpsseInts
+from playtag.cables.ftdi.mpsse_jtag_commands import mpsse_jtag_commands
+from playtag.cables.null import Jtagger as NullCable
+from playtag.svf.parser import ParseSVF
+from playtag.bsdl.parser import FileParser
+from playtag.bsdl.lookup import PartInfo
+from playtag.gdb.transport import lowlevel, calcsum
+
+class SuiteDefaults(object):
+    SAVE = None
+    COMPARE = None
+    THRESHOLD = 10
+    REPEAT = 3
+    MIN_TIME = 200
+    LIST = False
+
+benchmarks = []
+
+def benchmark(func):
+    ''' Add a benchmark to the suite.  The function does any
+        setup, and returns the function to time.
+    '''
+    benchmarks.append((func.__name__, func))
+    return func
+
+def nullcable(style, converter='ints'):
+    config = UserConfig()
+    config.CABLE_NAME = style
+    config.TEMPLATE_CONVERTER = converter
+    config.TEMPLATE_CACHE = None
+    return NullCable(config)
+
+def busdriver(cable):
+    ''' Make a LEON3 AHB bus driver for a single-device
+        chain without doing chain discovery.
+    '''
+    driver = BusDriver.__new__(BusDriver)
+    driver.ilength, driver.cmdi, driver.datai = 6, 2, 3
+    driver.bypass_info = None
+    driver.jtagrw = cable
+    return driver
+
+burst = False, BusDriver.max_bytes / 4, 4     # The key for a 16 KB read
+
+def burst_tdi(write):
+    length = BusDriver.max_bytes / 4
+    addr = range(0, length * 4, BusDriver.addr_align)
+    return (addr, range(length)) if write else (addr,)
+
+#
+# Templates
+#
+
+@benchmark
+def template_build():
+    ''' Build the JtagTemplate for a 16 KB LEON3 AHB read.
+    '''
+    bus = busdriver(nullcable('jtag'))
+    def func():
+        bus.clear()
+        bus[burst]
+    return func
+
+def compile_burst(style):
+    cable = nullcable(style)
+    template = busdriver(cable)[burst].protocol_optimize()
+    return lambda: cable.make_template(template)
+
+@benchmark
+def template_compile_jtag():
+    ''' Compile a 16 KB read for a JTAG style cable.
+    '''
+    return compile_burst('jtag')
+
+@benchmark
+def template_compile_mpsse():
+    ''' Compile a 16 KB read for an MPSSE cable.
+    '''
+    return compile_burst('mpsse')
+
+@benchmark
+def mpsse_commands():
+    ''' Insert the MPSSE commands into the strings for
+        a 16 KB read (the customize stage of compiling).
+    '''
+    calls = []
+    class Capture(MpsseInts):
+        def customize_template(self):
+            calls.append((self.tms_string, self.tdi_xstring, self.tdo_xstring, self.context))
+            MpsseInts.customize_template(self)
+    cable = nullcable('mpsse')
+    Capture.compile(busdriver(cable)[burst].protocol_optimize())
+    def func():
+        for args in calls:
+            mpsse_jtag_commands(*args)
+    return func
+
+@benchmark
+def mpsse_commands_flat():
+    ''' Insert the MPSSE commands into the strings for a
+        16 KB read with its loop expanded.
+    '''
+    calls = []
+    class Capture(MpsseInts):
+        def customize_template(self):
+            calls.append((self.tms_string, self.tdi_xstring, self.tdo_xstring, self.context))
+    template = busdriver(nullcable('mpsse'))[burst].protocol_optimize()
+    template.loops = []
+    Capture.compile(template)
+    args, = calls
+    return lambda: mpsse_jtag_commands(*args)
+
+def apply_burst(style, write):
+    bus = busdriver(nullcable(style))
+    cmd = bus[True, burst[1], 4] if write else bus[burst]
+    tdi = burst_tdi(write)
+    def func():
+        tdo = cmd(*tdi)
+        if tdo is not None:
+            list(tdo)
+    return func
+
+@benchmark
+def apply_read_jtag():
+    ''' Read 16 KB from a LEON3 on a JTAG style cable.
+    '''
+    return apply_burst('jtag', False)
+
+@benchmark
+def apply_write_jtag():
+    ''' Write 16 KB to a LEON3 on a JTAG style cable.
+    '''
+    return apply_burst('jtag', True)
+
+@benchmark
+def apply_read_mpsse():
+    ''' Read 16 KB from a LEON3 on an MPSSE cable.
+    '''
+    return apply_burst('mpsse', False)
+
+@benchmark
+def apply_single():
+    ''' 256 single word reads from a LEON3.
+    '''
+    cmd = busdriver(nullcable('jtag'))[False, 1, 4]
+    def func():
+        for addr in xrange(0, 256 * 64, 64):
+            list(cmd([addr]))
+    return func
+
+#
+# File parsers and part lookup
+#
+
+def tempfile_with(suffix, data):
+    ''' Write data to a temporary file that is removed at exit.
+    '''
+    tempdir = tempfile.mkdtemp()
+    cleanup.append(tempdir)
+    fname = os.path.join(tempdir, 'bench' + suffix)
+    f = open(fname, 'wb')
+    f.write(data)
+    f.close()
+    return fname
+
+cleanup = []
+
+def svf_data(rand, numshifts=2000, streambits=1 << 18):
+    ''' Make an SVF file with a lot of short shifts,
+        and one long one (like a bitstream).
+    '''
+    lines = ['// Generated for benchmarking', 'TRST OFF;', 'ENDIR IDLE;', 'ENDDR IDLE;',
+             'STATE RESET;', 'STATE IDLE;', 'FREQUENCY 1.00E+06 HZ;',
+             'HIR 0;', 'TIR 0;', 'HDR 0;', 'TDR 0;']
+    for i in range(numshifts):
+        lines.append('SIR 6 TDI (%02x) SMASK (3f);' % rand.getrandbits(6))
+        lines.append('SDR 32 TDI (%08x) SMASK (ffffffff) TDO (%08x) MASK (0fffffff);' %
+                     (rand.getrandbits(32), rand.getrandbits(32)))
+        if not i % 16:
+            lines.append('RUNTEST 12 TCK;')
+    data = '%0*x' % (streambits / 4, rand.getrandbits(streambits))
+    lines.append('SDR %d TDI (' % streambits)
+    lines.extend(data[x:x+64] for x in range(0, len(data), 64))
+    lines.append(') SMASK (%s);' % ('f' * (streambits / 4)))
+    lines.append('RUNTEST 100 TCK ENDSTATE IDLE;')
+    return '\n'.join(lines) + '\n'
+
+@benchmark
+def svf_parse():
+    ''' Parse an SVF file with 4000 short shifts and a 256 Kbit one.
+    '''
+    fname = tempfile_with('.svf', svf_data(random.Random(1)))
+    return lambda: list(ParseSVF().parse(fname))
+
+def bsdl_data(numpins=600):
+    ''' Make a BSDL file for a part with numpins I/O pins,
+        with a boundary cell for each.
+    '''
+    pins = ['IO_%d' % x for x in range(numpins)]
+    lines = ['-- Generated for benchmarking', 'entity BENCH is',
+             '  generic (PHYSICAL_PIN_MAP : string := "PKG");',
+             '  port (TCK, TMS, TDI: in bit; TDO: out bit;',
+             '        %s: inout bit);' % ', '.join(pins),
+             '  use STD_1149_1_2001.all;',
+             '  attribute COMPONENT_CONFORMANCE of BENCH : entity is "STD_1149_1_2001";',
+             '  attribute PIN_MAP of BENCH : entity is PHYSICAL_PIN_MAP;',
+             '  constant PKG: PIN_MAP_STRING :=']
+    lines.extend('    "%s:%d," &' % (x, i) for (i, x) in enumerate(pins))
+    lines.append('    "TCK:T1, TMS:T2, TDI:T3, TDO:T4";')
+    lines.extend(['  attribute TAP_SCAN_CLOCK of TCK : signal is (1.0e7, BOTH);',
+                  '  attribute INSTRUCTION_LENGTH of BENCH : entity is 6;',
+                  '  attribute INSTRUCTION_OPCODE of BENCH : entity is',
+                  '    "EXTEST (000000)," &', '    "IDCODE (001001)," &', '    "BYPASS (111111)";',
+                  '  attribute INSTRUCTION_CAPTURE of BENCH : entity is "XXXX01";',
+                  '  attribute IDCODE_REGISTER of BENCH : entity is',
+                  '    "0001" & "0001110000100010" & "00001001001" & "1";',
+                  '  attribute BOUNDARY_LENGTH of BENCH : entity is %d;' % (3 * numpins),
+                  '  attribute BOUNDARY_REGISTER of BENCH : entity is'])
+    cells = []
+    for i, pin in reversed(list(enumerate(pins))):
+        cell = 3 * i
+        cells.append('%d (BC_1, *, control, 1)' % (cell + 2))
+        cells.append('%d (BC_1, %s, output3, X, %d, 1, Z)' % (cell + 1, pin, cell + 2))
+        cells.append('%d (BC_1, %s, input, X)' % (cell, pin))
+    lines.append(' &\n'.join('    "%s,"' % x for x in cells)[:-2] + '";')
+    lines.append('end BENCH;')
+    return '\n'.join(lines) + '\n'
+
+@benchmark
+def bsdl_parse():
+    ''' Parse a BSDL file for a 600 pin part.
+    '''
+    fname = tempfile_with('.bsd', bsdl_data())
+    return lambda: FileParser(fname)
+
+def known_idcodes():
+    ''' Return every idcode in the part database, with
+        the x's in the idcodes expanded.
+    '''
+    PartInfo.loadcaches()
+    known = set(PartInfo.partcache)
+    for mask, entries in PartInfo.maskcache.iteritems():
+        xbits = ~mask & 0xFFFFFFFF
+        for value in entries:
+            subset = xbits
+            while 1:
+                known.add(value | subset)
+                if not subset:
+                    break
+                subset = (subset - 1) & xbits
+    return sorted(known)
+
+@benchmark
+def partinfo_lookup():
+    ''' Look up 1000 IDCODEs (half of them known parts),
+        with their possible IR capture values.
+    '''
+    rand = random.Random(1)
+    known = known_idcodes()
+    idcodes = [rand.choice(known) if x & 1 else rand.getrandbits(32) | 1 for x in range(1000)]
+    def func():
+        for idcode in idcodes:
+            PartInfo(idcode).possible_ir
+    return func
+
+#
+# Bus32
+#
+
+class MemoryDriver(object):
+    ''' A Bus32 driver for a LEON3-like bus backed by a dictionary.
+    '''
+    big_endian = True
+    addr_align = BusDriver.addr_align
+    max_bytes = BusDriver.max_bytes
+
+    def __init__(self):
+        self.words = {}
+
+    def readsingle(self, addr, size):
+        shift = 8 * (size + (addr & 3))
+        mask = (1 << (8 * size)) - 1
+        yield ((self.words.get(addr & ~3, 0) << shift) >> 32) & mask
+
+    def writesingle(self, addr, size, value):
+        shift = 8 * (4 - size - (addr & 3))
+        mask = ((1 << (8 * size)) - 1) << shift
+        addr &= ~3
+        self.words[addr] = (self.words.get(addr, 0) & ~mask) | ((value << shift) & mask)
+
+    def readmultiple(self, addr, length):
+        get = self.words.get
+        return [get(x, 0) for x in xrange(addr, addr + 4 * length, 4)]
+
+    def writemultiple(self, addr, data, offset, length):
+        if length:
+            self.words.update(itertools.izip(xrange(addr, addr + 4 * length, 4),
+                                             itertools.islice(data, offset, offset + length)))
+
+@benchmark
+def bus32_chunks():
+    ''' Split 1000 random word accesses into driver chunks.
+    '''
+    bus = Bus32(MemoryDriver())
+    rand = random.Random(1)
+    accesses = [(rand.randrange(0, 1 << 20) & ~3, rand.randint(1, 20000)) for x in range(1000)]
+    def func():
+        for addr, count in accesses:
+            for x in bus._chunkinfo(addr, count):
+                pass
+    return func
+
+@benchmark
+def bus32_remap():
+    ''' Misaligned byte, halfword and string reads and
+        writes of about 4 KB each.
+    '''
+    bus = Bus32(MemoryDriver())
+    data = [x & 255 for x in range(4099)]
+    text = ''.join('%02x' % x for x in data)
+    def func():
+        bus.writebyte(0x1001, data)
+        bus.readbyte(0x1003, len(data))
+        bus.writehalf(0x2002, data[:2049])
+        bus.readhalf(0x2002, 2049)
+        bus.writestring(0x3003, text)
+        bus.readstring(0x3001, len(data))
+    return func
+
+#
+# GDB remote protocol
+#
+
+class EchoProcessor(object):
+    ''' A command processor that answers every packet with OK.
+    '''
+    maxread = 10000
+
+    def __call__(self, data):
+        return 'OK'
+
+    def disconnect(self):
+        pass
+
+@benchmark
+def gdb_framing():
+    ''' Frame, check and acknowledge 200 4 KB memory write
+        packets, read 2 KB at a time as from a socket.
+    '''
+    payload = ''.join('%02x' % (x & 255) for x in range(2048))
+    packets = []
+    for addr in range(0x40000000, 0x40000000 + 200 * 2048, 2048):
+        data = 'M%x,800:%s' % (addr, payload)
+        packets.append('$%s#%02x+' % (data, calcsum(data)))
+    stream = ''.join(packets)
+    chunks = [stream[x:x+2048] for x in range(0, len(stream), 2048)]
+    processor = EchoProcessor()
+    def func():
+        source = iter(chunks)
+        sent = []
+        lowlevel(lambda timeout=None: next(source, ''), lambda data, packetize: sent.append(data),
+                 processor)
+        assert len(sent) == 2 * len(packets), len(sent)
+    return func
+
+#
+# Startup
+#
+
+@benchmark
+def cold_start():
+    ''' Run chain discovery on the simulated cable in a new
+        python process (including the interpreter's startup).
+    '''
+    args = [sys.executable, os.path.join(root, 'tools/jtag/discover.py'), 'sim', 'xcf04s leon3']
+    devnull = open(os.devnull, 'wb')
+    def func():
+        subprocess.check_call(args, stdout=devnull)
+    return func
+
+#
+# Running and comparing
+#
+
+def measure(func, repeat, mintime):
+    ''' Return the best time in seconds for one call
+        to func, after one untimed call.
+    '''
+    func()
+    best = None
+    for i in range(repeat):
+        calls = 0
+        start = now = time.time()
+        while now - start < mintime or not calls:
+            func()
+            calls += 1
+            now = time.time()
+        seconds = (now - start) / calls
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+def select(names):
+    ''' Return the benchmarks that match the names.
+    '''
+    if not names:
+        return benchmarks
+    selected = []
+    for name in names:
+        if name.endswith('*'):
+            match = [x for x in benchmarks if x[0].startswith(name[:-1])]
+        else:
+            match = [x for x in benchmarks if x[0] == name]
+        if not match:
+            raise SystemExit('Unknown benchmark %s' % repr(name))
+        selected.extend(x for x in match if x not in selected)
+    return selected
+
+def run(config, names):
+    ''' Run the benchmarks, printing each one, and
+        return the results.
+    '''
+    results = dict(python=platform.python_version(), platform=platform.platform(),
+                   time=time.strftime('%Y-%m-%d %H:%M:%S'), benchmarks={})
+    print
+    print '%-24s %12s' % ('benchmark', 'time (ms)')
+    print
+    for name, setup in select(names):
+        seconds = measure(setup(), config.REPEAT, config.MIN_TIME / 1000.0)
+        results['benchmarks'][name] = dict(seconds=seconds)
+        print '%-24s %12.3f' % (name, seconds * 1000)
+        sys.stdout.flush()
+    print
+    return results
+
+def compare(results, baseline, threshold):
+    ''' Print the change in each benchmark that is in both
+        sets of results, and return the names of the ones
+        that are more than threshold percent slower.
+    '''
+    old, new = baseline['benchmarks'], results['benchmarks']
+    regressions = []
+    print
+    print '%-24s %12s %12s %9s' % ('benchmark', 'before (ms)', 'after (ms)', 'change')
+    print
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name]['seconds'], new[name]['seconds']
+        change = 100.0 * (after - before) / before
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print '%-24s %12.3f %12.3f %8.1f%%%s' % (name, before * 1000, after * 1000, change, flag)
+    print
+    if regressions:
+        print '%d of %d benchmarks slower by more than %s%%' % (len(regressions),
+                    len(set(old) & set(new)), threshold)
+        print
+    return regressions
+
+def main(args):
+    config = UserConfig()
+    vars(config).update((x, y) for (x, y) in vars(SuiteDefaults).items() if x.isupper())
+    names, options = config.readargs(args)
+    if config.LIST:
+        for name, setup in benchmarks:
+            print '%-24s %s' % (name, ' '.join(setup.__doc__.split()))
+        return 0
+    baseline = None
+    if config.COMPARE:
+        f = open(config.COMPARE, 'rb')
+        baseline = json.load(f)
+        f.close()
+    try:
+        results = run(config, names)
+    finally:
+        for tempdir in cleanup:
+            shutil.rmtree(tempdir)
+    if config.SAVE:
+        f = open(config.SAVE, 'wb')
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.close()
+    if baseline is not None and compare(results, baseline, config.THRESHOLD):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+'''
+Compare host-side cost of applying templates with the string,
+integer and ctypes structure converters.
+
+No cable is required -- the real Digilent and FTDI Jtagger classes
+are used, but the USB library calls are replaced with functions that
+just accept the data (and return zeros for TDO), so only the template
+conversion and driver buffer formatting time is measured.  The templates
+are the same ones the LEON3 AHB driver uses for a 16 KB burst.
+
+Compile time is shown both without the template cache, and with a
+warm template cache (in a temporary directory).
+
+Then single word reads from scattered addresses are timed, both with
+one template call per address and with one apply_many() call, and the
+number of cable transfers is shown.
+
+usage: templates.py [<repeat count>]
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from collections import namedtuple
+from ctypes import c_ulonglong, c_uint32, byref
+
+root = os.path.join(os.path.dirname(__file__), '../..')
+sys.path.insert(0, root)
+
+from playtag.lib.userconfig import UserConfig
+from playtag.iotemplate.stringconvert import TemplateStrings
+from playtag.iotemplate.intconvert import TemplateInts
+from playtag.iotemplate.binconvert import BinTemplate
+from playtag.iotemplate.diskcache import TemplateCache
+from playtag.cables.ftdi.mpsse_template import MpsseTemplate, MpsseInts, MpsseBin
+from playtag.cables.ftdi import d2xx_data
+from playtag.cables.digilent import driver as digilent
+from playtag.leon3.jtag_ahb import BusDriver
+
+transfers = [0]
+
+def nullfunc(*args):
+    return 1
+
+def xferfunc(*args):
+    transfers[0] += 1
+    return 1
+
+def digilent_cable(converter):
+    ''' Return a Digilent Jtagger that uses the given converter,
+        with the Adept library calls stubbed out.
+    '''
+    for name in 'DmgrOpen DmgrClose DjtgEnable DjtgDisable'.split():
+        setattr(digilent, name, nullfunc)
+    digilent.DjtgPutTmsTdiBits = xferfunc
+    class Jtagger(converter.mix_me_in(), digilent.Jtagger):
+        pass
+    config = UserConfig()
+    config.CABLE_NAME = 'DCabUsb'
+    config.TEMPLATE_CACHE = None
+    return Jtagger(config)
+
+def ftdi_cable(converter, maxbits=2**22):
+    ''' Return an FTDI Jtagger that uses the given converter,
+        with the D2XX write and read calls stubbed out.
+    '''
+    class Jtagger(converter.mix_me_in(), d2xx_data.Jtagger):
+        pass
+    self = Jtagger.__new__(Jtagger)
+    size = (maxbits + 63) / 64
+    source = (size * 2 * c_ulonglong)()
+    dest = (size * c_ulonglong)()
+    count = c_uint32()
+    def write(ref, numbytes, countref):
+        transfers[0] += 1
+        count.value = numbytes
+    def read(ref, numbytes, countref):
+        count.value = numbytes
+    self.wparams = write, len(source) * 64, source, byref(source), count, byref(count), False
+    self.rparams = read, len(dest) * 64, dest, byref(dest)
+    return self
+
+cables = (
+    ('digilent strings', digilent_cable, TemplateStrings),
+    ('digilent ints', digilent_cable, TemplateInts),
+    ('digilent bin', digilent_cable, BinTemplate),
+    ('ftdi strings', ftdi_cable, MpsseTemplate),
+    ('ftdi ints', ftdi_cable, MpsseInts),
+    ('ftdi bin', ftdi_cable, MpsseBin),
+)
+
+def busdriver(cable):
+    ''' Make a LEON3 AHB bus driver for a single-device chain
+        without doing chain discovery.
+    '''
+    BypassInfo = namedtuple('BypassInfo', 'prev_ir prev_dr next_ir next_dr')
+    driver = BusDriver.__new__(BusDriver)
+    driver.ilength = 6
+    driver.cmdi = 2
+    driver.datai = 3
+    driver.bypass_info = BypassInfo('', '', '', '')
+    driver.jtagrw = cable
+    return driver
+
+def timeit(func, repeat):
+    start = time.time()
+    for i in xrange(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+def run(repeat=10):
+    length = BusDriver.max_bytes / 4
+    addr = range(0, length * 4, BusDriver.addr_align)
+    data = range(length)
+    cachedir = tempfile.mkdtemp()
+    print
+    print '%-18s %-6s %12s %12s %12s' % ('cable', 'op', 'compile (s)', 'cached (s)', 'apply (ms)')
+    print
+    try:
+        for name, makecable, converter in cables:
+            cable = makecable(converter)
+            bus = busdriver(cable)
+            for write in (False, True):
+                key = write, length, 4
+                tdi = (addr, data) if write else (addr,)
+                def compile():
+                    bus.clear()
+                    bus[key](*tdi)
+                def apply():
+                    result = bus[key](*tdi)
+                    if result is not None:
+                        list(result)
+                compiletime = timeit(compile, 1)
+                cable.template_cache = TemplateCache(cachedir, 2**30)
+                compile()
+                cable.template_cache = TemplateCache(cachedir, 2**30)
+                cachedtime = timeit(compile, 1)
+                cable.template_cache = None
+                applytime = timeit(apply, repeat)
+                print '%-18s %-6s %12.3f %12.3f %12.3f' % (name,
+                        write and 'write' or 'read', compiletime, cachedtime, applytime * 1000)
+    finally:
+        shutil.rmtree(cachedir)
+    print
+
+def run_scattered(repeat=10, numaddrs=256):
+    ''' Compare single word reads from scattered addresses,
+        one template call per address vs. one apply_many call.
+    '''
+    addrs = range(0, numaddrs * 64, 64)
+    print
+    print '%-18s %-8s %12s %12s' % ('cable', 'reads', 'apply (ms)', 'transfers')
+    print
+    for name, makecable, converter in cables:
+        bus = busdriver(makecable(converter))
+        cmd = bus[False, 1, 4]
+        def single():
+            for addr in addrs:
+                list(cmd([addr]))
+        def batched():
+            for tdo in cmd.apply_many([([addr],) for addr in addrs]):
+                list(tdo)
+        for how, func in (('single', single), ('batched', batched)):
+            func()
+            transfers[0] = 0
+            applytime = timeit(func, repeat)
+            print '%-18s %-8s %12.3f %12d' % (name, how, applytime * 1000, transfers[0] / repeat)
+    print
+
+if __name__ == '__main__':
+    run(*(int(x) for x in sys.argv[1:]))
+    run_scattered(*(int(x) for x in sys.argv[1:]))
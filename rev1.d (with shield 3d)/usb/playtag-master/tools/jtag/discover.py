@@ -13,6 +13,7 @@ sys.path.insert(0, root)
 
 from playtag.lib.userconfig import UserConfig
 from playtag.jtag.discover import Chain
+from playtag.iotemplate.diskcache import show_report
 
 config = UserConfig()
 config.readargs(parseargs=True)
@@ -62,3 +63,5 @@ chain = Chain(driver)
 
 if ismain:
     print chain
+
+show_report(driver, config)
@@ -2,7 +2,7 @@
 import ctypes
 from discover import driver
 from playtag.lib.transport import connection
-from playtag.iotemplate import IOTemplate, TDIVariable
+from playtag.iotemplate import IOTemplate, TDIVariable, BitRuns
 
 '''
 This program builds on the discover module.  After the cable
@@ -50,7 +50,7 @@ def getcmdinfo(data, constlen, tdivar=TDIVariable()):
     assert (numbits + 7) // 8 == numbytes, (numbits, numbytes)
 
     template = IOTemplate(driver)
-    template.tms = [((tmsbuf[i/8] >> (i % 8)) & 1) for i in range(numbits)]
+    template.tms = BitRuns(((tmsbuf[i/8] >> (i % 8)) & 1) for i in range(numbits))
     template.tdi = [(j, tdivar) for j in bitmap]
     template.tdo = [(i>0 and 64 or 0, j) for (i,j) in enumerate(bitmap)]
 
@@ -11,6 +11,7 @@ from playtag.lib.userconfig import UserConfig
 from playtag.gdb.transport import connection
 from playtag.leon3.jtag_ahb import LeonMem
 from playtag.leon3.gdbproc import CmdProcessor
+from playtag.iotemplate.diskcache import show_report
 
 config = UserConfig()
 args = config.loaddefault('leongdb.cfg')
@@ -42,6 +43,8 @@ except:
 if config.SHOW_CONFIG:
     print config.dump()
 
+show_report(driver, config)
+
 def serve_gdb():
     connection(processor, address=config.SOCKET_ADDRESS, logpackets=config.LOGPACKETS)
 